@@ -0,0 +1,6 @@
+"""
+效能基準測試
+
+每個模組都可以直接以 `python -m benchmarks.<module>` 執行，
+結果以 JSON 輸出，方便比較不同版本之間的差異。
+"""
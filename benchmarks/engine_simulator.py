@@ -0,0 +1,144 @@
+"""
+以本機模擬服務 (scripts/simulator.py) 量測 Power BI Engine 的吞吐量與並行行為：
+重新整理、匯出 (啟動/輪詢/下載) 與 SharePoint 上傳都走 HTTP，
+模擬服務的延遲、錯誤率與 429 節流可調整。
+
+用法:
+    python -m benchmarks.engine_simulator --programs 40 --concurrency 8 \
+        --latency api=0.02/0.2 --throttle export=2/4 --export-seconds 1/3 --output bench_sim.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from job_scheduler.engine_pool import BASE_DIR, EnginePool
+
+sys.path.insert(0, str(BASE_DIR / 'scripts'))
+from simulator import _parse_assignments, engine_settings, start_simulator  # noqa: E402
+
+
+def summarize(samples):
+    if not samples:
+        return {'runs': 0}
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean_s': round(statistics.mean(samples), 3),
+        'p50_s': round(ordered[len(ordered) // 2], 3),
+        'p95_s': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'max_s': round(ordered[-1], 3),
+    }
+
+
+def build_programs(count, workspaces, datasets, base_dir, server_url, rate_limits=None):
+    # 不帶 execution_id：基準測試的執行不在資料庫中，不需登記引擎行程
+    programs = []
+    for i in range(count):
+        programs.append(dict(
+            engine_settings(server_url),
+            workspace_id=f'ws-{i % workspaces}',
+            report_name=f'report-{i}',
+            dataset_id=f'dataset-{i % datasets}',
+            method='export',
+            output_name=f'report-{i}',
+            output_type='pdf',
+            sharepoint_site='contoso.sharepoint.com,bench',
+            sharepoint_path='Shared Documents/bench',
+            filelocation=os.path.join(base_dir, 'out'),
+            rate_limit_db=os.path.join(base_dir, 'rate_limits.sqlite3'),
+            rate_limits=rate_limits or {},
+            poll_interval=0.5,
+            upload_chunk_mb=1,
+        ))
+    return programs
+
+
+def run_benchmark(programs, concurrency):
+    pool = EnginePool(size=concurrency, prefork=concurrency, max_runs=0, max_rss_mb=0)
+    samples, errors = [], []
+    lock = threading.Lock()
+
+    def run_one(params):
+        started = time.perf_counter()
+        error = pool.run(params, sink=lambda line: None)
+        with lock:
+            samples.append(time.perf_counter() - started)
+            if error:
+                errors.append(error)
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(run_one, programs))
+    finally:
+        pool.close()
+    return samples, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Engine throughput against the local API simulator')
+    parser.add_argument('--programs', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--workspaces', type=int, default=2)
+    parser.add_argument('--datasets', type=int, default=4)
+    parser.add_argument('--latency', action='append', help='CLASS=SECONDS[/P95]，同 scripts/simulator.py')
+    parser.add_argument('--error-rate', action='append', help='CLASS=FRACTION')
+    parser.add_argument('--throttle', action='append', help='CLASS=RATE[/BURST]')
+    parser.add_argument('--throttle-rate', action='append', help='CLASS=FRACTION')
+    parser.add_argument('--export-seconds', default='1/3')
+    parser.add_argument('--refresh-seconds', default='1/2')
+    parser.add_argument('--export-size', type=int, default=2 * 1024 * 1024)
+    parser.add_argument('--rate-limits', type=json.loads, default=None,
+                        help='覆寫引擎端速率限制 (JSON，同 engine.rate_limits)；預設每個 dataset 每 10 秒只能重新整理一次')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    server = start_simulator(
+        latency=_parse_assignments(args.latency, '--latency'),
+        error_rate=_parse_assignments(args.error_rate, '--error-rate'),
+        throttle=_parse_assignments(args.throttle, '--throttle'),
+        throttle_rate=_parse_assignments(args.throttle_rate, '--throttle-rate'),
+        export_seconds=args.export_seconds,
+        refresh_seconds=args.refresh_seconds,
+        export_size=args.export_size,
+        seed=args.seed,
+    )
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench-sim-') as base_dir:
+            programs = build_programs(args.programs, args.workspaces, args.datasets, base_dir, server.base_url,
+                                      rate_limits=args.rate_limits)
+            samples, errors, elapsed = run_benchmark(programs, args.concurrency)
+        with server.state.lock:
+            simulator_stats = json.loads(json.dumps(server.state.snapshot()))
+    finally:
+        server.shutdown()
+
+    results = {
+        'benchmark': 'engine_simulator',
+        'python': sys.version.split()[0],
+        'programs': args.programs,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_per_min': round(len(samples) / elapsed * 60, 2) if elapsed else None,
+        'latency': summarize(samples),
+        'failed': len(errors),
+        'errors': sorted(set(error[:200] for error in errors))[:5],
+        'simulator': simulator_stats,
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
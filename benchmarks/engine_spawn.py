@@ -0,0 +1,101 @@
+"""
+比較 Power BI Engine 每次執行的延遲：
+- cold: 每次執行都啟動新的直譯器 (`python scripts/power_bi_engine.py --program ...`)
+- warm: 透過 EnginePool 的常駐工作行程執行
+
+用法:
+    python -m benchmarks.engine_spawn --runs 20 --output bench_engine_spawn.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from job_scheduler.engine_pool import BASE_DIR, ENGINE_SCRIPT, EnginePool
+
+SAMPLE_PROGRAM = {
+    'workspace_id': 'bench-workspace',
+    'report_name': 'bench-report',
+    'dataset_id': 'bench-dataset',
+    'method': 'export',
+    'output_name': 'bench',
+    'output_type': 'pdf',
+    'sharepoint_site': '',
+    'sharepoint_path': '',
+    'filelocation': '',
+    'refresh_seconds': 0,  # 只量測啟動成本，不模擬 dataset 重新整理
+}
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        'runs': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 2),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 2),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def bench_cold(program, runs):
+    samples = []
+    for i in range(runs):
+        params = dict(program, execution_id=f'bench-cold-{i}')
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(ENGINE_SCRIPT), '--program', json.dumps(params)],
+            cwd=str(BASE_DIR), capture_output=True, check=True
+        )
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def bench_warm(program, runs, workers):
+    pool = EnginePool(size=workers, prefork=workers, max_runs=0, max_rss_mb=0)
+    samples = []
+    try:
+        for i in range(runs):
+            # 不帶 execution_id：基準測試的執行不在資料庫中，不需登記引擎行程 (process_registry)
+            params = dict(program)
+            started = time.perf_counter()
+            error = pool.run(params, sink=lambda line: None)
+            samples.append(time.perf_counter() - started)
+            if error:
+                raise RuntimeError(error)
+    finally:
+        pool.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold spawn vs warm worker engine latency')
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--steps', type=int, default=1, help='engine steps per run')
+    parser.add_argument('--step-interval', type=float, default=0, help='seconds slept per engine step')
+    parser.add_argument('--output', help='write JSON results to this file')
+    args = parser.parse_args()
+
+    program = dict(SAMPLE_PROGRAM, steps=args.steps, step_interval=args.step_interval)
+    cold = summarize(bench_cold(program, args.runs))
+    warm = summarize(bench_warm(program, args.runs, args.workers))
+    results = {
+        'benchmark': 'engine_spawn',
+        'python': sys.version.split()[0],
+        'cold': cold,
+        'warm': warm,
+        'speedup_p50': round(cold['p50_ms'] / warm['p50_ms'], 2) if warm['p50_ms'] else None,
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,523 @@
+"""
+排程器端到端吞吐量：在暫存的 SQLite 資料庫建立大量 Program / JobScheduler，
+量測 init_scheduler 載入時間，再以虛擬時鐘依 cron 預測的觸發時間逐批呼叫 execute_job，
+由假引擎 (不啟動行程，只寫輸出與進度事件) 完成執行。
+
+輸出 (JSON):
+- init: init_scheduler 耗時
+- dispatch: 派發延遲 (execute_job 到引擎執行槽開始執行)、每秒完成的執行數
+- db_lock: 資料庫鎖定的重試次數、失敗次數與等待時間 (依呼叫位置，static/utils/db_utils.py)
+- memory: 每個執行中任務的 Python 配置量 (tracemalloc) 與 RSS 增量
+- writes: 各資料表的 INSERT/UPDATE/DELETE 數量、資料庫檔案成長、行程寫入位元組
+
+加上 --baseline 時與先前的輸出比較，任一指標退步超過 --tolerance 即以非零狀態結束。
+
+用法:
+    python -m benchmarks.scheduler_throughput --jobs 2000 --slots 8 --output bench_scheduler.json
+    python -m benchmarks.scheduler_throughput --jobs 2000 --baseline bench_scheduler.json --tolerance 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import time as dt_time, timedelta
+
+import django
+
+# 常見的排程組合：整點、每半小時、每 20 分鐘、每兩小時與每日固定時間
+CRON_MIX = [
+    ('0 * * * *', 4),
+    ('*/30 * * * *', 3),
+    ('15 * * * *', 2),
+    ('*/20 * * * *', 1),
+    ('45 */2 * * *', 1),
+    ('0 6 * * *', 1),
+]
+
+# (結果路徑, 越大越好)；與基準比較時使用
+REGRESSION_METRICS = [
+    (('dispatch', 'jobs_per_sec'), True),
+    (('dispatch', 'latency', 'p95_ms'), False),
+    (('init', 'seconds'), False),
+    (('memory', 'python_bytes_per_inflight'), False),
+    (('writes', 'statements_per_execution'), False),
+]
+
+
+def configure_django(base_dir, slots, direct_writes=False):
+    """在 django.setup() 之前將資料庫與記錄檔移到暫存目錄，並關閉自動啟動的排程器"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pbi_scheduler_project.settings')
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(base_dir, 'db.sqlite3')
+    settings.SCHEDULER_AUTOSTART = False
+    settings.SCHEDULER_CONFIG = dict(
+        settings.SCHEDULER_CONFIG,
+        **{
+            'engine.warm_workers': False,
+            'engine.max_slots': slots,
+            'engine.rate_limit_db': os.path.join(base_dir, 'rate_limits.sqlite3'),
+            'writer.enabled': not direct_writes,
+            # 虛擬時鐘下不需要等待其他行程的變更
+            'reconcile.interval': 3600,
+        }
+    )
+    settings.EXECUTION_LOG_STORE = dict(settings.EXECUTION_LOG_STORE, root=os.path.join(base_dir, 'executions'))
+    django.setup()
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+class VirtualClock:
+    """取代 django.utils.timezone.now：從指定的觸發時間開始，依實際經過的時間前進"""
+
+    def __init__(self):
+        self._base = None
+        self._started = 0.0
+
+    def set(self, moment):
+        self._base = moment
+        self._started = time.perf_counter()
+
+    def now(self):
+        return self._base + timedelta(seconds=time.perf_counter() - self._started)
+
+
+class WriteCounter:
+    """掛在每個資料庫連線上 (execute_wrappers)，依語句類型與資料表統計寫入語句"""
+
+    VERBS = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self):
+        self.statements = Counter()
+        self.tables = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        words = sql.split(None, 3) if sql else []
+        verb = words[0].upper() if words else ''
+        if verb in self.VERBS:
+            # INSERT INTO "t" / DELETE FROM "t" / UPDATE "t"
+            table = words[1] if verb == 'UPDATE' else (words[2] if len(words) > 2 else '')
+            table = table.strip('"')
+            with self._lock:
+                self.statements[verb] += 1
+                self.tables[f"{verb} {table}"] += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.tables.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.statements), dict(self.tables.most_common())
+
+
+class FakeEngine:
+    """取代 execute_powerbi_engine：寫幾行輸出與進度事件後休眠，依比例回傳失敗"""
+
+    def __init__(self, duration, failure_rate, lines, seed):
+        self.duration = duration
+        self.failure_rate = failure_rate
+        self.lines = lines
+        self.gate = None  # 設定時，每次執行在此等待 (量測同時執行中的記憶體)
+        self.entered = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, program, execution_id, sink, on_event=None, extra_params=None):
+        with self._lock:
+            self.entered += 1
+            failed = self._random.random() < self.failure_rate
+        extra_params = extra_params or {}
+        on_event = on_event or (lambda event: None)
+        for i in range(self.lines):
+            sink(f"[{execution_id}] {program.report_name} step {i + 1}/{self.lines}")
+            if i % max(1, self.lines // 4) == 0:
+                on_event({'type': 'progress', 'percent': round(100.0 * i / self.lines, 1), 'message': f'step {i + 1}'})
+        if extra_params.get('refresh_dataset'):
+            on_event({'type': 'refresh', 'status': 'failed' if failed else 'completed'})
+        if self.gate is not None:
+            self.gate.wait()
+        elif self.duration:
+            time.sleep(self.duration)
+        return 'simulated engine failure' if failed else None
+
+
+def read_rss_bytes():
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def read_io_write_bytes():
+    try:
+        with open('/proc/self/io', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('write_bytes:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def database_bytes(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal', '-journal')
+               if os.path.exists(path + suffix))
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def create_jobs(count, workspaces, datasets, deadline_ratio, seed):
+    """以 bulk_create 建立 Program / JobScheduler / JobStatus (不觸發 JobChange 信號)"""
+    from django.utils import timezone
+    from job_scheduler.models import JobScheduler, JobStatus
+    from job_scheduler.triggers import next_fire_time
+    from program.models import Program
+
+    rng = random.Random(seed)
+    expressions = [expression for expression, weight in CRON_MIX for _ in range(weight)]
+    programs = Program.objects.bulk_create([
+        Program(
+            program_name=f'bench-program-{i}',
+            workspace_id=f'ws-{i % workspaces}',
+            report_name=f'report-{i}',
+            dataset_id=f'dataset-{i % datasets}',
+            method='export',
+            output_name=f'report-{i}',
+            output_type='pdf',
+            sharepoint_site='',
+            sharepoint_path='',
+            filelocation='',
+        ) for i in range(count)
+    ], batch_size=500)
+
+    now = timezone.now()
+    jobs = []
+    for i, program in enumerate(programs):
+        expression = rng.choice(expressions)
+        jobs.append(JobScheduler(
+            job_name=f'bench-job-{i}',
+            program=program,
+            cron_expression=expression,
+            priority=rng.choice((0, 0, 0, 5, 10)),
+            deadline_time=dt_time(7, 0) if rng.random() < deadline_ratio else None,
+            next_run_time=next_fire_time(expression, now=now),
+        ))
+    jobs = JobScheduler.objects.bulk_create(jobs, batch_size=500)
+    JobStatus.objects.bulk_create(
+        [JobStatus(job_id=job.job_id, next_fire_time=job.next_run_time, version=1) for job in jobs],
+        batch_size=500
+    )
+    return jobs
+
+
+def bench_init():
+    from job_scheduler.scheduler import init_scheduler
+
+    started = time.perf_counter()
+    scheduler = init_scheduler()
+    elapsed = time.perf_counter() - started
+    scheduled = len(scheduler.get_jobs())
+    scheduler.reconciler.stop()
+    scheduler.shutdown(wait=True)
+    return {'seconds': round(elapsed, 3), 'scheduled_jobs': scheduled}
+
+
+def wait_idle(executor, poll=0.005):
+    """等待執行槽清空，並等待背景寫入提交"""
+    from job_scheduler.db_writer import get_db_writer
+
+    while True:
+        stats = executor.stats()
+        if not stats['running'] and not stats['pending']:
+            break
+        time.sleep(poll)
+    get_db_writer().flush()
+
+
+def bench_dispatch(jobs, clock, start, hours, max_fires):
+    """依預測的觸發時間分批派發；每批在虛擬時鐘設定為觸發時間後送出，等全部結束再進入下一批"""
+    from job_scheduler import scheduler as sch
+    from job_scheduler.executor import get_engine_executor
+    from job_scheduler.triggers import forecast_fire_times
+
+    forecast = forecast_fire_times(
+        [(job.job_id, job.cron_expression, 0) for job in jobs], start, start + timedelta(hours=hours)
+    )
+    groups = defaultdict(list)
+    for job_id, times in forecast.items():
+        for fire_time in times:
+            groups[fire_time].append(job_id)
+
+    executor = get_engine_executor()
+    submitted = {}
+    latencies = []
+    lock = threading.Lock()
+    original_run_job = sch.run_job
+
+    def timed_run_job(job_id, *args):
+        started = time.perf_counter()
+        with lock:
+            latencies.append(started - submitted.pop(job_id))
+        return original_run_job(job_id, *args)
+
+    fired = 0
+    submit_times = []
+    sch.run_job = timed_run_job
+    started = time.perf_counter()
+    try:
+        for fire_time in sorted(groups):
+            clock.set(fire_time)
+            for job_id in groups[fire_time]:
+                if max_fires and fired >= max_fires:
+                    break
+                with lock:
+                    submitted[job_id] = time.perf_counter()
+                sch.execute_job(job_id)
+                submit_times.append(time.perf_counter() - submitted.get(job_id, time.perf_counter()))
+                fired += 1
+            wait_idle(executor)
+            if max_fires and fired >= max_fires:
+                break
+    finally:
+        sch.run_job = original_run_job
+    elapsed = time.perf_counter() - started
+
+    return {
+        'fire_groups': len(groups),
+        'fired': fired,
+        'executed': len(latencies),
+        'skipped': fired - len(latencies),
+        'elapsed_s': round(elapsed, 3),
+        'jobs_per_sec': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'submit': summarize(submit_times),
+        'latency': summarize(latencies),
+    }
+
+
+def bench_memory(jobs, engine, clock, start, settle=0.5, timeout=60):
+    """讓假引擎停在執行中，直到執行槽 (受 workspace / dataset 上限限制) 全部佔滿，量測每個執行中任務的記憶體"""
+    from job_scheduler import scheduler as sch
+    from job_scheduler.executor import get_engine_executor
+
+    executor = get_engine_executor()
+    engine.gate = threading.Event()
+    engine.entered = 0
+    clock.set(start)
+
+    tracemalloc.start()
+    python_before = tracemalloc.get_traced_memory()[0]
+    rss_before = read_rss_bytes()
+    try:
+        for job in jobs[:executor.max_slots * 4]:
+            sch.execute_job(job.job_id)
+
+        # 進入假引擎的數量在 settle 秒內不再增加，視為已佔滿
+        deadline = time.monotonic() + timeout
+        last, last_change = -1, time.monotonic()
+        while time.monotonic() < deadline:
+            entered = engine.entered
+            if entered != last:
+                last, last_change = entered, time.monotonic()
+            elif time.monotonic() - last_change >= settle:
+                break
+            time.sleep(0.01)
+        inflight = engine.entered
+        python_delta = tracemalloc.get_traced_memory()[0] - python_before
+        rss_after = read_rss_bytes()
+    finally:
+        tracemalloc.stop()
+        engine.gate.set()
+        engine.gate = None
+    wait_idle(executor)
+
+    return {
+        'inflight': inflight,
+        'python_bytes_per_inflight': python_delta // inflight if inflight else None,
+        'rss_bytes_per_inflight': (
+            (rss_after - rss_before) // inflight if inflight and rss_before is not None else None
+        ),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """回傳退步超過 tolerance 的指標"""
+    regressions = []
+    for path, higher_is_better in REGRESSION_METRICS:
+        current, previous = results, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append({
+                'metric': '.'.join(path), 'baseline': previous, 'current': current, 'change': round(change, 3)
+            })
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end scheduler throughput with a fake engine')
+    parser.add_argument('--jobs', type=int, default=2000)
+    parser.add_argument('--workspaces', type=int, default=20)
+    parser.add_argument('--datasets', type=int, default=200)
+    parser.add_argument('--slots', type=int, default=8)
+    parser.add_argument('--hours', type=float, default=1, help='虛擬時鐘涵蓋的時數')
+    parser.add_argument('--max-fires', type=int, default=0, help='最多派發幾次 (0 表示不限)')
+    parser.add_argument('--engine-ms', type=float, default=5, help='假引擎每次執行的時間 (毫秒)')
+    parser.add_argument('--engine-lines', type=int, default=20)
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--deadline-ratio', type=float, default=0.2, help='設定完成期限的任務比例')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--baseline', help='compare with an earlier --output file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允許的退步比例')
+    parser.add_argument('--direct-writes', action='store_true',
+                        help='停用寫入執行緒 (writer.enabled = False)，各執行緒直接寫入')
+    parser.add_argument('--keep', action='store_true', help='保留暫存目錄 (資料庫與記錄檔)')
+    args = parser.parse_args()
+
+    base_dir = tempfile.mkdtemp(prefix='bench-scheduler-')
+    try:
+        configure_django(base_dir, args.slots, args.direct_writes)
+        # 每次執行都會記錄 INFO，量測時只保留警告以上
+        logging.disable(logging.INFO)
+
+        from django.core.management import call_command
+        from django.db import connection
+        from django.db.backends.signals import connection_created
+        from django.utils import timezone
+        from job_scheduler import scheduler as sch
+        from job_scheduler.db_writer import get_db_writer
+        from job_scheduler.executor import get_engine_executor
+        from job_scheduler.models import JobExecution
+        from static.utils.db_utils import get_lock_retry_stats, reset_lock_retry_stats
+
+        # 寫入執行緒在 init_scheduler 時就會建立連線，統計需在那之前掛上
+        writes = WriteCounter()
+        connection_created.connect(writes.install)
+        writes.install(connection)
+
+        call_command('migrate', verbosity=0, interactive=False)
+        jobs = create_jobs(args.jobs, args.workspaces, args.datasets, args.deadline_ratio, args.seed)
+        init = bench_init()
+
+        clock = VirtualClock()
+        real_now = timezone.now
+        start = (real_now() + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        engine = FakeEngine(args.engine_ms / 1000, args.failure_rate, args.engine_lines, args.seed)
+        db_path = os.path.join(base_dir, 'db.sqlite3')
+        db_before = database_bytes(db_path)
+        io_before = read_io_write_bytes()
+        original_engine = sch.execute_powerbi_engine
+        timezone.now = clock.now
+        sch.execute_powerbi_engine = engine
+        reset_lock_retry_stats()
+        writes.reset()
+        try:
+            dispatch = bench_dispatch(jobs, clock, start, args.hours, args.max_fires)
+            statements, tables = writes.snapshot()
+            outcomes = dict(Counter(JobExecution.objects.values_list('status', flat=True)))
+            io_after = read_io_write_bytes()
+            db_after = database_bytes(db_path)
+            lock_retries = get_lock_retry_stats()
+            memory = bench_memory(jobs, engine, clock, start + timedelta(hours=args.hours))
+        finally:
+            timezone.now = real_now
+            sch.execute_powerbi_engine = original_engine
+            connection_created.disconnect(writes.install)
+            get_engine_executor().shutdown(wait=True)
+            writer_stats = get_db_writer().stats()
+            get_db_writer().close()
+
+        executions = dispatch['executed'] or 1
+        results = {
+            'benchmark': 'scheduler_throughput',
+            'python': sys.version.split()[0],
+            'revision': git_revision(),
+            'params': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'baseline', 'keep')},
+            'init': init,
+            'dispatch': dispatch,
+            'outcomes': outcomes,
+            'db_lock': {
+                'retries': sum(counts['retries'] for counts in lock_retries.values()),
+                'failures': sum(counts['failures'] for counts in lock_retries.values()),
+                'wait_seconds': round(sum(counts['wait_seconds'] for counts in lock_retries.values()), 3),
+                'by_call_site': lock_retries,
+            },
+            'memory': memory,
+            'writer': writer_stats,
+            'writes': {
+                'statements': statements,
+                'by_table': tables,
+                'statements_per_execution': round(sum(statements.values()) / executions, 2),
+                'db_growth_bytes': db_after - db_before,
+                'process_write_bytes': io_after - io_before if io_before is not None else None,
+            },
+        }
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        results['regressions'] = regressions
+        exit_code = 1 if regressions else 0
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+SQLite 讀寫並行：比較 rollback journal (SQLITE_PROFILE = None，舊的設定) 與 settings.SQLITE_PROFILE (WAL 等)。
+
+在暫存資料庫建立任務與執行記錄後，同時啟動：
+- reader 行程：模擬儀表板，反覆讀取任務狀態摘要與最近的執行記錄
+- writer 行程：模擬排程器，建立執行記錄並在短交易中更新狀態與 JobStatus
+兩種設定使用相同的初始資料庫 (複製) 與相同的負載。
+
+輸出 (JSON)：各設定的讀取與寫入延遲、每秒次數、鎖定錯誤數，以及 tuned 相對 legacy 的比例。
+
+用法:
+    python -m benchmarks.sqlite_concurrency --readers 4 --writers 2 --seconds 10 --output bench_sqlite.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import django
+
+PROFILES = ('legacy', 'tuned')
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_django(db_path):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pbi_scheduler_project.settings')
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = db_path
+    settings.SCHEDULER_AUTOSTART = False
+    django.setup()
+
+
+def use_database(db_path, profile):
+    """fork 後切換到指定的資料庫檔與設定 (新連線才會套用)"""
+    from django.conf import settings
+    from django.db import connections
+
+    connections.close_all()
+    settings.DATABASES['default']['NAME'] = db_path
+    connections['default'].settings_dict['NAME'] = db_path
+    if profile == 'legacy':
+        settings.SQLITE_PROFILE = None
+
+
+def create_data(jobs, executions_per_job, seed):
+    from django.utils import timezone
+    from job_scheduler.models import JobExecution, JobScheduler, JobStatus
+    from program.models import Program
+
+    rng = random.Random(seed)
+    programs = Program.objects.bulk_create([
+        Program(
+            program_name=f'bench-program-{i}', workspace_id=f'ws-{i % 10}', report_name='r',
+            dataset_id=f'ds-{i}', method='export', output_name='o', output_type='pdf',
+            sharepoint_site='', sharepoint_path='', filelocation='',
+        ) for i in range(jobs)
+    ])
+    job_rows = JobScheduler.objects.bulk_create([
+        JobScheduler(job_name=f'bench-job-{i}', program=program, cron_expression=f'{i % 60} * * * *')
+        for i, program in enumerate(programs)
+    ])
+    JobStatus.objects.bulk_create([JobStatus(job_id=job.job_id, version=1) for job in job_rows])
+    now = timezone.now()
+    JobExecution.objects.bulk_create([
+        JobExecution(
+            job=job, status=rng.choice(['completed', 'completed', 'completed', 'failed']),
+            end_time=now, output='x' * rng.randint(100, 2000),
+        )
+        for job in job_rows for _ in range(executions_per_job)
+    ], batch_size=500)
+    return [job.job_id for job in job_rows]
+
+
+def reader(db_path, profile, job_ids, stop_at, seed, queue):
+    """儀表板的讀取：任務列表的狀態摘要與單一任務的最近執行記錄"""
+    use_database(db_path, profile)
+    from django.db.utils import OperationalError
+    from job_scheduler.models import JobExecution, JobStatus
+
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.time() < stop_at:
+        started = time.perf_counter()
+        try:
+            list(JobStatus.objects.order_by('job_id').values('job_id', 'last_status', 'version')[:100])
+            list(
+                JobExecution.objects.filter(job_id=rng.choice(job_ids)).order_by('-start_time')
+                .values('execution_id', 'status', 'start_time', 'end_time')[:20]
+            )
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    queue.put(('read', latencies, errors))
+
+
+def writer(db_path, profile, job_ids, stop_at, seed, queue):
+    """排程器的寫入：建立執行記錄後更新狀態與 JobStatus，每次一個短交易"""
+    use_database(db_path, profile)
+    from django.db import transaction
+    from django.db.models import F
+    from django.db.utils import OperationalError
+    from django.utils import timezone
+    from job_scheduler.models import JobExecution, JobStatus
+
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.time() < stop_at:
+        job_id = rng.choice(job_ids)
+        started = time.perf_counter()
+        try:
+            with transaction.atomic():
+                execution = JobExecution.objects.create(job_id=job_id, status='running')
+                JobStatus.objects.filter(job_id=job_id).update(last_status='running', version=F('version') + 1)
+            with transaction.atomic():
+                execution.status = 'completed'
+                execution.end_time = timezone.now()
+                execution.output = 'x' * rng.randint(100, 2000)
+                execution.save(update_fields=['status', 'end_time', 'output'])
+                JobStatus.objects.filter(job_id=job_id).update(last_status='completed', version=F('version') + 1)
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - started)
+    queue.put(('write', latencies, errors))
+
+
+def bench_profile(db_path, profile, job_ids, readers, writers, seconds, seed):
+    use_database(db_path, profile)
+    from django.db import connection
+    from static.utils.sqlite_profile import apply_journal_mode
+    if profile == 'legacy':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode = DELETE')
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        connection.close()
+    else:
+        # 與 daemon / web 啟動時相同，切換為 SQLITE_PROFILE 的 journal_mode
+        journal_mode = apply_journal_mode(close=True)
+
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    stop_at = time.time() + 1 + seconds
+    processes = [
+        context.Process(target=target, args=(db_path, profile, job_ids, stop_at, seed + i, queue))
+        for i, target in enumerate([reader] * readers + [writer] * writers)
+    ]
+    for process in processes:
+        process.start()
+    results = [queue.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    measured = {}
+    for kind in ('read', 'write'):
+        latencies = [value for result_kind, samples, _ in results if result_kind == kind for value in samples]
+        measured[kind] = dict(
+            summarize(latencies),
+            per_sec=round(len(latencies) / seconds, 1),
+            lock_errors=sum(errors for result_kind, _, errors in results if result_kind == kind),
+        )
+    measured['journal_mode'] = journal_mode
+    measured['db_bytes'] = sum(
+        os.path.getsize(db_path + suffix) for suffix in ('', '-wal') if os.path.exists(db_path + suffix)
+    )
+    return measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite read/write concurrency before and after the pragma profile')
+    parser.add_argument('--jobs', type=int, default=200)
+    parser.add_argument('--executions', type=int, default=50, help='每個任務的初始執行記錄數')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--keep', action='store_true', help='保留暫存目錄 (資料庫)')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        parser.error('this benchmark needs os.fork')
+
+    base_dir = tempfile.mkdtemp(prefix='bench-sqlite-')
+    try:
+        seed_path = os.path.join(base_dir, 'seed.sqlite3')
+        configure_django(seed_path)
+        from django.conf import settings
+        from django.core.management import call_command
+        from django.db import connection
+
+        # 初始資料庫以 rollback journal 建立，複製後再各自切換
+        tuned_profile = getattr(settings, 'SQLITE_PROFILE', None)
+        settings.SQLITE_PROFILE = None
+        call_command('migrate', verbosity=0, interactive=False)
+        job_ids = create_data(args.jobs, args.executions, args.seed)
+        connection.close()
+
+        profiles = {}
+        for profile in PROFILES:
+            db_path = os.path.join(base_dir, f'{profile}.sqlite3')
+            shutil.copyfile(seed_path, db_path)
+            settings.SQLITE_PROFILE = None if profile == 'legacy' else tuned_profile
+            profiles[profile] = bench_profile(
+                db_path, profile, job_ids, args.readers, args.writers, args.seconds, args.seed
+            )
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    legacy, tuned = profiles['legacy'], profiles['tuned']
+    comparison = {}
+    for kind in ('read', 'write'):
+        if legacy[kind].get('per_sec'):
+            comparison[f'{kind}_throughput_ratio'] = round(tuned[kind]['per_sec'] / legacy[kind]['per_sec'], 2)
+        if legacy[kind].get('p95_ms') and tuned[kind].get('p95_ms'):
+            comparison[f'{kind}_p95_ratio'] = round(tuned[kind]['p95_ms'] / legacy[kind]['p95_ms'], 2)
+
+    results = {
+        'benchmark': 'sqlite_concurrency',
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'revision': git_revision(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'keep')},
+        'profiles': profiles,
+        'comparison': comparison,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
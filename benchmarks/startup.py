@@ -0,0 +1,387 @@
+"""
+Django 啟動成本：web 行程 (manage.py shell、測試、gunicorn worker) 不應載入排程器與引擎端的模組。
+每項量測都在新的行程中進行，資料庫使用暫存的 SQLite。
+
+輸出 (JSON):
+- imports: 載入 WSGI application 並處理各 app 的請求時各 app 與主要套件的匯入時間 (python -X importtime)
+  self_ms 為套件本身模組的時間；inclusive_ms 另外包含它帶入的其他套件
+- first_request: 各 app 在新行程中載入 WSGI application (pbi_scheduler_project.wsgi，與 gunicorn 相同) 的時間
+  與第一個請求的時間 (取 --runs 次的中位數)
+- scheduler_modules: 處理完各 app 的請求後已載入的排程器端模組 (應為空)
+- worker_boot: 模擬 gunicorn worker 從 fork 到完成第一個請求的時間
+    preload: 主行程先載入 WSGI application (gunicorn --preload)，worker fork 後直接處理請求
+    fork:    主行程只有直譯器，worker fork 後才載入 WSGI application (未加 --preload)
+
+任一項超過 BUDGETS (可用 --budget 名稱=毫秒 調整) 或 scheduler_modules 不為空時以非零狀態結束。
+
+用法:
+    python -m benchmarks.startup --output bench_startup.json
+    python -m benchmarks.startup --workers 4 --budget fork_boot_p95_ms=2000
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+APPS = ('core', 'accounts', 'program', 'job_scheduler', 'documents')
+# 另外列出的套件：專案設定與主要的第三方套件
+PACKAGES = APPS + ('pbi_scheduler_project', 'django', 'django_apscheduler', 'apscheduler')
+
+# 各 app 第一個請求使用的頁面 (不需要登入)
+APP_PAGES = {
+    'core': '/',
+    'accounts': '/accounts/user/',
+    'program': '/program/',
+    'job_scheduler': '/job_scheduler/',
+    'documents': '/documents/email_template/',
+}
+
+# 只有排程 daemon (manage.py run_scheduler) 需要的模組
+SCHEDULER_MODULES = (
+    'job_scheduler.scheduler',
+    'job_scheduler.daemon',
+    'job_scheduler.executor',
+    'job_scheduler.engine_pool',
+    'job_scheduler.leader',
+    'job_scheduler.jobstores',
+    'job_scheduler.reconciler',
+    'job_scheduler.refresh',
+    'job_scheduler.planner',
+    'job_scheduler.triggers',
+    'job_scheduler.ipc',
+    'scripts.power_bi_engine',
+)
+
+# 毫秒；worker 同時啟動，boot 的時間會隨 --workers 與 CPU 數變動
+BUDGETS = {
+    'app_load_ms': 1500,
+    'first_request_ms': 250,
+    'preload_boot_p95_ms': 500,
+    'fork_boot_p95_ms': 3000,
+}
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=BASE_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# 以下在子行程中執行
+
+def configure_django(base_dir):
+    """將資料庫與記錄檔移到暫存目錄；不呼叫 django.setup()，由呼叫端計時"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pbi_scheduler_project.settings')
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(base_dir, 'db.sqlite3')
+    settings.SCHEDULER_AUTOSTART = False
+    settings.SCHEDULER_CONFIG = dict(settings.SCHEDULER_CONFIG, **{'ipc.address': os.path.join(base_dir, 'ipc.sock')})
+    settings.EXECUTION_LOG_STORE = dict(settings.EXECUTION_LOG_STORE, root=os.path.join(base_dir, 'executions'))
+
+
+def wsgi_request(application, path):
+    """以 WSGI 介面送出 GET 請求，回傳狀態碼"""
+    from wsgiref.util import setup_testing_defaults
+
+    environ = {'PATH_INFO': path, 'REQUEST_METHOD': 'GET', 'SERVER_NAME': 'localhost'}
+    setup_testing_defaults(environ)
+    status = []
+    response = application(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        for _ in response:
+            pass
+    finally:
+        close = getattr(response, 'close', None)
+        if close:
+            close()
+    return int(status[0].split()[0])
+
+
+def load_application(base_dir):
+    configure_django(base_dir)
+    from importlib import import_module
+    return import_module('pbi_scheduler_project.wsgi').application
+
+
+def loaded_scheduler_modules():
+    return [name for name in SCHEDULER_MODULES if name in sys.modules]
+
+
+def child_migrate(base_dir):
+    import django
+    configure_django(base_dir)
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0, interactive=False)
+    return {}
+
+
+def child_request(base_dir, app):
+    """新行程中載入 WSGI application 與第一個請求"""
+    started = time.perf_counter()
+    application = load_application(base_dir)
+    loaded = time.perf_counter()
+    status = wsgi_request(application, APP_PAGES[app])
+    first_request_done = time.perf_counter()
+    # 同一個 URL 的第二個請求，作為不含載入成本的對照
+    wsgi_request(application, APP_PAGES[app])
+    return {
+        'status': status,
+        'app_load_ms': round((loaded - started) * 1000, 3),
+        'first_request_ms': round((first_request_done - loaded) * 1000, 3),
+        'second_request_ms': round((time.perf_counter() - first_request_done) * 1000, 3),
+        'scheduler_modules': loaded_scheduler_modules(),
+    }
+
+
+def child_imports(base_dir):
+    """在 python -X importtime 下執行：載入 WSGI application 並處理每個 app 的一個請求"""
+    application = load_application(base_dir)
+    for app in APPS:
+        wsgi_request(application, APP_PAGES[app])
+    return {'scheduler_modules': loaded_scheduler_modules()}
+
+
+def _fork_workers(count, boot):
+    """fork count 個 worker，各自執行 boot() 後回傳從 fork 到完成的秒數"""
+    pipes = []
+    for _ in range(count):
+        read_fd, write_fd = os.pipe()
+        forked_at = time.time()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                status = boot()
+                message = {'seconds': time.time() - forked_at, 'status': status}
+            except BaseException as e:
+                message = {'error': repr(e)}
+                code = 1
+            os.write(write_fd, json.dumps(message).encode('utf-8'))
+            os._exit(code)
+        os.close(write_fd)
+        pipes.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in pipes:
+        chunks = []
+        while True:
+            chunk = os.read(read_fd, 4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+        results.append(json.loads(b''.join(chunks) or b'{"error": "no result"}'))
+    return results
+
+
+def child_worker_boot(base_dir, mode, workers):
+    path = APP_PAGES['job_scheduler']
+    result = {}
+    if mode == 'preload':
+        started = time.perf_counter()
+        application = load_application(base_dir)
+        from django.db import connections
+        result['master_load_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        # 與 gunicorn 相同：fork 前不保留資料庫連線
+        connections.close_all()
+
+        def boot():
+            return wsgi_request(application, path)
+    else:
+        def boot():
+            return wsgi_request(load_application(base_dir), path)
+
+    workers_result = _fork_workers(int(workers), boot)
+    result['errors'] = [item['error'] for item in workers_result if 'error' in item]
+    result['statuses'] = sorted({item['status'] for item in workers_result if 'status' in item})
+    result['boot'] = summarize([item['seconds'] for item in workers_result if 'seconds' in item])
+    return result
+
+
+CHILDREN = {
+    'migrate': child_migrate,
+    'request': child_request,
+    'imports': child_imports,
+    'worker_boot': child_worker_boot,
+}
+
+
+def run_child(name, base_dir, *args, python_flags=()):
+    """在新的直譯器中執行子量測，回傳 (結果, stderr)"""
+    command = [sys.executable, *python_flags, '-m', 'benchmarks.startup', '--child', name, '--base-dir', base_dir]
+    command += [str(arg) for arg in args]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=BASE_DIR)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{name} failed:\n{completed.stderr[-4000:]}")
+    return json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+# 以下在主行程中執行
+
+def parse_importtime(text):
+    """
+    將 -X importtime 的輸出彙總到 PACKAGES
+    輸出依後序排列 (子模組在前)，反向走訪時可依縮排找到上層模組
+    """
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        # "import time:       339 |     179883 |   django.urls"：名稱前的縮排每層兩個空白
+        head, cumulative_us, name = line.split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((depth, name.strip(), int(head.split(':')[1]), int(cumulative_us)))
+
+    def package_of(module):
+        root = module.split('.')[0]
+        return root if root in PACKAGES else None
+
+    totals = {package: {'self_ms': 0.0, 'inclusive_ms': 0.0, 'modules': 0} for package in PACKAGES}
+    parents = []
+    for depth, name, self_us, cumulative_us in reversed(entries):
+        del parents[depth:]
+        parent = parents[-1] if parents else None
+        parents.append(name)
+        package = package_of(name)
+        if package is None:
+            continue
+        totals[package]['self_ms'] += self_us / 1000
+        totals[package]['modules'] += 1
+        # 由其他套件 (或最上層) 匯入時才計入，避免同一套件內重複計算
+        if parent is None or package_of(parent) != package:
+            totals[package]['inclusive_ms'] += cumulative_us / 1000
+
+    total_ms = sum(self_us for _, _, self_us, _ in entries) / 1000
+    return {
+        'total_ms': round(total_ms, 3),
+        'by_package': {
+            package: {key: round(value, 3) if isinstance(value, float) else value for key, value in values.items()}
+            for package, values in totals.items()
+        },
+    }
+
+
+def bench_first_request(base_dir, runs):
+    results = {}
+    leaked = set()
+    for app in APPS:
+        samples = [run_child('request', base_dir, app)[0] for _ in range(runs)]
+        for sample in samples:
+            leaked.update(sample['scheduler_modules'])
+        results[app] = {
+            'status': samples[0]['status'],
+            **{key: round(statistics.median(sample[key] for sample in samples), 3)
+               for key in ('app_load_ms', 'first_request_ms', 'second_request_ms')},
+        }
+    return results, sorted(leaked)
+
+
+def check_budgets(results, budgets):
+    """回傳超過預算的項目"""
+    first_request = results['first_request']
+    measured = {
+        'app_load_ms': max(item['app_load_ms'] for item in first_request.values()),
+        'first_request_ms': max(item['first_request_ms'] for item in first_request.values()),
+    }
+    for mode in ('preload', 'fork'):
+        boot = results['worker_boot'].get(mode, {}).get('boot', {})
+        if 'p95_ms' in boot:
+            measured[f'{mode}_boot_p95_ms'] = boot['p95_ms']
+
+    violations = [
+        {'budget': name, 'limit_ms': limit, 'measured_ms': measured[name]}
+        for name, limit in budgets.items()
+        if name in measured and measured[name] > limit
+    ]
+    if results['scheduler_modules']:
+        violations.append({'budget': 'scheduler_modules', 'loaded': results['scheduler_modules']})
+    return violations
+
+
+def parse_budget(value):
+    name, _, limit = value.partition('=')
+    if name not in BUDGETS or not limit:
+        raise argparse.ArgumentTypeError(f"expected one of {', '.join(BUDGETS)} as name=ms")
+    return name, float(limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Django cold-start and worker boot time')
+    parser.add_argument('--runs', type=int, default=3, help='每個 app 以新行程量測的次數')
+    parser.add_argument('--workers', type=int, default=4, help='模擬的 gunicorn worker 數')
+    parser.add_argument('--budget', type=parse_budget, action='append', default=[],
+                        help='override a budget, e.g. fork_boot_p95_ms=2000')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--keep', action='store_true', help='保留暫存目錄 (資料庫)')
+    parser.add_argument('--child', choices=CHILDREN, help=argparse.SUPPRESS)
+    parser.add_argument('--base-dir', help=argparse.SUPPRESS)
+    args, extra = parser.parse_known_args()
+
+    if args.child:
+        print(json.dumps(CHILDREN[args.child](args.base_dir, *extra)))
+        return
+
+    budgets = dict(BUDGETS, **dict(args.budget))
+    base_dir = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        run_child('migrate', base_dir)
+        imported, importtime = run_child('imports', base_dir, python_flags=('-X', 'importtime'))
+        first_request, leaked = bench_first_request(base_dir, args.runs)
+        worker_boot = {}
+        if hasattr(os, 'fork'):
+            for mode in ('preload', 'fork'):
+                worker_boot[mode] = run_child('worker_boot', base_dir, mode, args.workers)[0]
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    results = {
+        'benchmark': 'startup',
+        'python': sys.version.split()[0],
+        'revision': git_revision(),
+        'params': {'runs': args.runs, 'workers': args.workers},
+        'imports': parse_importtime(importtime),
+        'first_request': first_request,
+        'scheduler_modules': sorted(set(leaked) | set(imported['scheduler_modules'])),
+        'worker_boot': worker_boot,
+        'budgets': budgets,
+    }
+    results['violations'] = check_budgets(results, budgets)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(1 if results['violations'] else 0)
+
+
+if __name__ == '__main__':
+    main()
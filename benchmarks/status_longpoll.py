@@ -0,0 +1,270 @@
+"""
+任務狀態長輪詢：在同一個行程中以 ASGI application 開啟大量等待中的狀態 API 請求
+(?version=<目前版本>&wait=<秒>)，再由另一個行程更新 JobStatus.version。
+
+不需要 ASGI 伺服器：直接以 ASGI 的 scope / receive / send 呼叫 pbi_scheduler_project.asgi.application。
+
+輸出 (JSON)：
+- setup: 所有請求進入等待所需的時間
+- idle: 等待期間每秒的資料庫查詢數 (與等待的連線數無關，約為 1 / POLL_INTERVAL)、執行緒數與 RSS
+- wake: --changed-jobs 個任務的版本改變 (提交) 到這些任務的等待者回應的延遲，以及回應的版本是否為新版本
+  (--changed-jobs 0 時所有任務同時改變，所有等待者同時回應)
+
+用法:
+    python -m benchmarks.status_longpoll --clients 2000 --jobs 200 --output bench_longpoll.json
+    python -m benchmarks.status_longpoll --clients 2000 --jobs 200 --changed-jobs 0
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import django
+
+
+def summarize(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 3),
+        'p50_ms': round(ordered[len(ordered) // 2] * 1000, 3),
+        'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure_django(base_dir):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pbi_scheduler_project.settings')
+    from django.conf import settings
+
+    settings.DATABASES['default']['NAME'] = os.path.join(base_dir, 'db.sqlite3')
+    settings.SCHEDULER_AUTOSTART = False
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ['localhost']
+    settings.EXECUTION_LOG_STORE = dict(settings.EXECUTION_LOG_STORE, root=os.path.join(base_dir, 'executions'))
+    django.setup()
+
+
+def create_jobs(count):
+    from job_scheduler.models import JobScheduler, JobStatus
+    from program.models import Program
+
+    programs = Program.objects.bulk_create([
+        Program(
+            program_name=f'bench-program-{i}', workspace_id='ws', report_name='r', dataset_id=f'ds-{i}',
+            method='export', output_name='o', output_type='pdf', sharepoint_site='', sharepoint_path='',
+            filelocation='',
+        ) for i in range(count)
+    ])
+    jobs = JobScheduler.objects.bulk_create([
+        JobScheduler(job_name=f'bench-job-{i}', program=program, cron_expression='0 * * * *')
+        for i, program in enumerate(programs)
+    ])
+    JobStatus.objects.bulk_create([JobStatus(job_id=job.job_id, version=1) for job in jobs])
+    return [job.job_id for job in jobs]
+
+
+class QueryCounter:
+    """以 sqlite3 的 trace callback 計算所有連線執行的 SELECT"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def trace(self, statement):
+        if statement.lstrip().upper().startswith('SELECT'):
+            with self._lock:
+                self.count += 1
+
+    def install(self, sender, connection, **kwargs):
+        connection.connection.set_trace_callback(self.trace)
+
+
+def bump_versions(job_ids, delay, queue):
+    """fork 出的寫入行程：delay 秒後在一個交易中更新這些任務的版本，回傳提交的時間"""
+    from django.db import connections, transaction
+    from django.db.models import F
+    from job_scheduler.models import JobStatus
+
+    connections.close_all()
+    time.sleep(delay)
+    with transaction.atomic():
+        JobStatus.objects.filter(job_id__in=job_ids).update(version=F('version') + 1)
+    queue.put(time.time())
+
+
+async def get(application, path, query_string):
+    """以 ASGI 呼叫 application，回傳 (狀態碼, JSON, 完成時間)"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode('ascii'), 'root_path': '', 'query_string': query_string.encode('ascii'),
+        'headers': [(b'host', b'localhost')], 'server': ('localhost', 80), 'client': ('127.0.0.1', 50000),
+    }
+    requested = False
+    disconnected = asyncio.Event()
+    messages = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # 用戶端不會中途斷線
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    await application(scope, receive, send)
+    finished = time.time()
+    status = next(message['status'] for message in messages if message['type'] == 'http.response.start')
+    body = b''.join(message.get('body', b'') for message in messages if message['type'] == 'http.response.body')
+    return status, json.loads(body), finished
+
+
+async def run(args, job_ids, counter):
+    from django.urls import reverse
+    from pbi_scheduler_project.asgi import application
+
+    started = time.monotonic()
+    clients = [
+        asyncio.ensure_future(get(
+            application, reverse('get_job_status', args=[job_ids[i % len(job_ids)]]),
+            f'version=1&wait={args.wait}',
+        ))
+        for i in range(args.clients)
+    ]
+    # 每個請求先讀取一次目前的狀態
+    while counter.count < args.clients and not any(client.done() for client in clients):
+        await asyncio.sleep(0.05)
+    setup_seconds = time.monotonic() - started
+    early = [client for client in clients if client.done()]
+    if early:
+        raise RuntimeError(f"{len(early)} requests returned before the version changed: {early[0].result()[:2]}")
+
+    await asyncio.sleep(1)
+    idle_queries = counter.count
+    await asyncio.sleep(args.idle)
+    idle_queries = counter.count - idle_queries
+    idle = {
+        'seconds': args.idle,
+        'queries_per_sec': round(idle_queries / args.idle, 2),
+        'threads': threading.active_count(),
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    # 只更新前 changed_jobs 個任務的版本，量測這些任務的等待者的回應延遲
+    changed = set(job_ids[:args.changed_jobs or len(job_ids)])
+    woken = [client for i, client in enumerate(clients) if job_ids[i % len(job_ids)] in changed]
+    committed_at = await bump_in_process(sorted(changed))
+    results = await asyncio.gather(*woken)
+    latencies = [max(0.0, finished - committed_at) for _, _, finished in results]
+
+    # 其餘的等待者不量測，更新版本讓它們結束
+    if len(changed) < len(job_ids):
+        await bump_in_process(sorted(set(job_ids) - changed))
+        await asyncio.gather(*clients)
+    return {
+        'setup': {
+            'clients': args.clients, 'jobs': len(job_ids), 'seconds': round(setup_seconds, 3),
+            # 每個請求在 Django (middleware、request 信號) 與第一次讀取的 CPU 時間；同時喚醒的請求依序回應
+            'per_request_ms': round(setup_seconds / args.clients * 1000, 3),
+        },
+        'idle': idle,
+        'wake': dict(
+            summarize(latencies),
+            changed_jobs=len(changed),
+            statuses=sorted({status for status, _, _ in results}),
+            new_version=sum(1 for status, body, _ in results if status == 200 and body.get('version') == 2),
+        ),
+    }
+
+
+async def bump_in_process(job_ids):
+    """由 fork 出的行程更新版本，回傳提交的時間"""
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    writer = context.Process(target=bump_versions, args=(job_ids, 0.0, queue))
+    writer.start()
+    committed_at = await asyncio.get_running_loop().run_in_executor(None, queue.get)
+    writer.join()
+    return committed_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent long-poll watchers on the async job status API')
+    parser.add_argument('--clients', type=int, default=2000, help='同時等待的請求數')
+    parser.add_argument('--jobs', type=int, default=200, help='請求平均分散在這些任務上')
+    parser.add_argument('--wait', type=float, default=60, help='每個請求的 wait 參數 (秒)')
+    parser.add_argument('--idle', type=float, default=5, help='量測等待期間查詢數的秒數')
+    parser.add_argument('--changed-jobs', type=int, default=1, help='版本改變的任務數 (0 為全部)')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--keep', action='store_true', help='保留暫存目錄 (資料庫)')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        parser.error('this benchmark needs os.fork')
+
+    base_dir = tempfile.mkdtemp(prefix='bench-longpoll-')
+    try:
+        configure_django(base_dir)
+        from django.core.management import call_command
+        from django.db import connection
+        from django.db.backends.signals import connection_created
+        from job_scheduler.status_hub import POLL_INTERVAL
+
+        call_command('migrate', verbosity=0, interactive=False)
+        job_ids = create_jobs(args.jobs)
+        connection.close()
+
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        measured = asyncio.run(run(args, job_ids, counter))
+    finally:
+        if not args.keep:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    results = {
+        'benchmark': 'status_longpoll',
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'revision': git_revision(),
+        'params': dict(
+            {key: value for key, value in vars(args).items() if key not in ('output', 'keep')},
+            poll_interval=POLL_INTERVAL,
+        ),
+        **measured,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self):
+        # 每個新的 SQLite 連線套用 settings.SQLITE_PROFILE (synchronous、mmap 等；journal_mode 另由 apply_journal_mode 切換)
+        from static.utils.sqlite_profile import apply_sqlite_profile
+        connection_created.connect(apply_sqlite_profile, dispatch_uid='core.apply_sqlite_profile')
@@ -1,3 +1,98 @@
-from django.test import TestCase
+from django.db import connection, transaction
+from django.db.utils import IntegrityError, OperationalError
+from django.test import TransactionTestCase, override_settings
+import time
 
-# Create your tests here.
+from static.utils.db_utils import contended_atomic, get_lock_retry_stats, reset_lock_retry_stats
+
+
+def locked():
+    return OperationalError('database is locked')
+
+
+class ContendedAtomicTests(TransactionTestCase):
+    """contended_atomic：鎖定時重跑區塊，預算用完時放棄 (區塊不能在測試的交易中執行)"""
+
+    def setUp(self):
+        reset_lock_retry_stats()
+        self.addCleanup(reset_lock_retry_stats)
+
+    def run_block(self, body, name='test.block'):
+        runs = 0
+        for attempt in contended_atomic(name):
+            with attempt:
+                runs += 1
+                body(runs)
+        return runs
+
+    def run_locked_block(self, body):
+        with self.assertLogs('static.utils.db_utils', 'WARNING'):
+            return self.run_block(body)
+
+    @override_settings(DB_CONTENTION={'base_delay': 0.001, 'max_delay': 0.01})
+    def test_retries_lock_errors(self):
+        def body(runs):
+            if runs < 3:
+                raise locked()
+
+        self.assertEqual(self.run_locked_block(body), 3)
+        stats = get_lock_retry_stats()['test.block']
+        self.assertEqual((stats['blocks'], stats['retries'], stats['failures']), (1, 2, 0))
+        self.assertGreater(stats['pressure'], 0)
+
+    @override_settings(DB_CONTENTION={'call_budget': 0.1, 'base_delay': 0.02, 'max_delay': 0.05})
+    def test_gives_up_when_budget_is_exhausted(self):
+        def body(runs):
+            raise locked()
+
+        started = time.monotonic()
+        with self.assertRaises(OperationalError):
+            self.run_locked_block(body)
+        self.assertLess(time.monotonic() - started, 1)
+        stats = get_lock_retry_stats()['test.block']
+        self.assertEqual((stats['blocks'], stats['failures']), (1, 1))
+        self.assertGreaterEqual(stats['retries'], 1)
+
+    @override_settings(DB_CONTENTION={'busy_timeout': 0.05, 'base_delay': 0.001, 'max_delay': 0.001})
+    def test_block_duration_is_not_counted_as_waiting(self):
+        def body(runs):
+            if runs == 1:
+                time.sleep(0.3)
+                raise locked()
+
+        self.assertEqual(self.run_locked_block(body), 2)
+        # 最多 busy_timeout 加上退避的時間
+        self.assertLessEqual(get_lock_retry_stats()['test.block']['wait_seconds'], 0.06)
+
+    def test_other_errors_are_not_retried(self):
+        def body(runs):
+            raise IntegrityError('constraint failed')
+
+        with self.assertRaises(IntegrityError):
+            self.run_block(body)
+        stats = get_lock_retry_stats()['test.block']
+        self.assertEqual((stats['blocks'], stats['retries'], stats['failures']), (1, 0, 0))
+
+    def test_nested_block_is_not_retried(self):
+        def body(runs):
+            raise locked()
+
+        with self.assertRaises(OperationalError):
+            with transaction.atomic():
+                self.run_locked_block(body)
+        self.assertEqual(get_lock_retry_stats()['test.block']['retries'], 0)
+
+    def test_restores_busy_timeout_and_names_caller(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            before = cursor.fetchone()[0]
+        for attempt in contended_atomic():
+            with attempt:
+                with connection.cursor() as cursor:
+                    cursor.execute('PRAGMA busy_timeout')
+                    self.assertEqual(cursor.fetchone()[0], 200)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], before)
+        self.assertIn(f'{__name__}.{type(self).__qualname__}.test_restores_busy_timeout_and_names_caller',
+                      get_lock_retry_stats())
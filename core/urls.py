@@ -4,4 +4,5 @@ from . import views
 urlpatterns = [
     path('', views.index, name='index'),
     path('configuration/', views.configuration_view, name='configuration'),
+    path('api/db-contention/', views.db_contention_metrics, name='db_contention_metrics'),
 ] 
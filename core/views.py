@@ -1,5 +1,9 @@
 from django.shortcuts import render
+from django.http import JsonResponse
 from django.urls import reverse
+from django.views.decorators.http import require_http_methods
+from static.utils.db_utils import get_lock_retry_stats
+import os
 
 # Create your views here.
 
@@ -16,3 +20,19 @@ def index(request):
 def configuration_view(request):
     return render(request, 'core/view.html')
 
+
+@require_http_methods(["GET"])
+def db_contention_metrics(request):
+    """
+    各呼叫位置的資料庫鎖定統計 (重試、失敗與等待時間)
+    process 為處理這個請求的 web 行程；scheduler 為排程 daemon (未執行時為 null)
+    """
+    from job_scheduler.ipc import SchedulerCommandError, SchedulerUnavailable, send_command
+    try:
+        scheduler = send_command('status', timeout=1).get('db_contention')
+    except (SchedulerUnavailable, SchedulerCommandError):
+        scheduler = None
+    return JsonResponse({
+        'process': {'pid': os.getpid(), 'sites': get_lock_retry_stats()},
+        'scheduler': scheduler,
+    })
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import JobScheduler, JobExecution, Program
+from .models import JobScheduler, JobExecution, JobStatus, Program
 from django.utils.html import format_html
 import logging
 from django.urls import path
@@ -12,15 +12,23 @@ logger = logging.getLogger(__name__)
 
 @admin.register(JobScheduler)
 class JobSchedulerAdmin(admin.ModelAdmin):
-    list_display = ('job_name', 'program', 'cron_expression', 'enabled', 'last_run_time', 'next_run_time')
+    list_display = ('job_name', 'program', 'cron_expression', 'enabled', 'priority', 'last_status',
+                    'last_run_time', 'next_run_time')
     list_filter = ('enabled',)
     search_fields = ('job_name', 'program__program_name')
-    readonly_fields = ('last_run_time', 'next_run_time', 'created_at', 'updated_at')
+    readonly_fields = ('flex_offset', 'last_run_time', 'next_run_time', 'created_at', 'updated_at')
     
     fieldsets = (
         ('Basic Information', {
             'fields': ('job_name', 'program', 'cron_expression', 'enabled')
         }),
+        ('Dispatch', {
+            'fields': ('priority', 'deadline_time'),
+        }),
+        ('Schedule Smoothing', {
+            'fields': ('flex_window', 'flex_offset'),
+            'classes': ('collapse',)
+        }),
         ('Timing Information', {
             'fields': ('last_run_time', 'next_run_time', 'created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -28,7 +36,14 @@ class JobSchedulerAdmin(admin.ModelAdmin):
     )
     
     def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('executions')
+        return super().get_queryset(request).select_related('program', 'status_summary')
+
+    def last_status(self, obj):
+        try:
+            return obj.status_summary.last_status
+        except JobStatus.DoesNotExist:
+            return 'never_run'
+    last_status.short_description = 'Last Status'
     
     def save_model(self, request, obj, form, change):
         # Ensure next_run_time is calculated
@@ -43,7 +58,9 @@ class JobExecutionAdmin(admin.ModelAdmin):
     list_display = ('job', 'execution_id', 'status', 'start_time', 'end_time', 'duration', 'abort_button')
     list_filter = ('status', 'start_time')
     search_fields = ('job__job_name', 'execution_id')
-    readonly_fields = ('execution_id', 'job', 'start_time', 'end_time', 'status', 'output', 'error')
+    readonly_fields = ('execution_id', 'job', 'start_time', 'end_time', 'status', 'output', 'error',
+                       'pid', 'hostname', 'discarded_percent', 'queue_wait', 'deadline', 'deadline_missed',
+                       'dataset_refresh', 'refresh_coalesced')
     ordering = ('-start_time',)
     
     def duration(self, obj):
@@ -77,9 +94,14 @@ class JobExecutionAdmin(admin.ModelAdmin):
         return custom_urls + urls
     
     def abort_execution(self, request, execution_id):
+        from .ipc import abort_execution
         execution = self.get_object(request, execution_id)
-        if execution and execution.abort():
-            self.message_user(request, f"Job execution {execution_id} has been aborted.")
+        if execution and abort_execution(execution):
+            self.message_user(
+                request,
+                f"Job execution {execution_id} has been aborted "
+                f"({execution.discarded_percent:.1f}% of the work was discarded)."
+            )
         else:
             self.message_user(request, "Failed to abort job execution.", level=messages.ERROR)
         return HttpResponseRedirect("../")
\ No newline at end of file
@@ -11,17 +11,35 @@ class JobSchedulerConfig(AppConfig):
     name = "job_scheduler"
 
     def ready(self):
+        # 任務變更紀錄 (排程同步器使用)
+        from . import signals  # noqa: F401
+
+        # 排程器與引擎相關的模組 (APScheduler、執行槽、工作行程池) 只在啟動排程器時載入
         if settings.SCHEDULER_AUTOSTART:
-            from .scheduler import init_scheduler
             # 使用 post_migrate 信號來確保數據庫準備就緒
             post_migrate.connect(self._init_scheduler, sender=self)
 
     def _init_scheduler(self, sender, **kwargs):
-        """在數據庫遷移完成後初始化調度器"""
+        """
+        在數據庫遷移完成後參與排程器 leader 選舉
+        多個行程 (例如 gunicorn worker) 中只有取得租約的行程啟動調度器 (job_scheduler/leader.py)
+        """
         try:
-            from .scheduler import init_scheduler
-            self.scheduler = init_scheduler()
-            logger.info("Job scheduler initialized successfully")
+            from .leader import start_leader_election
+            self.scheduler = None
+            start_leader_election(self._on_elected, self._on_demoted)
         except Exception as e:
-            logger.error(f"Failed to initialize job scheduler: {str(e)}")
+            logger.error(f"Failed to start scheduler leader election: {str(e)}")
+
+    def _on_elected(self):
+        from .scheduler import init_scheduler
+        self.scheduler = init_scheduler()
+        logger.info("Job scheduler initialized successfully")
+
+    def _on_demoted(self):
+        from .scheduler import shutdown_scheduler
+        scheduler, self.scheduler = self.scheduler, None
+        if scheduler is not None:
+            shutdown_scheduler(scheduler)
+            logger.info("Job scheduler stopped")
 
@@ -0,0 +1,158 @@
+"""
+排程 daemon (python manage.py run_scheduler)
+
+派發任務、引擎執行槽與引擎工作行程只存在於這個行程；web 行程不再啟動排程器，
+立即執行、重新載入與中止改由本機 IPC (ipc.py) 交給 daemon。
+
+- 啟動時參與 leader 選舉 (leader.py)，取得租約後才啟動 APScheduler
+- 收到 SIGTERM / SIGINT 時：停止接受 IPC 與觸發、釋放租約，
+  等待執行中的任務最多 drain_timeout 秒，逾時後中止剩餘的執行，最後排空寫入佇列
+"""
+from django.db import connection
+import logging
+import os
+import socket
+import threading
+import time
+
+from .db_writer import get_db_writer
+from .engine_pool import close_engine_pool
+from .executor import get_engine_executor
+from .ipc import SchedulerIPCServer
+from .leader import get_leader_election, is_scheduler_leader, start_leader_election
+from .models import JobExecution
+from . import process_registry
+from static.utils.db_utils import get_lock_retry_stats
+from static.utils.sqlite_profile import apply_journal_mode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DRAIN_TIMEOUT = 300
+# 中止剩餘執行後，等待執行槽記錄結果的時間
+ABORT_GRACE_PERIOD = 15
+
+
+class SchedulerDaemon:
+    """排程 daemon 的生命週期：選舉、IPC 與結束時的排空"""
+
+    def __init__(self, drain_timeout=DEFAULT_DRAIN_TIMEOUT, ipc_address=None):
+        self.drain_timeout = drain_timeout
+        self.scheduler = None
+        self._scheduler_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.ipc = SchedulerIPCServer({
+            'ping': self.ping,
+            'status': self.status,
+            'run_now': self.run_now,
+            'reload': self.reload,
+            'abort': self.abort,
+        }, address=ipc_address)
+
+    # 選舉回呼
+
+    def _on_elected(self):
+        from .scheduler import init_scheduler
+        with self._scheduler_lock:
+            if self._stopping.is_set():
+                return
+            self.scheduler = init_scheduler()
+        logger.info("Job scheduler initialized successfully")
+
+    def _on_demoted(self):
+        from .scheduler import shutdown_scheduler
+        with self._scheduler_lock:
+            scheduler, self.scheduler = self.scheduler, None
+        if scheduler is not None:
+            shutdown_scheduler(scheduler)
+            logger.info("Job scheduler stopped")
+
+    # IPC 指令
+
+    def ping(self):
+        return {'pid': os.getpid(), 'leader': is_scheduler_leader()}
+
+    def status(self):
+        election = get_leader_election()
+        scheduler = self.scheduler
+        return {
+            'pid': os.getpid(),
+            'hostname': socket.gethostname(),
+            'leader': is_scheduler_leader(),
+            'identity': election.identity if election else None,
+            'term': election.term if election else None,
+            'scheduled_jobs': len(scheduler.get_jobs()) if scheduler is not None else 0,
+            'executor': get_engine_executor().stats(),
+            'writer': get_db_writer().stats(),
+            'db_contention': {'pid': os.getpid(), 'sites': get_lock_retry_stats()},
+        }
+
+    def run_now(self, job_id):
+        """立即派發任務，回傳是否已放入佇列"""
+        from .scheduler import execute_job
+        if self.scheduler is None or not is_scheduler_leader():
+            raise RuntimeError("This scheduler daemon is not the leader")
+        return execute_job(int(job_id))
+
+    def reload(self):
+        """立即套用 JobChange 中的任務變更，回傳各類變更的筆數"""
+        scheduler = self.scheduler
+        reconciler = getattr(scheduler, 'reconciler', None)
+        if reconciler is None:
+            return None
+        return reconciler.reconcile_changes()
+
+    def abort(self, execution_id):
+        return JobExecution.objects.get(execution_id=execution_id).abort()
+
+    # 生命週期
+
+    def start(self):
+        apply_journal_mode()
+        self.ipc.start()
+        start_leader_election(self._on_elected, self._on_demoted)
+        logger.info(f"Scheduler daemon started (pid {os.getpid()})")
+
+    def stop(self):
+        """停止觸發、排空執行槽後結束"""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        logger.info("Scheduler daemon stopping")
+        self.ipc.close()
+
+        election = get_leader_election()
+        if election is not None:
+            # 停止 APScheduler 並釋放租約，其他 daemon 可立即接手
+            election.stop()
+
+        executor = get_engine_executor()
+        executor.shutdown(wait=False)
+        self._drain(executor)
+        close_engine_pool()
+        get_db_writer().close()
+        connection.close()
+        logger.info("Scheduler daemon stopped")
+
+    def _wait_idle(self, executor, timeout):
+        deadline = time.monotonic() + timeout
+        while executor.stats()['running'] and time.monotonic() < deadline:
+            time.sleep(0.5)
+        return not executor.stats()['running']
+
+    def _drain(self, executor):
+        running = executor.stats()['running']
+        if not running:
+            return
+        logger.info(f"等待 {running} 個執行中的任務結束 (最多 {self.drain_timeout} 秒)")
+        if self._wait_idle(executor, self.drain_timeout):
+            return
+
+        execution_ids = process_registry.running_execution_ids()
+        logger.warning(f"執行中的任務未在 {self.drain_timeout} 秒內結束，中止 {len(execution_ids)} 個執行")
+        for execution_id in execution_ids:
+            try:
+                JobExecution.objects.get(execution_id=execution_id).abort()
+            except Exception as e:
+                logger.error(f"中止執行 {execution_id} 失敗: {str(e)}")
+        if not self._wait_idle(executor, ABORT_GRACE_PERIOD):
+            logger.error("仍有任務未結束，執行結果可能未記錄")
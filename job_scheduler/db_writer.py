@@ -0,0 +1,244 @@
+"""
+單一寫入執行緒 (write-behind)
+
+排程行程中的寫入 (執行記錄、狀態摘要、進度事件、記錄檔大小、dataset 重新整理、
+APScheduler job store) 都交給同一個執行緒依序執行。佇列中已累積的寫入合併為一個短交易提交，
+每筆寫入各自使用 savepoint，一筆失敗不影響同批的其他寫入。
+行程內不再有多個執行緒同時搶 SQLite 的寫入鎖；其他行程 (例如 web) 持有鎖時由寫入執行緒退避重試。
+
+- submit(): 不等待結果 (進度事件、記錄檔大小等)，失敗時只記錄警告
+- call(): 等待交易提交後回傳結果或拋出例外 (後續讀取需要看到這筆寫入時使用)
+- flush(): 等待之前送出的寫入全部提交；close() 在行程結束時排空佇列
+
+設定值讀取自 settings.SCHEDULER_CONFIG 中以 "writer." 開頭的鍵；
+writer.enabled 為 False 時在呼叫端的執行緒直接寫入 (舊的行為)。
+"""
+from concurrent.futures import Future
+from django.conf import settings
+from django.db import connection, transaction
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from static.utils.db_utils import is_lock_error, record_lock_retry
+
+logger = logging.getLogger(__name__)
+
+WRITER_CONFIG_PREFIX = 'writer.'
+
+WRITER_DEFAULTS = {
+    'enabled': True,
+    'max_batch': 200,        # 一個交易最多合併幾筆寫入
+    'retry_timeout': 60,     # 秒；其他行程持續持有寫入鎖超過此時間，本批寫入失敗
+}
+
+_STOP = object()
+
+
+def get_writer_config():
+    config = dict(WRITER_DEFAULTS)
+    for key, value in getattr(settings, 'SCHEDULER_CONFIG', {}).items():
+        if key.startswith(WRITER_CONFIG_PREFIX):
+            config[key[len(WRITER_CONFIG_PREFIX):]] = value
+    return config
+
+
+class _Write:
+    """一筆排隊中的寫入"""
+
+    __slots__ = ('fn', 'args', 'kwargs', 'future', 'wait')
+
+    def __init__(self, fn, args, kwargs, wait):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.wait = wait
+
+    def __repr__(self):
+        return getattr(self.fn, '__qualname__', repr(self.fn))
+
+
+class DatabaseWriter:
+    """在專用執行緒依序執行寫入，並將佇列中的寫入合併為一個交易"""
+
+    def __init__(self, max_batch=200, retry_timeout=60, retry_delay=0.05, max_retry_delay=1.0):
+        self.max_batch = max(1, int(max_batch))
+        self.retry_timeout = retry_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {'writes': 0, 'batches': 0, 'failed': 0, 'lock_retries': 0, 'max_batch_seen': 0}
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls):
+        config = get_writer_config()
+        return cls(max_batch=config['max_batch'], retry_timeout=config['retry_timeout'])
+
+    def _enqueue(self, fn, args, kwargs, wait):
+        item = _Write(fn, args, kwargs, wait)
+        if threading.current_thread() is self._thread:
+            # 寫入函式中再送出的寫入已在同一個交易內，直接執行
+            try:
+                item.future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                item.future.set_exception(e)
+            return item.future
+        with self._close_lock:
+            if self._closed:
+                raise RuntimeError("Database writer has been closed")
+            self._queue.put(item)
+        return item.future
+
+    def submit(self, fn, *args, **kwargs):
+        """排入寫入佇列，不等待結果"""
+        return self._enqueue(fn, args, kwargs, wait=False)
+
+    def call(self, fn, *args, **kwargs):
+        """排入寫入佇列並等待所在的交易提交，回傳 fn 的結果"""
+        return self._enqueue(fn, args, kwargs, wait=True).result()
+
+    def flush(self, timeout=None):
+        """等待目前為止送出的寫入全部提交"""
+        self._enqueue(lambda: None, (), {}, wait=True).result(timeout)
+
+    def close(self, timeout=30):
+        """停止接受寫入，排空佇列後結束寫入執行緒"""
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error(f"資料庫寫入執行緒未在 {timeout} 秒內結束，剩餘的寫入可能遺失")
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats, queued=self._queue.qsize())
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            except BaseException as e:
+                # 不讓寫入執行緒結束，呼叫端仍會收到錯誤
+                for item in batch:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+        connection.close()
+
+    def _write_batch(self, batch):
+        delay = self.retry_delay
+        deadline = time.monotonic() + self.retry_timeout
+        while True:
+            try:
+                results = self._execute(batch)
+                break
+            except Exception as e:
+                if is_lock_error(e) and time.monotonic() < deadline:
+                    # 其他行程持有寫入鎖：整批回滾後重試
+                    record_lock_retry('job_scheduler.db_writer', 'retry', wait=delay)
+                    with self._stats_lock:
+                        self._stats['lock_retries'] += 1
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+                    continue
+                if is_lock_error(e):
+                    record_lock_retry('job_scheduler.db_writer', 'failure')
+                logger.error(f"資料庫寫入失敗，捨棄 {len(batch)} 筆寫入: {str(e)}")
+                results = [(item, None, e) for item in batch]
+                break
+
+        failed = 0
+        for item, result, error in results:
+            if error is None:
+                item.future.set_result(result)
+                continue
+            failed += 1
+            item.future.set_exception(error)
+            if not item.wait:
+                logger.warning(f"背景寫入 {item!r} 失敗: {str(error)}")
+        with self._stats_lock:
+            self._stats['writes'] += len(batch)
+            self._stats['batches'] += 1
+            self._stats['failed'] += failed
+            self._stats['max_batch_seen'] = max(self._stats['max_batch_seen'], len(batch))
+
+    def _execute(self, batch):
+        """在一個交易中執行整批寫入；鎖定錯誤往外拋出讓整批重試，其他錯誤只影響該筆"""
+        results = []
+        with transaction.atomic():
+            for item in batch:
+                try:
+                    with transaction.atomic():
+                        results.append((item, item.fn(*item.args, **item.kwargs), None))
+                except Exception as e:
+                    if is_lock_error(e):
+                        raise
+                    results.append((item, None, e))
+        return results
+
+
+class DirectWriter:
+    """writer.enabled 為 False 時使用：在呼叫端的執行緒直接寫入"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(self.call(fn, *args, **kwargs))
+        except Exception as e:
+            logger.warning(f"寫入 {getattr(fn, '__qualname__', fn)!r} 失敗: {str(e)}")
+            future.set_exception(e)
+        return future
+
+    def call(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+    def stats(self):
+        return {}
+
+
+_db_writer = None
+_db_writer_lock = threading.Lock()
+
+
+def get_db_writer():
+    """取得行程內共用的寫入器；行程結束時排空佇列"""
+    global _db_writer
+    with _db_writer_lock:
+        if _db_writer is None:
+            if get_writer_config()['enabled']:
+                _db_writer = DatabaseWriter.from_settings()
+                atexit.register(_db_writer.close)
+                logger.info(f"Database writer started (max batch {_db_writer.max_batch})")
+            else:
+                _db_writer = DirectWriter()
+        return _db_writer
@@ -0,0 +1,283 @@
+"""
+常駐 Power BI Engine 工作行程池
+
+每個工作行程以 `power_bi_engine.py --worker` 啟動，只載入一次引擎模組，
+之後透過 stdin/stdout 的 JSON 行協定接收 program 參數並回傳執行結果。
+工作行程在執行 N 次或記憶體超過門檻後會被回收並重新啟動。
+"""
+from pathlib import Path
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+
+from . import process_registry
+from .executor import get_engine_config
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ENGINE_SCRIPT = BASE_DIR / 'scripts' / 'power_bi_engine.py'
+
+DEFAULT_TIMEOUT = 3600  # 1小時
+
+# --program 模式下引擎以此前綴在 stdout 輸出結構化事件 (需與 power_bi_engine.py 一致)
+EVENT_PREFIX = '@@pbi-event '
+READY_TIMEOUT = 30
+
+
+def timeout_message(timeout):
+    """執行超過 timeout 秒 (engine.timeout) 被終止時的錯誤訊息"""
+    timeout = int(timeout)
+    if timeout % 3600 == 0:
+        limit = f"{timeout // 3600}小時"
+    elif timeout % 60 == 0:
+        limit = f"{timeout // 60}分鐘"
+    else:
+        limit = f"{timeout}秒"
+    return f"執行超時 超過{limit} "
+
+
+class EngineWorkerError(Exception):
+    """工作行程意外結束或協定錯誤"""
+
+
+class EngineWorker:
+    """一個常駐的引擎工作行程"""
+
+    def __init__(self, python=None, script=ENGINE_SCRIPT, cwd=BASE_DIR):
+        popen_kwargs = {}
+        if os.name == 'posix':
+            # 獨立的 process group，方便之後整組終止
+            popen_kwargs['start_new_session'] = True
+        self.process = subprocess.Popen(
+            [python or sys.executable, str(script), '--worker'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=str(cwd),
+            universal_newlines=True,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            **popen_kwargs
+        )
+        self.pid = self.process.pid
+        self.runs = 0
+        self.rss_kb = None
+        self._stderr_lines = []
+        self._sink = None
+        self._stderr_thread = threading.Thread(
+            target=self._drain_stderr, name=f'engine-worker-{self.pid}-stderr', daemon=True
+        )
+        self._stderr_thread.start()
+        self._wait_ready()
+
+    def __repr__(self):
+        return f"<EngineWorker pid={self.pid} runs={self.runs}>"
+
+    def _drain_stderr(self):
+        for line in self.process.stderr:
+            line = line.rstrip('\n')
+            # 只保留最近的 stderr，用於回報錯誤
+            self._stderr_lines = (self._stderr_lines + [line])[-50:]
+            sink = self._sink
+            if sink is not None:
+                sink(line)
+            else:
+                logger.debug(f"[engine worker {self.pid}] {line}")
+
+    def _wait_ready(self):
+        timer = threading.Timer(READY_TIMEOUT, self.kill)
+        timer.start()
+        try:
+            message = self._read_message()
+        finally:
+            timer.cancel()
+        if message is None or message.get('type') != 'ready':
+            self.kill()
+            raise EngineWorkerError(f"Engine worker {self.pid} failed to start: {self.stderr_tail()}")
+
+    def _read_message(self):
+        """讀取下一則協定訊息；行程結束時回傳 None"""
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                return json.loads(line)
+            except ValueError:
+                logger.warning(f"[engine worker {self.pid}] 無法解析的輸出: {line}")
+
+    def _send(self, message):
+        self.process.stdin.write(json.dumps(message, ensure_ascii=False) + '\n')
+        self.process.stdin.flush()
+
+    def stderr_tail(self):
+        return '\n'.join(self._stderr_lines)
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def run(self, program_params, sink, timeout=DEFAULT_TIMEOUT, on_event=None):
+        """
+        執行一次 program
+        引擎輸出逐行交給 sink，結構化事件 (例如進度) 交給 on_event，
+        回傳錯誤訊息 (成功時為 None)
+        """
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            self.kill()
+
+        timer = threading.Timer(timeout, on_timeout)
+        self.runs += 1
+        self._sink = sink
+        try:
+            self._send({'type': 'run', 'program': program_params})
+            timer.start()
+            while True:
+                message = self._read_message()
+                if message is None:
+                    break
+                if message.get('type') == 'log':
+                    sink(message.get('message', ''))
+                elif message.get('type') == 'result':
+                    self.rss_kb = message.get('rss_kb')
+                    return message.get('error') if message.get('returncode') else None
+                elif on_event is not None:
+                    on_event(message)
+        except (BrokenPipeError, OSError) as e:
+            self.kill()
+            raise EngineWorkerError(f"Engine worker {self.pid} pipe error: {str(e)}")
+        finally:
+            timer.cancel()
+            self._sink = None
+
+        self.process.wait()
+        if timed_out.is_set():
+            return timeout_message(timeout)
+        raise EngineWorkerError(
+            f"Engine worker {self.pid} exited unexpectedly (code {self.process.poll()}): {self.stderr_tail()}"
+        )
+
+    def kill(self):
+        if self.is_alive():
+            process_registry.kill_process_group(self.process)
+            self.process.wait()
+
+    def close(self, timeout=5):
+        """要求工作行程正常結束，逾時則強制終止"""
+        if self.is_alive():
+            try:
+                self._send({'type': 'shutdown'})
+                self.process.stdin.close()
+                self.process.wait(timeout=timeout)
+            except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+                self.kill()
+
+
+class EnginePool:
+    """
+    常駐工作行程池
+
+    同時執行數量由 EngineExecutor 的執行槽控制，這裡只負責保留暖機中的行程
+    與回收用舊的行程。
+    """
+
+    def __init__(self, size, python=None, prefork=0, max_runs=50, max_rss_mb=512):
+        self.size = size
+        self.python = python
+        self.max_runs = max_runs
+        self.max_rss_mb = max_rss_mb
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(min(prefork, size)):
+            self._idle.append(EngineWorker(python=self.python))
+
+    @classmethod
+    def from_settings(cls):
+        config = get_engine_config()
+        return cls(
+            size=int(config['max_slots']),
+            python=config['python'],
+            prefork=int(config['prefork']),
+            max_runs=int(config['worker_max_runs']),
+            max_rss_mb=config['worker_max_rss_mb'],
+        )
+
+    def acquire(self):
+        with self._lock:
+            if self._closed:
+                raise EngineWorkerError("Engine pool has been closed")
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.is_alive():
+                    return worker
+        return EngineWorker(python=self.python)
+
+    def release(self, worker):
+        if self._should_recycle(worker):
+            logger.info(f"回收引擎工作行程 {worker.pid} (runs={worker.runs}, rss_kb={worker.rss_kb})")
+            worker.close()
+            return
+        with self._lock:
+            if not self._closed and len(self._idle) < self.size:
+                self._idle.append(worker)
+                return
+        worker.close()
+
+    def _should_recycle(self, worker):
+        if not worker.is_alive():
+            return True
+        if self.max_runs and worker.runs >= self.max_runs:
+            return True
+        if self.max_rss_mb and worker.rss_kb and worker.rss_kb > self.max_rss_mb * 1024:
+            return True
+        return False
+
+    def run(self, program_params, sink, timeout=DEFAULT_TIMEOUT, on_event=None):
+        """借用一個工作行程執行 program，結束後歸還"""
+        worker = self.acquire()
+        try:
+            with process_registry.track(program_params.get('execution_id'), worker.process):
+                return worker.run(program_params, sink, timeout=timeout, on_event=on_event)
+        finally:
+            self.release(worker)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+_engine_pool = None
+_engine_pool_lock = threading.Lock()
+
+
+def get_engine_pool():
+    """取得行程內共用的引擎工作行程池"""
+    global _engine_pool
+    with _engine_pool_lock:
+        if _engine_pool is None:
+            _engine_pool = EnginePool.from_settings()
+            logger.info(f"Engine pool started: size {_engine_pool.size}, {len(_engine_pool._idle)} pre-forked")
+        return _engine_pool
+
+
+def close_engine_pool():
+    """關閉共用的引擎工作行程池 (排程 daemon 結束時)"""
+    global _engine_pool
+    with _engine_pool_lock:
+        pool, _engine_pool = _engine_pool, None
+    if pool is not None:
+        pool.close()
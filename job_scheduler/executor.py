@@ -0,0 +1,311 @@
+"""
+引擎執行槽 (Engine slots)
+
+APScheduler 的執行緒只負責派發任務；真正執行 Power BI Engine 的工作會在這裡排隊，
+並受以下限制：
+- 總執行槽數 (engine.max_slots，未設定時依 CPU 核心數計算)
+- 每個 Program.workspace_id 的同時執行上限 (engine.max_per_workspace)
+- 每個 Program.dataset_id 的同時執行上限 (engine.max_per_dataset)
+
+執行槽不足時，等待中的工作依最晚開始時間 (截止時間 - 預估執行時間) 排序，
+沒有截止時間的工作排在後面，再依 priority (越大越優先) 與觸發順序排序。
+
+工作需要等待其他工作 (例如等待同一 dataset 的重新整理) 時回傳 Requeue：
+釋放執行槽，延遲後以同樣的優先順序重新排入佇列，期間同一個 job 仍視為執行中。
+
+設定值讀取自 settings.SCHEDULER_CONFIG 中以 "engine." 開頭的鍵。
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from pathlib import Path
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ENGINE_CONFIG_PREFIX = 'engine.'
+
+ENGINE_DEFAULTS = {
+    'max_slots': None,          # None 表示依 CPU 核心數計算
+    'slots_per_cpu': 2,
+    'max_per_workspace': 4,     # None 或 0 表示不限制
+    'max_per_dataset': 2,
+    'timeout': 3600,            # 單次執行的超時秒數
+    'python': None,             # None 表示使用目前的直譯器 (sys.executable)
+    'warm_workers': True,       # 使用常駐工作行程 (engine_pool.py)，False 則每次啟動新行程
+    'prefork': 2,
+    'worker_max_runs': 50,
+    'worker_max_rss_mb': 512,
+    'tenant_id': 'default',
+    'rate_limit_db': None,      # 跨行程共用的 API 速率限制檔，None 表示 BASE_DIR / 'logs' / 'rate_limits.sqlite3'
+    'rate_limits': {},          # 覆寫 scripts/rate_limiter.py 的 DEFAULT_LIMITS
+    'refresh_window': 600,      # 同一 dataset 在幾秒內完成的重新整理可直接共用，0 表示不合併
+    'refresh_wait_timeout': 1800,
+    'artifact_cache': True,     # 資料未重新整理時重用上次的匯出檔 (存放在 Program.filelocation/.pbi_cache)
+    'artifact_cache_max_mb': 2048,
+    'artifact_cache_max_entries': 500,
+    'powerbi_api_url': None,    # 例如 https://api.powerbi.com/v1.0/myorg，None 表示引擎模擬 Power BI 步驟
+    'token_url': None,          # Azure AD token 端點；client id/secret 由環境變數 POWERBI_CLIENT_ID/SECRET 提供
+    'poll_interval': 5,         # 輪詢重新整理與匯出狀態的秒數 (伺服器回傳 Retry-After 時以其為準)
+    'refresh_timeout': 3600,
+    'sharepoint_api_url': None, # 例如 https://graph.microsoft.com/v1.0，None 表示不上傳；權杖由環境變數 SHAREPOINT_TOKEN 提供
+    'upload_chunk_mb': 10,      # 上傳分段大小，會調整為 320 KiB 的倍數
+    'upload_parallel': 4,       # 同時上傳的分段數，伺服器不接受亂序分段時設為 1
+}
+
+
+def get_engine_config():
+    """讀取 SCHEDULER_CONFIG 中的 engine.* 設定並補上預設值"""
+    config = dict(ENGINE_DEFAULTS)
+    for key, value in getattr(settings, 'SCHEDULER_CONFIG', {}).items():
+        if key.startswith(ENGINE_CONFIG_PREFIX):
+            config[key[len(ENGINE_CONFIG_PREFIX):]] = value
+
+    if not config['rate_limit_db']:
+        config['rate_limit_db'] = str(Path(settings.BASE_DIR) / 'logs' / 'rate_limits.sqlite3')
+    if not config['max_slots']:
+        config['max_slots'] = (os.cpu_count() or 1) * int(config['slots_per_cpu'])
+    return config
+
+
+class Requeue:
+    """
+    工作的回傳值：釋放執行槽，delay 秒後以 fn(*args) 繼續
+    執行池關閉而不再繼續時呼叫 on_drop() (例如結束已建立的執行記錄)
+    """
+
+    __slots__ = ('delay', 'fn', 'args', 'on_drop')
+
+    def __init__(self, delay, fn, *args, on_drop=None):
+        self.delay = delay
+        self.fn = fn
+        self.args = args
+        self.on_drop = on_drop
+
+
+class EngineTask:
+    """一筆等待或執行中的引擎工作"""
+
+    __slots__ = ('job_id', 'workspace_id', 'dataset_id', 'fn', 'args', 'seq',
+                 'priority', 'latest_start', 'enqueued_at', 'on_drop')
+
+    def __init__(self, job_id, workspace_id, dataset_id, fn, args, seq,
+                 priority=0, latest_start=None, enqueued_at=None, on_drop=None):
+        self.job_id = job_id
+        self.workspace_id = workspace_id
+        self.dataset_id = dataset_id
+        self.fn = fn
+        self.args = args
+        self.seq = seq
+        self.priority = priority
+        self.latest_start = latest_start
+        self.enqueued_at = enqueued_at or time.time()
+        self.on_drop = on_drop
+
+    def sort_key(self):
+        latest_start = self.latest_start if self.latest_start is not None else math.inf
+        return (latest_start, -self.priority, self.seq)
+
+    def __lt__(self, other):
+        return self.sort_key() < other.sort_key()
+
+    def __repr__(self):
+        return f"<EngineTask job={self.job_id} workspace={self.workspace_id} dataset={self.dataset_id}>"
+
+
+class EngineExecutor:
+    """
+    有上限的引擎執行池
+
+    等待中的工作若因 workspace / dataset 上限無法執行，不會佔住執行槽，
+    後面其他可執行的工作會先被派發 (避免隊頭阻塞)。
+    同一個 job 在等待或執行中時，重複觸發會被略過。
+    """
+
+    def __init__(self, max_slots, max_per_workspace=None, max_per_dataset=None):
+        if max_slots < 1:
+            raise ValueError("max_slots must be at least 1")
+        self.max_slots = max_slots
+        self.max_per_workspace = max_per_workspace or None
+        self.max_per_dataset = max_per_dataset or None
+
+        self._pool = ThreadPoolExecutor(max_workers=max_slots, thread_name_prefix='engine-slot')
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._pending = []
+        self._running = 0
+        self._workspace_running = defaultdict(int)
+        self._dataset_running = defaultdict(int)
+        self._active_jobs = set()
+        # 回傳 Requeue 後等待重新排入佇列的工作: job_id -> Timer
+        self._delayed = {}
+        self._shutdown = False
+
+    @classmethod
+    def from_settings(cls):
+        config = get_engine_config()
+        return cls(
+            max_slots=int(config['max_slots']),
+            max_per_workspace=config['max_per_workspace'],
+            max_per_dataset=config['max_per_dataset'],
+        )
+
+    def submit(self, job_id, workspace_id, dataset_id, fn, *args, priority=0, deadline=None,
+               expected_duration=0):
+        """
+        將工作放入佇列
+        deadline 為完成期限 (epoch 秒)，expected_duration 為預估執行秒數
+        回傳 False 表示同一個 job 已在等待或執行中
+        """
+        latest_start = deadline - expected_duration if deadline is not None else None
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Engine executor has been shut down")
+            if job_id in self._active_jobs:
+                logger.warning(f"任務 {job_id} 仍在等待或執行中，略過本次觸發")
+                return False
+
+            self._active_jobs.add(job_id)
+            heapq.heappush(self._pending, EngineTask(
+                job_id, workspace_id, dataset_id, fn, args, next(self._seq),
+                priority=priority, latest_start=latest_start,
+            ))
+            self._dispatch_locked()
+        return True
+
+    def _is_eligible(self, task):
+        if self.max_per_workspace and self._workspace_running[task.workspace_id] >= self.max_per_workspace:
+            return False
+        if self.max_per_dataset and self._dataset_running[task.dataset_id] >= self.max_per_dataset:
+            return False
+        return True
+
+    def _dispatch_locked(self):
+        """在持有鎖的情況下，依優先順序把可執行的工作派發到空閒的執行槽"""
+        skipped = []
+        while self._running < self.max_slots and self._pending:
+            task = heapq.heappop(self._pending)
+            if not self._is_eligible(task):
+                skipped.append(task)
+                continue
+            self._running += 1
+            self._workspace_running[task.workspace_id] += 1
+            self._dataset_running[task.dataset_id] += 1
+            self._pool.submit(self._run_task, task)
+        for task in skipped:
+            heapq.heappush(self._pending, task)
+
+    def _run_task(self, task):
+        requeue = None
+        try:
+            result = task.fn(*task.args)
+            if isinstance(result, Requeue):
+                requeue = result
+        except Exception as e:
+            logger.error(f"引擎執行槽中的任務 {task.job_id} 發生未處理錯誤: {str(e)}")
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._release_key(self._workspace_running, task.workspace_id)
+                self._release_key(self._dataset_running, task.dataset_id)
+                if requeue is not None and not self._shutdown:
+                    continuation = EngineTask(
+                        task.job_id, task.workspace_id, task.dataset_id, requeue.fn, requeue.args, task.seq,
+                        priority=task.priority, latest_start=task.latest_start, enqueued_at=task.enqueued_at,
+                        on_drop=requeue.on_drop,
+                    )
+                    timer = threading.Timer(requeue.delay, self._requeue, args=(continuation,))
+                    timer.daemon = True
+                    self._delayed[task.job_id] = timer
+                    timer.start()
+                    requeue = None
+                else:
+                    self._active_jobs.discard(task.job_id)
+                if not self._shutdown:
+                    self._dispatch_locked()
+            if requeue is not None and requeue.on_drop is not None:
+                # 執行池已關閉
+                self._drop([requeue])
+
+    def _requeue(self, task):
+        with self._lock:
+            if self._delayed.pop(task.job_id, None) is None:
+                # 執行池已關閉，由 shutdown() 處理
+                return
+            heapq.heappush(self._pending, task)
+            self._dispatch_locked()
+
+    @staticmethod
+    def _drop(tasks):
+        for task in tasks:
+            if task.on_drop is None:
+                continue
+            try:
+                task.on_drop()
+            except Exception as e:
+                logger.error(f"結束被捨棄的任務失敗: {str(e)}")
+
+    @staticmethod
+    def _release_key(counter, key):
+        counter[key] -= 1
+        if counter[key] <= 0:
+            del counter[key]
+
+    def stats(self):
+        """目前執行槽的使用狀況"""
+        with self._lock:
+            return {
+                'max_slots': self.max_slots,
+                'running': self._running,
+                'pending': len(self._pending),
+                'delayed': len(self._delayed),
+                'oldest_pending_seconds': (
+                    time.time() - min(task.enqueued_at for task in self._pending) if self._pending else 0
+                ),
+                'running_by_workspace': dict(self._workspace_running),
+                'running_by_dataset': dict(self._dataset_running),
+            }
+
+    def shutdown(self, wait=True):
+        """
+        停止接受新工作；等待中與等待重新排入的工作會被捨棄 (呼叫其 on_drop)，
+        執行中的工作視 wait 決定是否等待
+        """
+        with self._lock:
+            self._shutdown = True
+            dropped = list(self._pending)
+            for timer in self._delayed.values():
+                timer.cancel()
+                dropped.append(timer.args[0])
+            self._delayed.clear()
+            for task in dropped:
+                self._active_jobs.discard(task.job_id)
+            self._pending.clear()
+        if dropped:
+            logger.warning(f"引擎執行槽關閉，捨棄 {len(dropped)} 個等待中的任務")
+            self._drop(dropped)
+        self._pool.shutdown(wait=wait)
+
+
+_engine_executor = None
+_engine_executor_lock = threading.Lock()
+
+
+def get_engine_executor():
+    """取得行程內共用的引擎執行池"""
+    global _engine_executor
+    with _engine_executor_lock:
+        if _engine_executor is None:
+            _engine_executor = EngineExecutor.from_settings()
+            logger.info(
+                f"Engine executor started: {_engine_executor.max_slots} slots, "
+                f"max {_engine_executor.max_per_workspace} per workspace, "
+                f"max {_engine_executor.max_per_dataset} per dataset"
+            )
+        return _engine_executor
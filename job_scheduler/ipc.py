@@ -0,0 +1,185 @@
+"""
+web 行程與排程 daemon (manage.py run_scheduler) 之間的本機 IPC
+
+daemon 在 Unix socket (Windows 為 localhost TCP) 上接受請求，每個連線送出一個請求、收到一個回覆：
+
+    {'command': 'run_now', 'args': {'job_id': 1}}  ->  {'ok': True, 'result': ...}
+                                                   或 {'ok': False, 'error': '...'}
+
+指令: ping、status、run_now (立即派發任務)、reload (立即套用任務變更)、abort (中止執行)。
+連線以 multiprocessing.connection 的 HMAC 驗證，金鑰由 SECRET_KEY 衍生。
+daemon 未執行時 send_command() 拋出 SchedulerUnavailable；任務變更與中止仍可透過資料庫完成
+(同步器定期輪詢 JobChange、JobExecution.abort() 依 pid 終止同一主機上的引擎行程)。
+
+設定值讀取自 settings.SCHEDULER_CONFIG 中以 "ipc." 開頭的鍵。
+"""
+from django.conf import settings
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+import hashlib
+import hmac
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+IPC_CONFIG_PREFIX = 'ipc.'
+
+IPC_DEFAULTS = {
+    'address': None,    # None: posix 為 BASE_DIR/logs/scheduler.sock，其他平台為 127.0.0.1:47391
+    'timeout': 5,       # 秒；等待 daemon 回覆的上限
+}
+
+
+class SchedulerUnavailable(Exception):
+    """排程 daemon 未執行或無法連線"""
+
+
+class SchedulerCommandError(Exception):
+    """daemon 回覆指令執行失敗"""
+
+
+def get_ipc_config():
+    config = dict(IPC_DEFAULTS)
+    for key, value in getattr(settings, 'SCHEDULER_CONFIG', {}).items():
+        if key.startswith(IPC_CONFIG_PREFIX):
+            config[key[len(IPC_CONFIG_PREFIX):]] = value
+
+    address = config['address']
+    if not address:
+        if os.name == 'posix':
+            address = str(Path(settings.BASE_DIR) / 'logs' / 'scheduler.sock')
+        else:
+            address = ('127.0.0.1', 47391)
+    elif isinstance(address, (list, tuple)):
+        address = (address[0], int(address[1]))
+    else:
+        address = str(address)
+    config['address'] = address
+    return config
+
+
+def _authkey():
+    return hmac.new(settings.SECRET_KEY.encode('utf-8'), b'job_scheduler.ipc', hashlib.sha256).digest()
+
+
+def _family(address):
+    return 'AF_UNIX' if isinstance(address, str) else 'AF_INET'
+
+
+class SchedulerIPCServer:
+    """在 daemon 中接受 IPC 請求；handlers 為 {指令: callable(**args)}"""
+
+    def __init__(self, handlers, address=None):
+        self.handlers = handlers
+        self.address = address or get_ipc_config()['address']
+        self._listener = None
+        self._thread = None
+        self._closed = threading.Event()
+
+    def start(self):
+        if _family(self.address) == 'AF_UNIX':
+            Path(self.address).parent.mkdir(parents=True, exist_ok=True)
+            if os.path.exists(self.address):
+                # 上一個 daemon 未正常結束留下的 socket；仍有 daemon 在接聽時不覆蓋
+                try:
+                    Client(self.address, family='AF_UNIX', authkey=_authkey()).close()
+                except OSError:
+                    os.unlink(self.address)
+                else:
+                    raise RuntimeError(f"Another scheduler daemon is listening on {self.address}")
+        self._listener = Listener(self.address, family=_family(self.address), authkey=_authkey())
+        if _family(self.address) == 'AF_UNIX':
+            os.chmod(self.address, 0o600)
+        self._thread = threading.Thread(target=self._accept_loop, name='scheduler-ipc', daemon=True)
+        self._thread.start()
+        logger.info(f"Scheduler IPC listening on {self.address}")
+
+    def _accept_loop(self):
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except Exception as e:
+                if self._closed.is_set():
+                    break
+                # 驗證失敗或客戶端中途斷線
+                logger.warning(f"IPC 連線失敗: {str(e)}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name='scheduler-ipc-request', daemon=True).start()
+
+    def _serve(self, conn):
+        from django.db import connection
+        try:
+            request = conn.recv()
+            command = request.get('command')
+            handler = self.handlers.get(command)
+            if handler is None:
+                reply = {'ok': False, 'error': f"unknown command: {command}"}
+            else:
+                try:
+                    reply = {'ok': True, 'result': handler(**(request.get('args') or {}))}
+                except Exception as e:
+                    logger.error(f"IPC 指令 {command} 執行失敗: {str(e)}")
+                    reply = {'ok': False, 'error': str(e)}
+            conn.send(reply)
+        except EOFError:
+            # 只確認 daemon 是否存在的連線 (例如另一個 daemon 啟動時的檢查)
+            pass
+        except (OSError, AttributeError) as e:
+            logger.warning(f"IPC 請求無效: {str(e)}")
+        finally:
+            conn.close()
+            connection.close()
+
+    def close(self):
+        self._closed.set()
+        if self._listener is not None:
+            # Listener.close() 會刪除 Unix socket 檔案
+            self._listener.close()
+
+
+def send_command(command, timeout=None, **args):
+    """送出指令給排程 daemon 並回傳結果"""
+    config = get_ipc_config()
+    address = config['address']
+    timeout = config['timeout'] if timeout is None else timeout
+    try:
+        conn = Client(address, family=_family(address), authkey=_authkey())
+    except (OSError, EOFError, AuthenticationError) as e:
+        raise SchedulerUnavailable(f"Scheduler daemon is not reachable at {address}: {e}") from e
+    try:
+        conn.send({'command': command, 'args': args})
+        if not conn.poll(timeout):
+            raise SchedulerUnavailable(f"Scheduler daemon did not answer {command} within {timeout} seconds")
+        reply = conn.recv()
+    except (OSError, EOFError) as e:
+        raise SchedulerUnavailable(f"Scheduler daemon connection lost: {e}") from e
+    finally:
+        conn.close()
+    if not reply.get('ok'):
+        raise SchedulerCommandError(reply.get('error') or 'unknown error')
+    return reply.get('result')
+
+
+def request_reload():
+    """通知 daemon 立即套用任務變更；daemon 未執行時由它下次啟動或輪詢時套用"""
+    try:
+        return send_command('reload', timeout=1)
+    except (SchedulerUnavailable, SchedulerCommandError) as e:
+        logger.debug(f"無法通知排程 daemon 重新載入: {str(e)}")
+        return None
+
+
+def abort_execution(execution):
+    """
+    中止執行，回傳是否成功
+    優先交給 daemon (引擎行程在它那裡)；daemon 無法連線時在本行程中止 (依 pid 送出訊號)
+    """
+    try:
+        aborted = send_command('abort', execution_id=str(execution.execution_id))
+    except SchedulerUnavailable:
+        return execution.abort()
+    execution.refresh_from_db()
+    return aborted
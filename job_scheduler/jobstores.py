@@ -0,0 +1,42 @@
+"""
+APScheduler job store：與 DjangoJobStore 使用同一組資料表，但寫入交給寫入執行緒 (db_writer.py)
+
+排程執行緒觸發任務後更新下次執行時間 (update_job) 時會等待寫入提交；
+觸發與執行結果的紀錄 (DjangoJobExecution) 則不等待。
+"""
+from django_apscheduler.jobstores import DjangoJobStore
+
+from .db_writer import get_db_writer
+
+
+def _unwrapped(method):
+    # DjangoJobStore 的方法遇到 OperationalError 會關閉連線後重試，
+    # 在寫入執行緒的批次交易中會讓整批回滾；鎖定的重試改由寫入執行緒處理
+    return getattr(method, '__wrapped__', method)
+
+
+class WriteBehindJobStore(DjangoJobStore):
+
+    def add_job(self, job):
+        get_db_writer().call(_unwrapped(DjangoJobStore.add_job), self, job)
+
+    def update_job(self, job):
+        get_db_writer().call(_unwrapped(DjangoJobStore.update_job), self, job)
+
+    def remove_job(self, job_id):
+        get_db_writer().call(_unwrapped(DjangoJobStore.remove_job), self, job_id)
+
+    def remove_all_jobs(self):
+        get_db_writer().call(_unwrapped(DjangoJobStore.remove_all_jobs), self)
+
+    @classmethod
+    def handle_submission_event(cls, event):
+        get_db_writer().submit(DjangoJobStore.handle_submission_event.__func__, cls, event)
+
+    @classmethod
+    def handle_execution_event(cls, event):
+        get_db_writer().submit(DjangoJobStore.handle_execution_event.__func__, cls, event)
+
+    @classmethod
+    def handle_error_event(cls, event):
+        get_db_writer().submit(DjangoJobStore.handle_error_event.__func__, cls, event)
@@ -0,0 +1,231 @@
+"""
+排程器 leader 選舉 (資料庫租約)
+
+每個啟動排程器的行程 (例如多個 gunicorn worker) 都會參與選舉，但只有持有
+SchedulerLease 的行程啟動 APScheduler 並派發任務，避免同一個任務被多個行程觸發。
+
+- leader 每 lease.renew_interval 秒續約一次，租約期限為 lease.ttl 秒
+- 其他行程以相同間隔嘗試取得已過期的租約；leader 結束或停止續約後，
+  最遲約 ttl + renew_interval 秒由其他行程接手
+- 取得與續約都是單一的條件式 UPDATE，不需要先讀後寫的交易
+- leader 在本機計算的期限 (比資料庫中的期限早 renew_interval / 2) 前無法續約時，
+  自行停止派發；execute_job 觸發時也會再確認，舊 leader 不會在新 leader 接手後繼續派發
+- 行程正常結束時釋放租約，其他行程在下一次嘗試時即可接手
+
+租約時間以各行程的 timezone.now() 比較，多台主機時各主機的時鐘誤差需小於 renew_interval / 2。
+租約的寫入不經過寫入執行緒 (db_writer.py)：不參與派發的行程也需要寫入，且續約不應排在批次寫入之後。
+
+設定值讀取自 settings.SCHEDULER_CONFIG 中以 "lease." 開頭的鍵。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection
+from django.db.models import F, Q
+from django.utils import timezone
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from .db_writer import get_db_writer
+from .models import SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+LEASE_CONFIG_PREFIX = 'lease.'
+
+LEASE_DEFAULTS = {
+    'name': 'scheduler',
+    'ttl': 30,              # 秒；leader 停止續約後，租約在此時間後過期
+    'renew_interval': 10,   # 秒；leader 續約與其他行程嘗試取得租約的間隔
+}
+
+_election = None
+_election_lock = threading.Lock()
+
+
+def get_lease_config():
+    config = dict(LEASE_DEFAULTS)
+    for key, value in getattr(settings, 'SCHEDULER_CONFIG', {}).items():
+        if key.startswith(LEASE_CONFIG_PREFIX):
+            config[key[len(LEASE_CONFIG_PREFIX):]] = value
+    return config
+
+
+class LeaderElection:
+    """
+    以 SchedulerLease 選出唯一的 leader
+    成為 leader 時呼叫 on_elected()，失去 leader 身分或停止時呼叫 on_demoted()；
+    兩者依序在同一個執行緒中執行，不會延誤續約
+    """
+
+    def __init__(self, on_elected, on_demoted, name='scheduler', ttl=30, renew_interval=10):
+        if renew_interval * 2 > ttl:
+            raise ValueError("lease.ttl must be at least twice lease.renew_interval")
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.name = name
+        self.ttl = ttl
+        self.renew_interval = renew_interval
+        self.identity = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.term = None
+        self._leader = False
+        self._valid_until = 0.0
+        self._stopped = threading.Event()
+        self._thread = None
+        # on_elected 可能需要數秒 (載入全部任務)，在另一個執行緒執行
+        self._transitions = ThreadPoolExecutor(max_workers=1, thread_name_prefix='scheduler-leader')
+
+    @classmethod
+    def from_settings(cls, on_elected, on_demoted):
+        config = get_lease_config()
+        return cls(
+            on_elected, on_demoted,
+            name=config['name'],
+            ttl=float(config['ttl']),
+            renew_interval=float(config['renew_interval']),
+        )
+
+    def is_leader(self):
+        """本行程目前是否可以派發任務"""
+        return self._leader and time.monotonic() < self._valid_until
+
+    def _try_acquire(self):
+        """續約或取得過期的租約，回傳是否持有租約"""
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        leases = SchedulerLease.objects.filter(name=self.name)
+        renewed = leases.filter(holder=self.identity, expires_at__gt=now).update(
+            renewed_at=now, expires_at=expires_at
+        )
+        if renewed:
+            return True
+
+        taken = leases.filter(Q(expires_at__isnull=True) | Q(expires_at__lte=now)).update(
+            holder=self.identity, term=F('term') + 1, acquired_at=now, renewed_at=now, expires_at=expires_at
+        )
+        if not taken and not leases.exists():
+            try:
+                SchedulerLease.objects.create(
+                    name=self.name, holder=self.identity, term=1,
+                    acquired_at=now, renewed_at=now, expires_at=expires_at
+                )
+                taken = 1
+            except IntegrityError:
+                # 另一個行程同時建立了租約
+                taken = 0
+        if taken:
+            self.term = leases.values_list('term', flat=True).first()
+        return bool(taken)
+
+    def _elect(self):
+        self._leader = True
+        try:
+            self._transitions.submit(self._run_callback, self.on_elected, 'on_elected')
+        except RuntimeError:
+            # 行程正在結束，不再啟動排程器
+            self._leader = False
+            self._release()
+            return
+        logger.info(f"取得排程器 leader 租約 {self.name} (term {self.term}, {self.identity})")
+
+    def _demote(self, reason):
+        if not self._leader:
+            return
+        logger.warning(f"失去排程器 leader 身分 ({reason})，停止派發任務")
+        self._leader = False
+        try:
+            self._transitions.submit(self._run_callback, self.on_demoted, 'on_demoted')
+        except RuntimeError:
+            # 行程正在結束，由 stop() 停止派發
+            self._leader = True
+
+    def _run_callback(self, callback, name):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"排程器 leader {name} 執行失敗: {str(e)}")
+            if name == 'on_elected':
+                # 無法啟動排程器：釋放租約讓其他行程接手
+                self._leader = False
+                self._release()
+        finally:
+            connection.close()
+
+    def _tick(self):
+        started = time.monotonic()
+        try:
+            held = self._try_acquire()
+        except Exception as e:
+            # 資料庫暫時無法寫入：維持目前狀態，直到本機計算的期限到期
+            logger.warning(f"更新排程器 leader 租約失敗: {str(e)}")
+            held = None
+
+        if held:
+            # 以送出 UPDATE 前的時間計算，本機期限一定早於資料庫中的期限
+            self._valid_until = started + self.ttl - self.renew_interval / 2
+            if not self._leader:
+                self._elect()
+        elif held is False:
+            self._demote('租約已由其他行程取得')
+        if self._leader and time.monotonic() >= self._valid_until:
+            self._demote('無法在期限內續約')
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                self._tick()
+                self._stopped.wait(self.renew_interval)
+        finally:
+            connection.close()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='scheduler-lease', daemon=True)
+        self._thread.start()
+
+    def _release(self):
+        try:
+            SchedulerLease.objects.filter(name=self.name, holder=self.identity).update(expires_at=timezone.now())
+        except Exception as e:
+            logger.warning(f"釋放排程器 leader 租約失敗: {str(e)}")
+
+    def stop(self):
+        """停止參與選舉；是 leader 時先停止派發再釋放租約"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.renew_interval + 5)
+        # 等待進行中的 on_elected / on_demoted；行程結束時已無法再排入新的工作，直接在這裡停止派發
+        self._transitions.shutdown(wait=True)
+        if self._leader:
+            self._leader = False
+            logger.info(f"釋放排程器 leader 租約 {self.name}")
+            self._run_callback(self.on_demoted, 'on_demoted')
+            self._release()
+
+
+def start_leader_election(on_elected, on_demoted):
+    """啟動本行程的選舉 (同一行程只會啟動一次)；行程結束時釋放租約"""
+    global _election
+    with _election_lock:
+        if _election is None:
+            # 先建立寫入執行緒：atexit 依註冊的相反順序執行，停止派發的寫入要在寫入執行緒關閉前送出
+            get_db_writer()
+            _election = LeaderElection.from_settings(on_elected, on_demoted)
+            _election.start()
+            atexit.register(_election.stop)
+        return _election
+
+
+def is_scheduler_leader():
+    """未啟動選舉 (例如直接呼叫 init_scheduler) 時視為 leader"""
+    return _election is None or _election.is_leader()
+
+
+def get_leader_election():
+    return _election
@@ -0,0 +1,327 @@
+"""
+執行記錄檔儲存 (Execution log store)
+
+每筆執行的引擎輸出寫入獨立目錄下的分段檔：
+    <root>/<execution_id>/seg-000000.log      寫入中的分段
+    <root>/<execution_id>/seg-000000.log.gz   已封存 (壓縮) 的分段
+    <root>/<execution_id>/index.json          分段索引 (起始位移、長度、行數)
+
+位移 (offset) 皆以未壓縮的 UTF-8 位元組計算，可做 tail 與區間讀取。
+JobExecution 只保存指標 (log_path)、大小與最後幾行摘要，資料庫不再隨輸出成長。
+"""
+from collections import OrderedDict
+from pathlib import Path
+from django.conf import settings
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = 'index.json'
+
+LOG_STORE_DEFAULTS = {
+    'root': None,                    # None 表示 BASE_DIR / 'logs' / 'executions'
+    'segment_bytes': 1024 * 1024,    # 單一分段大小上限
+    'retention_days': 30,
+    'max_total_mb': 1024,
+    'summary_lines': 20,             # 保存在 JobExecution.output 的最後幾行
+    'sealed_cache_segments': 8,      # 快取解壓縮後的封存分段數 (記憶體約為 segment_bytes 的倍數)
+}
+
+
+def get_log_store_config():
+    config = dict(LOG_STORE_DEFAULTS)
+    config.update(getattr(settings, 'EXECUTION_LOG_STORE', {}))
+    if not config['root']:
+        config['root'] = Path(settings.BASE_DIR) / 'logs' / 'executions'
+    return config
+
+
+def _segment_name(number):
+    return f'seg-{number:06d}.log'
+
+
+class ExecutionLogWriter:
+    """附加寫入單筆執行的記錄檔；寫滿一個分段後壓縮封存"""
+
+    def __init__(self, store, execution_id):
+        self.store = store
+        self.execution_id = str(execution_id)
+        self.path = store.path_for(execution_id)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = store.read_index(execution_id) or {
+            'segments': [], 'size': 0, 'lines': 0, 'closed': False
+        }
+        self._file = None
+        self._open_active_segment()
+
+    def _open_active_segment(self):
+        segments = self._index['segments']
+        if not segments or segments[-1]['sealed']:
+            segments.append({
+                'name': _segment_name(len(segments)),
+                'start': self._index['size'],
+                'length': 0,
+                'lines': 0,
+                'sealed': False,
+            })
+            self._write_index()
+        self._file = open(self.path / segments[-1]['name'], 'ab')
+
+    def _write_index(self):
+        tmp = self.path / (INDEX_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f)
+        os.replace(tmp, self.path / INDEX_FILE)
+
+    @property
+    def size(self):
+        return self._index['size']
+
+    @property
+    def lines(self):
+        return self._index['lines']
+
+    def append(self, text):
+        data = text.encode('utf-8')
+        if not data:
+            return
+        with self._lock:
+            segment = self._index['segments'][-1]
+            line_count = data.count(b'\n')
+            self._file.write(data)
+            self._file.flush()
+            segment['length'] += len(data)
+            segment['lines'] += line_count
+            self._index['size'] += len(data)
+            self._index['lines'] += line_count
+            if segment['length'] >= self.store.segment_bytes:
+                self._seal_active_segment()
+                self._open_active_segment()
+
+    def _seal_active_segment(self):
+        segment = self._index['segments'][-1]
+        self._file.close()
+        self._file = None
+        source = self.path / segment['name']
+        sealed = self.path / (segment['name'] + '.gz')
+        tmp = self.path / (segment['name'] + '.gz.tmp')
+        with open(source, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp, sealed)
+        segment['name'] = sealed.name
+        segment['sealed'] = True
+        # 先發布新的索引再刪除原檔；讀取端已載入舊索引時會改讀 .gz (LogStore._read_segment)
+        self._write_index()
+        source.unlink()
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            segment = self._index['segments'][-1]
+            if segment['length']:
+                self._seal_active_segment()
+            else:
+                self._file.close()
+                self._file = None
+                (self.path / segment['name']).unlink(missing_ok=True)
+                self._index['segments'].pop()
+            self._index['closed'] = True
+            self._write_index()
+
+
+class LogStore:
+    """執行記錄檔的讀寫與保留期限管理"""
+
+    def __init__(self, root, segment_bytes=LOG_STORE_DEFAULTS['segment_bytes'],
+                 sealed_cache_segments=LOG_STORE_DEFAULTS['sealed_cache_segments']):
+        self.root = Path(root)
+        self.segment_bytes = segment_bytes
+        # 封存的分段不會再改變；執行中持續輪詢 tail / 區間時不必每次重新解壓縮
+        self.sealed_cache_segments = sealed_cache_segments
+        self._sealed_cache = OrderedDict()
+        self._sealed_cache_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        config = get_log_store_config()
+        return cls(
+            config['root'], segment_bytes=int(config['segment_bytes']),
+            sealed_cache_segments=int(config['sealed_cache_segments']),
+        )
+
+    def path_for(self, execution_id):
+        return self.root / str(execution_id)
+
+    def writer(self, execution_id):
+        return ExecutionLogWriter(self, execution_id)
+
+    def read_index(self, execution_id):
+        try:
+            with open(self.path_for(execution_id) / INDEX_FILE, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _segments(self, execution_id):
+        """回傳 (segment, 實際長度)；寫入中的分段以檔案大小為準"""
+        index = self.read_index(execution_id)
+        if index is None:
+            return []
+        result = []
+        for segment in index['segments']:
+            length = segment['length']
+            if not segment['sealed']:
+                try:
+                    length = (self.path_for(execution_id) / segment['name']).stat().st_size
+                except FileNotFoundError:
+                    # 讀取索引後分段已封存
+                    length = len(self._sealed_data(execution_id, segment['name'] + '.gz') or b'')
+                except OSError:
+                    length = 0
+            result.append((segment, length))
+        return result
+
+    def size(self, execution_id):
+        segments = self._segments(execution_id)
+        if not segments:
+            return 0
+        last, length = segments[-1]
+        return last['start'] + length
+
+    def _sealed_data(self, execution_id, name):
+        """解壓縮後的封存分段 (LRU 快取)；檔案不存在時回傳 None"""
+        key = (str(execution_id), name)
+        with self._sealed_cache_lock:
+            data = self._sealed_cache.get(key)
+            if data is not None:
+                self._sealed_cache.move_to_end(key)
+                return data
+        try:
+            with gzip.open(self.path_for(execution_id) / name, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._sealed_cache_lock:
+            self._sealed_cache[key] = data
+            while len(self._sealed_cache) > self.sealed_cache_segments:
+                self._sealed_cache.popitem(last=False)
+        return data
+
+    def _read_segment(self, execution_id, segment, start, end):
+        if segment['sealed']:
+            data = self._sealed_data(execution_id, segment['name'])
+        else:
+            try:
+                with open(self.path_for(execution_id) / segment['name'], 'rb') as f:
+                    f.seek(start)
+                    return f.read(end - start)
+            except FileNotFoundError:
+                # 讀取索引後寫入端已封存這個分段 (壓縮後刪除原檔)
+                data = self._sealed_data(execution_id, segment['name'] + '.gz')
+        if data is None:
+            raise FileNotFoundError(f"Log segment {segment['name']} of {execution_id} is missing")
+        return data[start:end]
+
+    def read_range(self, execution_id, start=0, end=None, whole_lines=False):
+        """
+        讀取 [start, end) 位元組區間，回傳 (文字, 實際結束位移)
+        whole_lines 為 True 時截到最後一個換行，避免切斷多位元組字元
+        """
+        chunks = []
+        position = start
+        for segment, length in self._segments(execution_id):
+            seg_start, seg_end = segment['start'], segment['start'] + length
+            if end is not None and seg_start >= end:
+                break
+            if seg_end <= start:
+                continue
+            read_start = max(start, seg_start) - seg_start
+            read_end = (min(end, seg_end) if end is not None else seg_end) - seg_start
+            data = self._read_segment(execution_id, segment, read_start, read_end)
+            chunks.append(data)
+            position = seg_start + read_start + len(data)
+        data = b''.join(chunks)
+        if whole_lines and data and not data.endswith(b'\n'):
+            cut = data.rfind(b'\n') + 1
+            if cut:
+                position -= len(data) - cut
+                data = data[:cut]
+        return data.decode('utf-8', errors='replace'), position
+
+    def tail(self, execution_id, max_bytes=64 * 1024, lines=None):
+        """讀取最後 max_bytes 位元組；指定 lines 時只回傳最後幾行"""
+        total = self.size(execution_id)
+        text, _ = self.read_range(execution_id, max(0, total - max_bytes), total)
+        if lines is not None:
+            text = ''.join(text.splitlines(keepends=True)[-lines:])
+        return text
+
+    def delete(self, execution_id):
+        shutil.rmtree(self.path_for(execution_id), ignore_errors=True)
+        with self._sealed_cache_lock:
+            for key in [key for key in self._sealed_cache if key[0] == str(execution_id)]:
+                del self._sealed_cache[key]
+
+    def apply_retention(self, max_age_days=None, max_total_bytes=None):
+        """
+        刪除超過保留天數的記錄；總量超過上限時再從最舊的開始刪除
+        只處理已關閉 (執行結束) 的記錄，回傳刪除的 execution_id 清單
+        """
+        if not self.root.exists():
+            return []
+
+        entries = []
+        for path in self.root.iterdir():
+            index = self.read_index(path.name)
+            if not path.is_dir() or index is None or not index.get('closed'):
+                continue
+            try:
+                mtime = (path / INDEX_FILE).stat().st_mtime
+                disk_bytes = sum(f.stat().st_size for f in path.iterdir())
+            except OSError:
+                continue
+            entries.append((mtime, path.name, disk_bytes))
+        entries.sort()
+
+        removed = []
+        cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+        total = sum(entry[2] for entry in entries)
+        for mtime, execution_id, disk_bytes in entries:
+            too_old = cutoff is not None and mtime < cutoff
+            too_big = max_total_bytes is not None and total > max_total_bytes
+            if not (too_old or too_big):
+                continue
+            self.delete(execution_id)
+            total -= disk_bytes
+            removed.append(execution_id)
+        if removed:
+            logger.info(f"已刪除 {len(removed)} 筆過期的執行記錄檔")
+        return removed
+
+
+_log_store = None
+
+
+def get_log_store():
+    global _log_store
+    if _log_store is None:
+        _log_store = LogStore.from_settings()
+    return _log_store
+
+
+def purge_execution_logs():
+    """排程使用：依設定的保留天數與總量上限清除執行記錄檔"""
+    config = get_log_store_config()
+    max_total_mb = config['max_total_mb']
+    get_log_store().apply_retention(
+        max_age_days=config['retention_days'],
+        max_total_bytes=max_total_mb * 1024 * 1024 if max_total_mb else None,
+    )
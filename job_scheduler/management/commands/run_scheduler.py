@@ -0,0 +1,49 @@
+"""
+python manage.py run_scheduler
+
+獨立執行排程 daemon (job_scheduler/daemon.py)；SIGTERM / SIGINT 時排空執行中的任務後結束
+"""
+from django.core.management.base import BaseCommand
+import signal
+import threading
+
+from job_scheduler.daemon import DEFAULT_DRAIN_TIMEOUT, SchedulerDaemon
+
+
+class Command(BaseCommand):
+    help = "Run the job scheduler daemon (dispatch, engine workers and the IPC endpoint used by the web tier)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--drain-timeout', type=float, default=DEFAULT_DRAIN_TIMEOUT,
+            help='Seconds to wait for running jobs on shutdown before aborting them',
+        )
+        parser.add_argument(
+            '--ipc-address', default=None,
+            help='Unix socket path or host:port to listen on (default: SCHEDULER_CONFIG["ipc.address"])',
+        )
+
+    def handle(self, *args, drain_timeout, ipc_address, **options):
+        if ipc_address and ':' in ipc_address and '/' not in ipc_address:
+            host, port = ipc_address.rsplit(':', 1)
+            ipc_address = (host, int(port))
+
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(f"Received signal {signum}, draining running jobs")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        daemon = SchedulerDaemon(drain_timeout=drain_timeout, ipc_address=ipc_address)
+        daemon.start()
+        self.stdout.write(f"Scheduler daemon running, IPC on {daemon.ipc.address}")
+        try:
+            # 逾時等待讓主執行緒能處理訊號
+            while not stop.wait(1):
+                pass
+        finally:
+            daemon.stop()
+        self.stdout.write("Scheduler daemon stopped")
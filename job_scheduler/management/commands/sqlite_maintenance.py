@@ -0,0 +1,30 @@
+"""
+python manage.py sqlite_maintenance
+
+立即執行 SQLite 維護 (排程 daemon 每小時也會執行一次)，並將 journal_mode 切換為 SQLITE_PROFILE 的設定；
+--enable-incremental-vacuum 將既有的資料庫轉為 auto_vacuum=INCREMENTAL (完整 VACUUM，期間其他行程無法寫入)
+"""
+from django.core.management.base import BaseCommand
+import json
+
+from static.utils import sqlite_profile
+
+
+class Command(BaseCommand):
+    help = "Run SQLite maintenance: ANALYZE (PRAGMA optimize), incremental vacuum and WAL checkpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--enable-incremental-vacuum', action='store_true',
+            help='Switch auto_vacuum to INCREMENTAL first; rewrites the whole database with VACUUM',
+        )
+
+    def handle(self, *args, database, enable_incremental_vacuum, **options):
+        if enable_incremental_vacuum and sqlite_profile.enable_incremental_vacuum(using=database):
+            self.stdout.write("auto_vacuum switched to INCREMENTAL")
+        journal_mode = sqlite_profile.apply_journal_mode(using=database)
+        if journal_mode:
+            self.stdout.write(f"journal_mode: {journal_mode}")
+        result = sqlite_profile.run_sqlite_maintenance(using=database)
+        self.stdout.write(json.dumps(result, indent=2))
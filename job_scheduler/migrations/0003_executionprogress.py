@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "job_scheduler",
+            "0002_jobexecution_duration_alter_jobexecution_error_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ExecutionProgress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("seq", models.PositiveIntegerField()),
+                (
+                    "event",
+                    models.CharField(
+                        choices=[("progress", "Progress"), ("status", "Status")],
+                        default="progress",
+                        max_length=20,
+                    ),
+                ),
+                ("percent", models.FloatField(blank=True, null=True)),
+                ("message", models.CharField(blank=True, default="", max_length=255)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "execution",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="progress_events",
+                        to="job_scheduler.jobexecution",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Execution Progress",
+                "verbose_name_plural": "Execution Progress",
+                "db_table": "job_execution_progress",
+                "ordering": ["execution", "seq"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("execution", "seq"),
+                        name="unique_execution_progress_seq",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0003_executionprogress"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobexecution",
+            name="discarded_percent",
+            field=models.FloatField(
+                blank=True,
+                help_text="Progress reached before the execution was aborted",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="jobexecution",
+            name="hostname",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="jobexecution",
+            name="pid",
+            field=models.IntegerField(
+                blank=True,
+                help_text="Engine process (group) id while running",
+                null=True,
+            ),
+        ),
+    ]
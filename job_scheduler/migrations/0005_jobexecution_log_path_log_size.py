@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0004_jobexecution_pid_hostname_discarded_percent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobexecution",
+            name="log_path",
+            field=models.CharField(
+                blank=True,
+                default="",
+                help_text="Location of the full engine output in the execution log store",
+                max_length=255,
+            ),
+        ),
+        migrations.AddField(
+            model_name="jobexecution",
+            name="log_size",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="jobexecution",
+            name="output",
+            field=models.TextField(
+                blank=True, help_text="Last lines of the engine output", null=True
+            ),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_job_status(apps, schema_editor):
+    """依現有的執行記錄建立每個任務的狀態摘要"""
+    JobScheduler = apps.get_model("job_scheduler", "JobScheduler")
+    JobExecution = apps.get_model("job_scheduler", "JobExecution")
+    JobStatus = apps.get_model("job_scheduler", "JobStatus")
+
+    for job in JobScheduler.objects.all():
+        executions = JobExecution.objects.filter(job_id=job.job_id).order_by(
+            "-start_time"
+        )
+        latest = executions.first()
+        status = JobStatus(
+            job_id=job.job_id,
+            next_fire_time=job.next_run_time if job.enabled else None,
+            version=1,
+        )
+        if latest is not None:
+            status.last_execution_id = latest.execution_id
+            status.last_status = latest.status
+            status.last_start_time = latest.start_time
+            status.last_end_time = latest.end_time
+            status.last_duration = latest.duration
+            status.last_error = latest.error
+            for execution_status in executions.exclude(status="aborted").values_list(
+                "status", flat=True
+            ):
+                if execution_status != "failed":
+                    break
+                status.consecutive_failures += 1
+        status.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0005_jobexecution_log_path_log_size"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobStatus",
+            fields=[
+                (
+                    "job",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="status_summary",
+                        serialize=False,
+                        to="job_scheduler.jobscheduler",
+                    ),
+                ),
+                ("last_execution_id", models.UUIDField(blank=True, null=True)),
+                (
+                    "last_status",
+                    models.CharField(db_index=True, default="never_run", max_length=20),
+                ),
+                ("last_start_time", models.DateTimeField(blank=True, null=True)),
+                ("last_end_time", models.DateTimeField(blank=True, null=True)),
+                ("last_duration", models.DurationField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True, null=True)),
+                ("consecutive_failures", models.PositiveIntegerField(default=0)),
+                (
+                    "next_fire_time",
+                    models.DateTimeField(blank=True, db_index=True, null=True),
+                ),
+                (
+                    "version",
+                    models.PositiveBigIntegerField(
+                        default=0, help_text="Incremented on every change"
+                    ),
+                ),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "verbose_name": "Job Status",
+                "verbose_name_plural": "Job Status",
+                "db_table": "job_status",
+            },
+        ),
+        migrations.RunPython(backfill_job_status, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0006_jobstatus"),
+        (
+            "program",
+            "0003_alter_program_description_alter_program_program_name_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="jobscheduler",
+            index=models.Index(
+                fields=["-created_at", "-job_id"], name="job_scheduler_list_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0007_jobscheduler_list_idx"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobChange",
+            fields=[
+                ("seq", models.BigAutoField(primary_key=True, serialize=False)),
+                ("job_id", models.IntegerField(db_index=True)),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[("save", "Save"), ("delete", "Delete")], max_length=10
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                "verbose_name": "Job Change",
+                "verbose_name_plural": "Job Changes",
+                "db_table": "job_change",
+                "ordering": ["seq"],
+            },
+        ),
+    ]
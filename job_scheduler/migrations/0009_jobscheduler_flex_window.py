@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0008_jobchange"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobscheduler",
+            name="flex_offset",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Delay in seconds assigned by the schedule planner inside the flex window",
+            ),
+        ),
+        migrations.AddField(
+            model_name="jobscheduler",
+            name="flex_window",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Minutes after the cron time within which the job may start (0 = run exactly on time)",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0009_jobscheduler_flex_window"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobexecution",
+            name="deadline",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="jobexecution",
+            name="deadline_missed",
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.AddField(
+            model_name="jobexecution",
+            name="queue_wait",
+            field=models.DurationField(
+                blank=True,
+                help_text="Time between the trigger firing and an engine slot picking the run up",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="jobscheduler",
+            name="deadline_time",
+            field=models.TimeField(
+                blank=True,
+                help_text="Local time by which each run should be complete (e.g. 07:00)",
+                null=True,
+            ),
+        ),
+        migrations.AddField(
+            model_name="jobscheduler",
+            name="priority",
+            field=models.IntegerField(
+                default=0, help_text="Higher runs first when engine slots are contended"
+            ),
+        ),
+        migrations.AddField(
+            model_name="jobstatus",
+            name="deadline_misses",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="jobstatus",
+            name="last_queue_wait",
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0010_priority_deadline"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobexecution",
+            name="refresh_coalesced",
+            field=models.BooleanField(
+                default=False,
+                help_text="Reused a refresh started by another execution instead of refreshing again",
+            ),
+        ),
+        migrations.CreateModel(
+            name="DatasetRefresh",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dataset_id", models.CharField(db_index=True, max_length=100)),
+                ("workspace_id", models.CharField(max_length=100)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("running", "Running"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        db_index=True,
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("started_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "leader",
+                    models.ForeignKey(
+                        blank=True,
+                        help_text="Execution that performed the refresh",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="led_refreshes",
+                        to="job_scheduler.jobexecution",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Dataset Refresh",
+                "verbose_name_plural": "Dataset Refreshes",
+                "db_table": "dataset_refresh",
+                "ordering": ["-started_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="jobexecution",
+            name="dataset_refresh",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Dataset refresh this execution performed or attached to",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="executions",
+                to="job_scheduler.datasetrefresh",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="datasetrefresh",
+            index=models.Index(
+                fields=["dataset_id", "-started_at"], name="dataset_refresh_recent_idx"
+            ),
+        ),
+    ]
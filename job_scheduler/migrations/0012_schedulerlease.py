@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("job_scheduler", "0011_datasetrefresh"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SchedulerLease",
+            fields=[
+                (
+                    "name",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                (
+                    "holder",
+                    models.CharField(
+                        blank=True,
+                        default="",
+                        help_text="hostname:pid:uuid of the leader",
+                        max_length=255,
+                    ),
+                ),
+                (
+                    "term",
+                    models.PositiveBigIntegerField(
+                        default=0,
+                        help_text="Incremented every time leadership changes hands",
+                    ),
+                ),
+                ("acquired_at", models.DateTimeField(blank=True, null=True)),
+                ("renewed_at", models.DateTimeField(blank=True, null=True)),
+                ("expires_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Scheduler Lease",
+                "verbose_name_plural": "Scheduler Leases",
+                "db_table": "scheduler_lease",
+            },
+        ),
+    ]
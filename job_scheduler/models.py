@@ -4,7 +4,6 @@ import uuid
 from django.core.exceptions import ValidationError
 from django.db import transaction
 from django.utils import timezone
-from apscheduler.triggers.cron import CronTrigger
 import logging
 
 logger = logging.getLogger(__name__)
@@ -25,6 +24,22 @@ class JobScheduler(models.Model):
         help_text='Cron expression for scheduling (e.g., "0 0 * * *" for daily at midnight)'
     )
     enabled = models.BooleanField(default=True, db_index=True)
+    flex_window = models.PositiveIntegerField(
+        default=0,
+        help_text='Minutes after the cron time within which the job may start (0 = run exactly on time)'
+    )
+    flex_offset = models.PositiveIntegerField(
+        default=0,
+        help_text='Delay in seconds assigned by the schedule planner inside the flex window'
+    )
+    priority = models.IntegerField(
+        default=0,
+        help_text='Higher runs first when engine slots are contended'
+    )
+    deadline_time = models.TimeField(
+        null=True, blank=True,
+        help_text='Local time by which each run should be complete (e.g. 07:00)'
+    )
     last_run_time = models.DateTimeField(null=True, blank=True, db_index=True)
     next_run_time = models.DateTimeField(null=True, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -37,14 +52,16 @@ class JobScheduler(models.Model):
         """
         Calculate the next execution time based on cron expression
         """
-        try:
-            trigger = CronTrigger.from_crontab(self.cron_expression)
-            next_time = trigger.get_next_fire_time(None, timezone.now())
-            logger.info(f"Current time: {timezone.now()}, Next run time: {next_time}")
-            return next_time
-        except Exception as e:
-            logger.error(f"Error calculating next run time: {str(e)}")
-            return None
+        # APScheduler 的 cron trigger 只在需要計算時載入
+        from .triggers import next_fire_time
+        return next_fire_time(self.cron_expression, offset=self.effective_offset)
+
+    @property
+    def effective_offset(self):
+        """實際套用的延遲秒數；未設定 flex window 時不延遲"""
+        if not self.flex_window:
+            return 0
+        return min(self.flex_offset, self.flex_window * 60)
 
     def save(self, *args, **kwargs):
         # Only calculate next_run_time if it's not set
@@ -53,16 +70,19 @@ class JobScheduler(models.Model):
         
         with transaction.atomic():
             super().save(*args, **kwargs)
+            JobStatus.sync_next_fire_time(self)
 
     class Meta:
         verbose_name = 'Scheduled Job'
         verbose_name_plural = 'Scheduled Jobs'
         ordering = ['-created_at']
         db_table = 'job_scheduler'
-        # indexes = [
-        #     models.Index(fields=['enabled', 'next_run_time']),
-        #     models.Index(fields=['program', 'enabled']),
-        # ]
+        indexes = [
+            # 任務列表 API 的 keyset 分頁順序
+            models.Index(fields=['-created_at', '-job_id'], name='job_scheduler_list_idx'),
+            # models.Index(fields=['enabled', 'next_run_time']),
+            # models.Index(fields=['program', 'enabled']),
+        ]
 
     def get_status_display(self):
         return 'Enabled' if self.enabled else 'Disabled'
@@ -90,20 +110,70 @@ class JobExecution(models.Model):
         default='running',
         db_index=True
     )
-    output = models.TextField(blank=True, null=True)
+    output = models.TextField(blank=True, null=True, help_text='Last lines of the engine output')
     error = models.TextField(blank=True, null=True)
+    log_path = models.CharField(
+        max_length=255, blank=True, default='',
+        help_text='Location of the full engine output in the execution log store'
+    )
+    log_size = models.BigIntegerField(default=0)
     is_aborted = models.BooleanField(default=False, db_index=True)
     duration = models.DurationField(null=True, blank=True)
+    pid = models.IntegerField(null=True, blank=True, help_text='Engine process (group) id while running')
+    hostname = models.CharField(max_length=255, blank=True, default='')
+    discarded_percent = models.FloatField(
+        null=True, blank=True,
+        help_text='Progress reached before the execution was aborted'
+    )
+    queue_wait = models.DurationField(
+        null=True, blank=True,
+        help_text='Time between the trigger firing and an engine slot picking the run up'
+    )
+    deadline = models.DateTimeField(null=True, blank=True)
+    deadline_missed = models.BooleanField(default=False, db_index=True)
+    dataset_refresh = models.ForeignKey(
+        'DatasetRefresh',
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='executions',
+        help_text='Dataset refresh this execution performed or attached to'
+    )
+    refresh_coalesced = models.BooleanField(
+        default=False,
+        help_text='Reused a refresh started by another execution instead of refreshing again'
+    )
 
     def abort(self):
-        """中止執行中的任務"""
-        if self.status == 'running':
-            self.status = 'aborted'
-            self.is_aborted = True
-            self.end_time = timezone.now()
-            self.save()
-            return True
-        return False
+        """
+        中止執行中的任務，並終止對應的引擎行程
+        與寫入執行結果相同，只在狀態仍為 running 時更新 (條件式 UPDATE)，
+        不會把剛完成或失敗的執行覆寫為 aborted；回傳是否已中止
+        """
+        from .process_registry import terminate_execution
+
+        last_percent = (
+            self.progress_events.filter(event='progress')
+            .order_by('-seq').values_list('percent', flat=True).first()
+        )
+        end_time = timezone.now()
+        with transaction.atomic():
+            updated = JobExecution.objects.filter(execution_id=self.execution_id, status='running').update(
+                status='aborted',
+                is_aborted=True,
+                end_time=end_time,
+                duration=end_time - self.start_time,
+                discarded_percent=last_percent or 0.0,
+            )
+            # 取得最新的狀態與引擎行程 (pid 由寫入執行緒非同步更新)
+            self.refresh_from_db(fields=[
+                'status', 'is_aborted', 'end_time', 'duration', 'discarded_percent', 'pid', 'hostname'
+            ])
+            if updated:
+                JobStatus.record_execution(self)
+        if not updated:
+            return False
+        terminate_execution(self.execution_id, pid=self.pid, hostname=self.hostname)
+        return True
 
     def __str__(self):
         return f"{self.job.job_name} - {self.execution_id} ({self.status})"
@@ -123,3 +193,202 @@ class JobExecution(models.Model):
         if self.end_time and self.start_time:
             self.duration = self.end_time - self.start_time
         super().save(*args, **kwargs)
+
+class ExecutionProgress(models.Model):
+    """引擎回報的進度事件，每筆執行只有數十筆，供 SSE 推送使用"""
+    EVENT_CHOICES = [
+        ('progress', 'Progress'),
+        ('status', 'Status'),
+    ]
+
+    execution = models.ForeignKey(
+        JobExecution,
+        on_delete=models.CASCADE,
+        related_name='progress_events'
+    )
+    seq = models.PositiveIntegerField()
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES, default='progress')
+    percent = models.FloatField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.execution_id} #{self.seq} {self.event} {self.percent}"
+
+    class Meta:
+        verbose_name = 'Execution Progress'
+        verbose_name_plural = 'Execution Progress'
+        ordering = ['execution', 'seq']
+        db_table = 'job_execution_progress'
+        constraints = [
+            models.UniqueConstraint(fields=['execution', 'seq'], name='unique_execution_progress_seq'),
+        ]
+
+class JobStatus(models.Model):
+    """
+    每個任務一筆的狀態摘要 (read model)
+    執行狀態改變時在同一個交易中更新，列表與狀態 API 不需再查詢 job_execution
+    """
+    job = models.OneToOneField(
+        JobScheduler,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='status_summary'
+    )
+    last_execution_id = models.UUIDField(null=True, blank=True)
+    last_status = models.CharField(max_length=20, default='never_run', db_index=True)
+    last_start_time = models.DateTimeField(null=True, blank=True)
+    last_end_time = models.DateTimeField(null=True, blank=True)
+    last_duration = models.DurationField(null=True, blank=True)
+    last_error = models.TextField(blank=True, null=True)
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    last_queue_wait = models.DurationField(null=True, blank=True)
+    deadline_misses = models.PositiveIntegerField(default=0)
+    next_fire_time = models.DateTimeField(null=True, blank=True, db_index=True)
+    version = models.PositiveBigIntegerField(default=0, help_text='Incremented on every change')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.job_id} ({self.last_status})"
+
+    @classmethod
+    def sync_next_fire_time(cls, job):
+        """任務設定變更後同步下次執行時間；停用的任務沒有下次執行時間"""
+        next_fire_time = job.next_run_time if job.enabled else None
+        updated = cls.objects.filter(job_id=job.job_id).update(
+            next_fire_time=next_fire_time,
+            version=models.F('version') + 1,
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            cls.objects.create(job_id=job.job_id, next_fire_time=next_fire_time, version=1)
+
+    @classmethod
+    def record_execution(cls, execution):
+        """
+        依執行記錄的目前狀態更新摘要，需在更新 execution 的同一個交易中呼叫
+        - running: 記錄開始時間，並更新任務的 last_run_time / next_run_time
+        - failed: 連續失敗次數加一；completed: 歸零；aborted: 不變
+        同一狀態重複呼叫不會重複計算；較舊的執行晚結束時不覆寫較新的執行
+        """
+        status, _ = cls.objects.select_for_update().get_or_create(job_id=execution.job_id)
+        same_execution = status.last_execution_id == execution.execution_id
+        if same_execution and status.last_status == execution.status:
+            return status
+        if (not same_execution and status.last_start_time
+                and execution.start_time < status.last_start_time):
+            return status
+
+        status.last_execution_id = execution.execution_id
+        status.last_status = execution.status
+        status.last_start_time = execution.start_time
+        status.last_end_time = execution.end_time
+        status.last_duration = (
+            execution.end_time - execution.start_time if execution.end_time else None
+        )
+        status.last_error = execution.error
+        status.last_queue_wait = execution.queue_wait
+        if execution.deadline_missed:
+            status.deadline_misses += 1
+        if execution.status == 'failed':
+            status.consecutive_failures += 1
+        elif execution.status == 'completed':
+            status.consecutive_failures = 0
+
+        if execution.status == 'running':
+            job = JobScheduler.objects.only('cron_expression', 'enabled').get(job_id=execution.job_id)
+            next_run_time = job.calculate_next_run_time()
+            JobScheduler.objects.filter(job_id=execution.job_id).update(
+                last_run_time=execution.start_time,
+                next_run_time=next_run_time,
+            )
+            status.next_fire_time = next_run_time if job.enabled else None
+
+        status.version += 1
+        status.save()
+        return status
+
+    class Meta:
+        verbose_name = 'Job Status'
+        verbose_name_plural = 'Job Status'
+        db_table = 'job_status'
+
+class JobChange(models.Model):
+    """
+    任務設定的變更紀錄 (change feed)
+    seq 為遞增的版本號；排程行程記住已處理的 seq，只重新套用有變更的任務
+    """
+    ACTION_CHOICES = [
+        ('save', 'Save'),
+        ('delete', 'Delete'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    job_id = models.IntegerField(db_index=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"#{self.seq} {self.action} job {self.job_id}"
+
+    class Meta:
+        verbose_name = 'Job Change'
+        verbose_name_plural = 'Job Changes'
+        ordering = ['seq']
+        db_table = 'job_change'
+
+class DatasetRefresh(models.Model):
+    """
+    一次 Power BI dataset 重新整理
+    共用同一個 dataset_id 的執行在重新整理進行中或剛完成時會共用這一筆，不再重複重新整理
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    dataset_id = models.CharField(max_length=100, db_index=True)
+    workspace_id = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running', db_index=True)
+    leader = models.ForeignKey(
+        JobExecution,
+        on_delete=models.SET_NULL,
+        null=True, blank=True,
+        related_name='led_refreshes',
+        help_text='Execution that performed the refresh'
+    )
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.dataset_id} ({self.status})"
+
+    class Meta:
+        verbose_name = 'Dataset Refresh'
+        verbose_name_plural = 'Dataset Refreshes'
+        ordering = ['-started_at']
+        db_table = 'dataset_refresh'
+        indexes = [
+            models.Index(fields=['dataset_id', '-started_at'], name='dataset_refresh_recent_idx'),
+        ]
+
+class SchedulerLease(models.Model):
+    """
+    排程器 leader 租約 (job_scheduler/leader.py)
+    同一時間只有持有未過期租約的行程啟動 APScheduler 並派發任務
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.CharField(max_length=255, blank=True, default='', help_text='hostname:pid:uuid of the leader')
+    term = models.PositiveBigIntegerField(default=0, help_text='Incremented every time leadership changes hands')
+    acquired_at = models.DateTimeField(null=True, blank=True)
+    renewed_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.holder or '-'} (term {self.term})"
+
+    class Meta:
+        verbose_name = 'Scheduler Lease'
+        verbose_name_plural = 'Scheduler Leases'
+        db_table = 'scheduler_lease'
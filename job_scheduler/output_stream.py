@@ -0,0 +1,96 @@
+"""
+引擎輸出串流寫入
+
+引擎的 stdout/stderr 逐行讀取後先放在有上限的緩衝區，
+累積到一定行數、位元組數或時間後附加到執行記錄檔 (log_store.py)。
+執行期間可透過記錄檔 API 讀取輸出；資料庫只定期更新 log_size，
+結束時在 JobExecution.output 保存最後幾行摘要。
+"""
+import logging
+import threading
+import time
+
+from .db_writer import get_db_writer
+from .log_store import get_log_store, get_log_store_config
+from .models import JobExecution
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionOutputWriter:
+    """將輸出批次寫入指定 JobExecution 的記錄檔"""
+
+    def __init__(self, execution_id, max_lines=50, max_bytes=64 * 1024, flush_interval=2.0,
+                 store=None, summary_lines=None):
+        self.execution_id = execution_id
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.store = store or get_log_store()
+        self.summary_lines = summary_lines or get_log_store_config()['summary_lines']
+        self._log = self.store.writer(execution_id)
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._last_flush = time.monotonic()
+        self._reported_size = None
+        self._lock = threading.Lock()
+        get_db_writer().submit(JobExecution.objects.filter(execution_id=execution_id).update, log_path=str(execution_id))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def lines_written(self):
+        return self._log.lines
+
+    @property
+    def bytes_written(self):
+        return self._log.size
+
+    def write(self, line):
+        """附加一行輸出 (可由多個執行緒呼叫)"""
+        if not line.endswith('\n'):
+            line += '\n'
+        with self._lock:
+            self._buffer.append(line)
+            self._buffer_bytes += len(line)
+            if (len(self._buffer) >= self.max_lines
+                    or self._buffer_bytes >= self.max_bytes
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if self._buffer:
+            try:
+                self._log.append(''.join(self._buffer))
+            except OSError as e:
+                logger.warning(f"寫入執行記錄檔失敗 ({self.execution_id}): {str(e)}")
+            self._buffer = []
+            self._buffer_bytes = 0
+        self._report_size()
+
+    def _report_size(self, **extra):
+        if self._reported_size == self._log.size and not extra:
+            return
+        try:
+            get_db_writer().submit(
+                JobExecution.objects.filter(execution_id=self.execution_id).update, log_size=self._log.size, **extra
+            )
+            self._reported_size = self._log.size
+        except Exception as e:
+            logger.warning(f"更新執行記錄大小失敗 ({self.execution_id}): {str(e)}")
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._log.close()
+            summary = self.store.tail(self.execution_id, lines=self.summary_lines)
+            self._report_size(output=summary)
@@ -0,0 +1,138 @@
+"""
+排程錯開規劃 (flex window)
+
+大多數任務都設定在整點執行，同一秒觸發的任務會同時呼叫 Power BI API 並寫入同一個
+SQLite 檔案。設定 flex_window 的任務表示可以在 cron 時間後的 N 分鐘內任意開始，
+規劃器依歷史執行時間估計每個任務佔用的時間，在視窗內為每個任務挑選使同時執行數
+最低的延遲 (flex_offset)，再交給排程同步器套用 OffsetTrigger。
+
+規劃結果只取決於任務設定與歷史執行時間：任務依 (預估時間長到短, job_id) 排序，
+同分時選最早的延遲，同樣的輸入永遠得到同樣的延遲。
+"""
+from collections import Counter
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Avg
+from django.utils import timezone
+import logging
+import math
+
+from .db_writer import get_db_writer
+from .models import JobChange, JobExecution, JobScheduler
+from .reconciler import notify_reconciler
+from .triggers import forecast_fire_times
+
+logger = logging.getLogger(__name__)
+
+PLAN_HORIZON = timedelta(days=7)
+SLOT_SECONDS = 60
+HISTORY_DAYS = 30
+DEFAULT_DURATION = timedelta(minutes=1)
+
+
+def expected_durations(job_ids, history_days=HISTORY_DAYS):
+    """以最近成功執行的平均時間估計任務執行時間，回傳 {job_id: timedelta}"""
+    since = timezone.now() - timedelta(days=history_days)
+    rows = (
+        JobExecution.objects.filter(
+            job_id__in=job_ids, status='completed', start_time__gte=since, duration__isnull=False
+        )
+        .values('job_id')
+        .annotate(average=Avg('duration'))
+    )
+    return {row['job_id']: row['average'] for row in rows}
+
+
+class _LoadTimeline:
+    """以每分鐘為單位累計同時執行的任務數"""
+
+    def __init__(self):
+        self.load = Counter()
+
+    def cost(self, starts, width, offset):
+        """放在 offset 時的 (最高同時執行數, 累計重疊數)"""
+        peak = total = 0
+        for start in starts:
+            for slot in range(start + offset, start + offset + width):
+                peak = max(peak, self.load[slot])
+                total += self.load[slot]
+        return peak, total
+
+    def add(self, starts, width, offset):
+        for start in starts:
+            for slot in range(start + offset, start + offset + width):
+                self.load[slot] += 1
+
+    @property
+    def peak(self):
+        return max(self.load.values(), default=0)
+
+
+def plan_offsets(now=None):
+    """
+    計算所有啟用中、設定 flex window 任務的延遲
+    回傳 ({job_id: offset 秒}, 規劃前最高同時執行數, 規劃後最高同時執行數)
+    """
+    # 預測區間從當天 00:00 開始，同一天內重新規劃結果不變
+    start = timezone.localtime(now or timezone.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + PLAN_HORIZON
+
+    jobs = list(
+        JobScheduler.objects.filter(enabled=True)
+        .only('job_id', 'cron_expression', 'flex_window', 'flex_offset')
+        .order_by('job_id')
+    )
+    durations = expected_durations([job.job_id for job in jobs])
+    fires = forecast_fire_times([(job.job_id, job.cron_expression, 0) for job in jobs], start, end)
+
+    def slots(job):
+        seconds = (durations.get(job.job_id) or DEFAULT_DURATION).total_seconds()
+        return max(1, math.ceil(seconds / SLOT_SECONDS))
+
+    def starts(job):
+        return [int((t - start).total_seconds() // SLOT_SECONDS) for t in fires.get(job.job_id, [])]
+
+    unplanned = _LoadTimeline()
+    planned = _LoadTimeline()
+    for job in jobs:
+        unplanned.add(starts(job), slots(job), 0)
+        if not job.flex_window:
+            planned.add(starts(job), slots(job), 0)
+
+    offsets = {}
+    flexible = sorted((job for job in jobs if job.flex_window), key=lambda job: (-slots(job), job.job_id))
+    for job in flexible:
+        job_starts, width = starts(job), slots(job)
+        window = job.flex_window * 60 // SLOT_SECONDS
+        best = min(range(window + 1), key=lambda offset: (planned.cost(job_starts, width, offset), offset))
+        planned.add(job_starts, width, best)
+        offsets[job.job_id] = best * SLOT_SECONDS
+
+    return offsets, unplanned.peak, planned.peak
+
+
+def _write_offsets(changed):
+    """以 queryset 更新，再自行寫入變更紀錄讓同步器替換觸發器 (在寫入執行緒執行)"""
+    with transaction.atomic():
+        for job_id, offset in changed.items():
+            JobScheduler.objects.filter(job_id=job_id).update(flex_offset=offset)
+        JobChange.objects.bulk_create([JobChange(job_id=job_id, action='save') for job_id in changed])
+        transaction.on_commit(notify_reconciler)
+
+
+def plan_flex_offsets():
+    """排程使用：重新規劃 flex window 任務的延遲，只更新有變動的任務"""
+    offsets, peak_before, peak_after = plan_offsets()
+    current = dict(
+        JobScheduler.objects.filter(job_id__in=offsets).values_list('job_id', 'flex_offset')
+    )
+    changed = {job_id: offset for job_id, offset in offsets.items() if current.get(job_id) != offset}
+
+    if changed:
+        get_db_writer().call(_write_offsets, changed)
+
+    logger.info(
+        f"排程錯開規劃完成: {len(offsets)} 個 flex 任務，{len(changed)} 個延遲變更，"
+        f"最高同時執行數 {peak_before} -> {peak_after}"
+    )
+    return changed
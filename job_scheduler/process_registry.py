@@ -0,0 +1,183 @@
+"""
+執行中引擎行程的登記與中止
+
+每個執行中的 execution_id 對應一個引擎行程 (常駐工作行程或一次性行程)。
+引擎行程都以獨立的 process group 啟動，中止時先送 SIGTERM 讓引擎在檢查點
+自行結束，超過寬限時間仍未結束才送 SIGKILL。
+
+同一台主機上的其他 Django 行程 (例如 admin 所在的 web 行程) 可透過
+JobExecution.pid / hostname 找到引擎行程並送出訊號。
+常駐工作行程結束一筆執行後會接著執行下一筆，而 JobExecution.pid 由寫入執行緒非同步清除，
+送出 SIGTERM 前先寫入中止要求檔 <cancel_request_dir>/<pid> (內容為 execution_id)，
+引擎只在要求的是目前的執行時才中止 (scripts/power_bi_engine.py check_cancelled)。
+要求檔在該筆執行結束 (track 結束) 或引擎確認不是目前的執行時才刪除，
+因此送出 SIGKILL 前也以要求檔確認工作行程仍在執行同一筆。
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from django.conf import settings
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRACE_PERIOD = 10  # 秒
+
+HOSTNAME = socket.gethostname()
+
+_running = {}
+_lock = threading.Lock()
+
+
+def _signal_group(pid, sig):
+    """對引擎行程所在的 process group 送出訊號；行程不存在時回傳 False"""
+    try:
+        if os.name == 'posix':
+            os.killpg(pid, sig)
+        else:
+            os.kill(pid, sig)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def kill_process_group(process):
+    """強制終止引擎行程與它啟動的子行程 (例如逾時的執行)"""
+    kill_signal = getattr(signal, 'SIGKILL', signal.SIGTERM)
+    if not _signal_group(process.pid, kill_signal):
+        process.kill()
+
+
+def cancel_request_dir():
+    """中止要求檔的目錄 (傳給引擎的 cancel_dir)"""
+    return Path(settings.BASE_DIR) / 'logs' / 'engine-cancel'
+
+
+def _write_cancel_request(pid, execution_id):
+    directory = cancel_request_dir()
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f'{pid}.tmp'
+        tmp.write_text(execution_id, encoding='utf-8')
+        os.replace(tmp, directory / str(pid))
+    except OSError as e:
+        # 沒有要求檔時引擎仍會中止目前的執行
+        logger.warning(f"寫入中止要求失敗 ({execution_id}): {str(e)}")
+
+
+def _cancel_request_target(pid):
+    """要求檔中的 execution_id；沒有要求檔時回傳 None"""
+    try:
+        return (cancel_request_dir() / str(pid)).read_text(encoding='utf-8').strip()
+    except OSError:
+        return None
+
+
+def _clear_cancel_request(pid):
+    try:
+        (cancel_request_dir() / str(pid)).unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def _still_running(execution_id, pid, process):
+    """引擎是否仍在執行這筆 execution (常駐工作行程結束執行後仍會存活，不能只看 pid)"""
+    if process is not None:
+        with _lock:
+            return _running.get(execution_id) is process
+    if _cancel_request_target(pid) != execution_id:
+        return False
+    from .models import JobExecution
+    try:
+        return JobExecution.objects.filter(execution_id=execution_id, pid=pid).exists()
+    except Exception:
+        return True
+
+
+def _escalate(execution_id, pid, grace_period, process=None):
+    """寬限時間內未結束的執行改送 SIGKILL"""
+    deadline = time.monotonic() + grace_period
+    while time.monotonic() < deadline:
+        if not _still_running(execution_id, pid, process):
+            return
+        time.sleep(0.2)
+    kill_signal = getattr(signal, 'SIGKILL', signal.SIGTERM)
+    if process is not None:
+        # 下一筆執行要在同一把鎖下登記 (track)，持有鎖送出訊號就不會終止到下一筆
+        with _lock:
+            killed = _running.get(execution_id) is process and _signal_group(pid, kill_signal)
+    else:
+        # 其他行程的引擎：要求檔仍指定這筆執行時，工作行程還沒有開始下一筆
+        killed = _cancel_request_target(pid) == execution_id and _signal_group(pid, kill_signal)
+    if killed:
+        logger.warning(f"執行 {execution_id} 未在 {grace_period} 秒內結束，已強制終止引擎行程 {pid}")
+
+
+@contextmanager
+def track(execution_id, process):
+    """在引擎執行期間登記 execution_id 與行程的對應"""
+    if not execution_id or execution_id == 'unknown':
+        yield
+        return
+
+    key = str(execution_id)
+    with _lock:
+        _running[key] = process
+    _record_pid(key, process.pid)
+    try:
+        yield
+    finally:
+        with _lock:
+            if _running.get(key) is process:
+                del _running[key]
+        _record_pid(key, None)
+        # 這筆執行已結束，尚未處理的中止要求不再有效
+        _clear_cancel_request(process.pid)
+
+
+def running_execution_ids():
+    """本行程中執行中的 execution_id"""
+    with _lock:
+        return list(_running)
+
+
+def _record_pid(execution_id, pid):
+    """記錄 (或清除) 執行中的引擎行程，讓其他行程也能中止它 (交給寫入執行緒，不等待)"""
+    from .db_writer import get_db_writer
+    from .models import JobExecution
+    try:
+        get_db_writer().submit(JobExecution.objects.filter(execution_id=execution_id).update, pid=pid, hostname=HOSTNAME)
+    except Exception as e:
+        logger.warning(f"記錄引擎行程失敗 ({execution_id}): {str(e)}")
+
+
+def terminate_execution(execution_id, pid=None, hostname=None, grace_period=DEFAULT_GRACE_PERIOD):
+    """
+    中止執行中的引擎行程
+    先送 SIGTERM (引擎會在下一個檢查點結束)，寬限時間後仍存活則送 SIGKILL
+    回傳是否有送出訊號
+    """
+    key = str(execution_id)
+    with _lock:
+        process = _running.get(key)
+
+    if process is not None:
+        pid = process.pid
+    elif not (pid and hostname == HOSTNAME):
+        if pid:
+            logger.warning(f"執行 {key} 的引擎行程位於其他主機 ({hostname})，無法中止")
+        return False
+
+    _write_cancel_request(pid, key)
+    if not _signal_group(pid, signal.SIGTERM):
+        return False
+    logger.info(f"已要求中止執行 {key} (引擎行程 {pid})")
+    threading.Thread(
+        target=_escalate, args=(key, pid, grace_period, process),
+        name=f'abort-{key[:8]}', daemon=True
+    ).start()
+    return True
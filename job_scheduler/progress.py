@@ -0,0 +1,163 @@
+"""
+執行進度事件
+
+- ProgressRecorder: 在引擎執行槽中把引擎回報的進度事件寫入 ExecutionProgress
+- ProgressHub: 在 ASGI 行程中，每個執行只由一個輪詢工作讀取資料庫，
+  再分送給所有訂閱該執行的 SSE 連線，開再多儀表板也不會增加資料庫查詢
+"""
+import asyncio
+import logging
+import threading
+import weakref
+
+from .db_writer import get_db_writer
+from .models import ExecutionProgress
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+EVENT_FIELDS = ('seq', 'event', 'percent', 'message', 'created_at')
+
+
+class ProgressRecorder:
+    """將單次執行的進度事件寫入資料庫 (交給寫入執行緒，不等待)"""
+
+    def __init__(self, execution_id):
+        self.execution_id = execution_id
+        self.last_percent = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def _create(self, event, percent, message):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        try:
+            get_db_writer().submit(
+                ExecutionProgress.objects.create,
+                execution_id=self.execution_id,
+                seq=seq,
+                event=event,
+                percent=percent,
+                message=(message or '')[:255],
+            )
+        except Exception as e:
+            logger.warning(f"寫入執行進度失敗 ({self.execution_id}): {str(e)}")
+
+    def record(self, event):
+        """處理引擎送出的事件；目前只記錄 progress 類型"""
+        if event.get('type') != 'progress':
+            return
+        self.last_percent = event.get('percent')
+        self._create('progress', self.last_percent, event.get('message'))
+
+    def finish(self, status):
+        """寫入結束事件，SSE 連線收到後即關閉"""
+        self._create('status', self.last_percent, status)
+
+
+def serialize_event(row):
+    return {
+        'seq': row['seq'],
+        'event': row['event'],
+        'percent': row['percent'],
+        'message': row['message'],
+        'created_at': row['created_at'].isoformat(),
+    }
+
+
+class _ExecutionChannel:
+    """單一執行的事件緩衝與訂閱者"""
+
+    def __init__(self, execution_id):
+        self.execution_id = execution_id
+        self.events = []
+        self.done = False
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task = None
+
+    def has_events_after(self, seq):
+        return bool(self.events) and self.events[-1]['seq'] > seq
+
+    async def poll(self, interval):
+        last_seq = 0
+        try:
+            while self.subscribers and not self.done:
+                rows = [
+                    serialize_event(row)
+                    async for row in ExecutionProgress.objects.filter(
+                        execution_id=self.execution_id, seq__gt=last_seq
+                    ).order_by('seq').values(*EVENT_FIELDS)
+                ]
+                if rows:
+                    async with self.changed:
+                        self.events.extend(rows)
+                        last_seq = rows[-1]['seq']
+                        self.done = any(row['event'] == 'status' for row in rows)
+                        self.changed.notify_all()
+                if not self.done:
+                    await asyncio.sleep(interval)
+        except Exception as e:
+            logger.error(f"讀取執行進度失敗 ({self.execution_id}): {str(e)}")
+            async with self.changed:
+                self.done = True
+                self.changed.notify_all()
+
+
+class ProgressHub:
+    """同一個事件迴圈內共用的進度輪詢器"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL, keepalive=KEEPALIVE_INTERVAL):
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self._channels = {}
+
+    async def subscribe(self, execution_id, after_seq=0):
+        """
+        依序產生 seq 大於 after_seq 的事件
+        超過 keepalive 秒沒有新事件時產生 None，讓呼叫端送出心跳
+        """
+        key = str(execution_id)
+        channel = self._channels.get(key)
+        if channel is None:
+            channel = self._channels[key] = _ExecutionChannel(key)
+        channel.subscribers += 1
+        if channel.task is None or channel.task.done():
+            channel.task = asyncio.ensure_future(channel.poll(self.poll_interval))
+
+        try:
+            while True:
+                async with channel.changed:
+                    if not channel.has_events_after(after_seq) and not channel.done:
+                        try:
+                            await asyncio.wait_for(channel.changed.wait(), self.keepalive)
+                        except asyncio.TimeoutError:
+                            pass
+                    pending = [event for event in channel.events if event['seq'] > after_seq]
+                    finished = channel.done
+
+                if not pending and not finished:
+                    yield None
+                for event in pending:
+                    after_seq = event['seq']
+                    yield event
+                if finished and not channel.has_events_after(after_seq):
+                    return
+        finally:
+            channel.subscribers -= 1
+            if channel.subscribers <= 0 and self._channels.get(key) is channel:
+                del self._channels[key]
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_progress_hub():
+    """取得目前事件迴圈的 ProgressHub"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = ProgressHub()
+    return hub
@@ -0,0 +1,185 @@
+"""
+排程同步器
+
+建立、修改、啟用/停用或刪除任務時，signals.py 會寫入一筆 JobChange。
+同步器在排程行程中讀取上次處理之後的變更，逐一比對資料庫與 APScheduler
+中的任務，只新增、替換或移除有差異的任務，不需重新載入全部任務或重啟行程。
+
+同一行程內的變更在交易提交後立即喚醒同步器；其他行程 (例如 web 行程)
+的變更則在下一次輪詢 (reconcile.interval 秒) 時套用。
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F, Max
+from django.utils import timezone
+import logging
+import threading
+
+from .db_writer import get_db_writer
+from .models import JobChange, JobScheduler, JobStatus
+from .triggers import build_trigger
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 5  # 秒
+CHANGE_RETENTION = timedelta(days=1)
+BATCH_SIZE = 500
+
+_active_reconciler = None
+
+
+def get_reconcile_interval():
+    return float(getattr(settings, 'SCHEDULER_CONFIG', {}).get('reconcile.interval', DEFAULT_INTERVAL))
+
+
+def notify_reconciler():
+    """
+    任務變更提交後呼叫；本行程有執行中的同步器時立即同步，
+    否則 (web 行程) 在背景通知排程 daemon，不讓請求等待 IPC
+    """
+    if _active_reconciler is not None:
+        _active_reconciler.wake()
+        return
+    from .ipc import request_reload
+    threading.Thread(target=request_reload, name='scheduler-reload', daemon=True).start()
+
+
+def _write_next_run_time(job_id, next_run_time, updated_at):
+    JobScheduler.objects.filter(job_id=job_id).update(next_run_time=next_run_time)
+    JobStatus.objects.filter(job_id=job_id).update(
+        next_fire_time=next_run_time, version=F('version') + 1, updated_at=updated_at
+    )
+
+
+class ScheduleReconciler:
+    """將資料庫中的任務設定同步到 APScheduler"""
+
+    def __init__(self, scheduler, job_func, interval=None):
+        self.scheduler = scheduler
+        self.job_func = job_func
+        self.interval = interval or get_reconcile_interval()
+        self.last_seq = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_prune = None
+
+    def _apply(self, job_id, job):
+        """比對單一任務，回傳執行的動作 (added / replaced / removed) 或 None"""
+        job_key = str(job_id)
+        live = self.scheduler.get_job(job_key)
+        trigger = None
+        if job is not None and job.enabled:
+            trigger = build_trigger(job.cron_expression, job.effective_offset)
+
+        if trigger is None:
+            if live is None:
+                return None
+            self.scheduler.remove_job(job_key)
+            return 'removed'
+
+        if live is not None and repr(live.trigger) == repr(trigger) and live.name == job.job_name:
+            return None
+
+        added = self.scheduler.add_job(
+            self.job_func,
+            trigger,
+            id=job_key,
+            name=job.job_name,
+            args=[job.job_id],
+            replace_existing=True,
+            max_instances=1  # 限制同時執行的實例數
+        )
+        self._sync_next_run_time(job, added.next_run_time)
+        return 'added' if live is None else 'replaced'
+
+    def _sync_next_run_time(self, job, next_run_time):
+        """以 queryset 更新避免再次觸發變更紀錄 (交給寫入執行緒，不等待)"""
+        if next_run_time is None or next_run_time == job.next_run_time:
+            return
+        get_db_writer().submit(_write_next_run_time, job.job_id, next_run_time, timezone.now())
+
+    def _apply_many(self, job_ids):
+        jobs = JobScheduler.objects.only(
+            'job_id', 'job_name', 'cron_expression', 'enabled', 'flex_window', 'flex_offset', 'next_run_time'
+        ).in_bulk(job_ids)
+        counts = {}
+        for job_id in job_ids:
+            try:
+                action = self._apply(job_id, jobs.get(job_id))
+            except Exception as e:
+                logger.error(f"同步排程任務 {job_id} 失敗: {str(e)}")
+                continue
+            if action:
+                counts[action] = counts.get(action, 0) + 1
+        return counts
+
+    def reconcile_all(self):
+        """完整比對 (啟動時使用)，也會移除資料庫中已不存在的任務"""
+        with self._lock:
+            # 先取得目前版本，比對期間發生的變更會在下一次同步時套用
+            self.last_seq = JobChange.objects.aggregate(seq=Max('seq'))['seq'] or 0
+            job_ids = set(JobScheduler.objects.values_list('job_id', flat=True))
+            for live in self.scheduler.get_jobs():
+                if live.id.isdigit() and int(live.id) not in job_ids:
+                    job_ids.add(int(live.id))
+            counts = self._apply_many(sorted(job_ids))
+        logger.info(f"排程同步完成 (完整比對 {len(job_ids)} 個任務): {counts}")
+        return counts
+
+    def reconcile_changes(self):
+        """只處理 last_seq 之後有變更的任務"""
+        with self._lock:
+            counts = {}
+            while True:
+                changes = list(
+                    JobChange.objects.filter(seq__gt=self.last_seq)
+                    .order_by('seq').values_list('seq', 'job_id')[:BATCH_SIZE]
+                )
+                if not changes:
+                    break
+                for action, count in self._apply_many({job_id for _, job_id in changes}).items():
+                    counts[action] = counts.get(action, 0) + count
+                self.last_seq = changes[-1][0]
+        if counts:
+            logger.info(f"排程同步完成 (版本 {self.last_seq}): {counts}")
+        return counts
+
+    def _prune(self):
+        """刪除超過保留時間的變更紀錄"""
+        now = timezone.now()
+        if self._last_prune and now - self._last_prune < timedelta(hours=1):
+            return
+        self._last_prune = now
+        get_db_writer().submit(JobChange.objects.filter(created_at__lt=now - CHANGE_RETENTION).delete)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                self.reconcile_changes()
+                self._prune()
+            except Exception as e:
+                logger.error(f"排程同步失敗: {str(e)}")
+
+    def start(self):
+        global _active_reconciler
+        _active_reconciler = self
+        self._thread = threading.Thread(target=self._run, name='schedule-reconciler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        global _active_reconciler
+        if _active_reconciler is self:
+            _active_reconciler = None
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
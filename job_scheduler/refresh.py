@@ -0,0 +1,170 @@
+"""
+Dataset 重新整理合併 (refresh coalescing)
+
+多個 Program 指向同一個 dataset_id 時，各自的執行原本都會重新整理一次 dataset。
+執行開始前先向這裡取得重新整理的資格：
+- 同一個 dataset 沒有進行中或新鮮度期間內完成的重新整理：本執行成為 leader，由引擎重新整理
+- 有進行中的重新整理：等待它完成後直接匯出，不再重新整理
+  (等待期間不佔用引擎執行槽：coordinate_refresh 回傳 RefreshWait，由呼叫端釋放執行槽並稍後再呼叫)
+- 有新鮮度期間 (engine.refresh_window 秒) 內完成的重新整理：直接匯出
+
+共用的執行以 JobExecution.dataset_refresh 連結到同一筆 DatasetRefresh。
+引擎以 refresh_marker 判斷匯出結果是否可由快取 (scripts/artifact_cache.py) 提供。
+"""
+from datetime import timedelta
+from django.db.models import Q
+from django.utils import timezone
+import logging
+import threading
+import time
+
+from .db_writer import get_db_writer
+from .executor import get_engine_config
+from .models import DatasetRefresh, JobExecution
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+MAX_CLAIM_ATTEMPTS = 3
+
+_claim_lock = threading.Lock()
+
+
+def refresh_marker(refresh):
+    """識別一次重新整理的資料版本，同一標記的匯出結果相同"""
+    return f"{refresh.dataset_id}:{refresh.pk}:{refresh.started_at.isoformat()}"
+
+
+def _claim(execution, program, window, wait_timeout):
+    """
+    取得或建立這個 dataset 的重新整理，回傳 (DatasetRefresh, 是否為 leader)
+    在寫入執行緒中執行，判斷與寫入之間不會有本行程的其他寫入；
+    行程內的鎖讓停用寫入執行緒 (writer.enabled = False) 時仍只有一個執行在判斷
+    """
+    with _claim_lock:
+        now = timezone.now()
+        # 超過等待上限仍在 running 的紀錄視為已中斷 (例如排程行程重啟)
+        in_flight = Q(status='running', started_at__gte=now - timedelta(seconds=wait_timeout))
+        fresh = Q(status='completed', finished_at__gte=now - timedelta(seconds=window))
+        recent = (
+            DatasetRefresh.objects.filter(dataset_id=program.dataset_id)
+            .filter(in_flight | fresh)
+            .order_by('-started_at')
+            .first()
+        )
+        if recent is not None:
+            JobExecution.objects.filter(execution_id=execution.execution_id).update(
+                dataset_refresh=recent, refresh_coalesced=True
+            )
+            return recent, False
+
+        refresh = DatasetRefresh.objects.create(
+            dataset_id=program.dataset_id,
+            workspace_id=program.workspace_id,
+            leader_id=execution.execution_id,
+        )
+        JobExecution.objects.filter(execution_id=execution.execution_id).update(
+            dataset_refresh=refresh, refresh_coalesced=False
+        )
+        return refresh, True
+
+
+class RefreshWait:
+    """等待中的 follower：等待的重新整理、等待期限與已取得資格的次數"""
+
+    def __init__(self, refresh, deadline, attempts):
+        self.refresh = refresh
+        self.deadline = deadline
+        self.attempts = attempts
+
+
+def _wait_status(waiting, execution):
+    """等待中的重新整理目前的狀態；逾時為 'timeout'，本執行已被中止時回傳 None"""
+    waiting.refresh.refresh_from_db(fields=['status'])
+    if waiting.refresh.status != 'running':
+        return waiting.refresh.status
+    if not JobExecution.objects.filter(execution_id=execution.execution_id, status='running').exists():
+        return None
+    if time.monotonic() >= waiting.deadline:
+        return 'timeout'
+    return 'running'
+
+
+def _follower_params(refresh):
+    return {
+        'refresh_dataset': False,
+        'refresh_id': refresh.pk,
+        'refresh_marker': refresh_marker(refresh),
+        'coalesced_with': str(refresh.leader_id) if refresh.leader_id else None,
+    }
+
+
+def coordinate_refresh(execution, program, waiting=None):
+    """
+    決定本執行是否需要重新整理 dataset
+    回傳要加入引擎參數的 dict；本執行在等待期間被中止時回傳 None；
+    有進行中的重新整理時回傳 RefreshWait：呼叫端釋放執行槽，POLL_INTERVAL 秒後帶著它再呼叫一次
+    """
+    config = get_engine_config()
+    window = config['refresh_window']
+    if not window:
+        return {'refresh_dataset': True}
+
+    attempts = 0
+    if waiting is not None:
+        status = _wait_status(waiting, execution)
+        if status == 'running':
+            return waiting
+        if status is None:
+            return None
+        if status == 'completed':
+            return _follower_params(waiting.refresh)
+        # leader 失敗或逾時，重新取得資格 (可能由本執行重新整理)
+        logger.warning(f"dataset {program.dataset_id} 的重新整理 {waiting.refresh.pk} 未成功 ({status})")
+        attempts = waiting.attempts
+
+    while attempts < MAX_CLAIM_ATTEMPTS:
+        attempts += 1
+        refresh, leader = get_db_writer().call(
+            _claim, execution, program, window, config['refresh_wait_timeout']
+        )
+        if leader:
+            return {'refresh_dataset': True, 'refresh_id': refresh.pk, 'refresh_marker': refresh_marker(refresh)}
+        if refresh.status == 'running':
+            logger.info(f"執行 {execution.execution_id} 等待 dataset {program.dataset_id} 的重新整理完成")
+            return RefreshWait(refresh, time.monotonic() + config['refresh_wait_timeout'], attempts)
+        return _follower_params(refresh)
+
+    return {'refresh_dataset': True}
+
+
+def _record_refresh_result(refresh_id, status, finished_at):
+    DatasetRefresh.objects.filter(pk=refresh_id, status='running').update(
+        status=status, finished_at=finished_at
+    )
+
+
+def complete_refresh(refresh_id, status):
+    """記錄重新整理結果 (交給寫入執行緒，不等待)；已結束的紀錄不會被覆寫"""
+    get_db_writer().submit(_record_refresh_result, refresh_id, status, timezone.now())
+
+
+class RefreshEventHandler:
+    """接收引擎的 refresh 事件並記錄結果，其他事件交給下一個處理器"""
+
+    def __init__(self, refresh_params, next_handler=None):
+        self.refresh_id = refresh_params.get('refresh_id') if refresh_params.get('refresh_dataset') else None
+        self.next_handler = next_handler
+
+    def __call__(self, event):
+        if event.get('type') == 'refresh':
+            if self.refresh_id:
+                complete_refresh(self.refresh_id, 'completed' if event.get('status') == 'completed' else 'failed')
+            return
+        if self.next_handler is not None:
+            self.next_handler(event)
+
+    def finish(self, error):
+        """引擎結束時仍未回報的重新整理依執行結果結束，避免其他執行一直等待"""
+        if self.refresh_id:
+            complete_refresh(self.refresh_id, 'failed' if error else 'completed')
@@ -1,17 +1,32 @@
-from django_apscheduler.jobstores import DjangoJobStore
 from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+from django.conf import settings
 from django.utils import timezone
-from .models import JobScheduler, JobExecution
+from .models import JobScheduler, JobExecution, JobStatus
+from .db_writer import get_db_writer
+from .executor import Requeue, get_engine_config, get_engine_executor
+from .leader import is_scheduler_leader
+from .engine_pool import BASE_DIR, ENGINE_SCRIPT, EVENT_PREFIX, get_engine_pool, timeout_message
+from .output_stream import ExecutionOutputWriter
+from .log_store import purge_execution_logs
+from .planner import DEFAULT_DURATION, expected_durations, plan_flex_offsets
+from .progress import ProgressRecorder
+from .refresh import POLL_INTERVAL as REFRESH_POLL_INTERVAL, RefreshEventHandler, RefreshWait, coordinate_refresh
+from .reconciler import ScheduleReconciler
+from .triggers import next_fire_time
+from . import process_registry
+from collections import deque
+from datetime import timedelta
 from program.models import Program
+import copy
 import logging
-import subprocess
 import os
+import subprocess
+import sys
 import json
+import threading
 from apscheduler.events import EVENT_JOB_ERROR
-from static.utils.db_utils import retry_on_db_lock
-import time
-from django.db.utils import OperationalError
+from static.utils.sqlite_profile import run_sqlite_maintenance
+from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
@@ -19,143 +34,281 @@ def calculate_next_run_time(cron_expression):
     """
     Calculate the next execution time based on cron expression
     """
-    try:
-        trigger = CronTrigger.from_crontab(cron_expression)
-        return trigger.get_next_fire_time(None, timezone.now())
-    except Exception as e:
-        logger.error(f"Error calculating next run time: {str(e)}")
-        return None
+    return next_fire_time(cron_expression)
 
-def execute_powerbi_engine(program):
+def build_program_params(program, execution_id=None):
+    """構建傳給 Power BI Engine 的程式參數"""
+    config = get_engine_config()
+    return {
+        'execution_id': str(execution_id) if execution_id else 'unknown',
+        # 引擎只接受指定目前執行的中止要求 (process_registry.terminate_execution)
+        'cancel_dir': str(process_registry.cancel_request_dir()),
+        'workspace_id': program.workspace_id,
+        'report_name': program.report_name,
+        'dataset_id': program.dataset_id,
+        'method': program.method,
+        'output_name': program.output_name,
+        'output_type': program.output_type,
+        'sharepoint_site': program.sharepoint_site,
+        'sharepoint_path': program.sharepoint_path,
+        'filelocation': program.filelocation,
+        # 所有引擎行程共用同一個速率限制檔
+        'tenant_id': config['tenant_id'],
+        'rate_limit_db': config['rate_limit_db'],
+        'rate_limits': config['rate_limits'],
+        'artifact_cache': config['artifact_cache'],
+        'artifact_cache_max_mb': config['artifact_cache_max_mb'],
+        'artifact_cache_max_entries': config['artifact_cache_max_entries'],
+        'powerbi_api_url': config['powerbi_api_url'],
+        'token_url': config['token_url'],
+        'poll_interval': config['poll_interval'],
+        'refresh_timeout': config['refresh_timeout'],
+        'sharepoint_api_url': config['sharepoint_api_url'],
+        'upload_chunk_mb': config['upload_chunk_mb'],
+        'upload_parallel': config['upload_parallel'],
+    }
+
+def execute_powerbi_engine(program, execution_id, sink, on_event=None, extra_params=None):
     """
-    執行 Power BI Engine 腳本
+    執行 Power BI Engine
+    引擎輸出逐行交給 sink，結構化事件交給 on_event，回傳錯誤訊息 (成功時為 None)
+    預設交給常駐工作行程執行；engine.warm_workers 為 False 時才每次啟動新行程
     """
     try:
-        # 設置超時時間（1小時）
-        timeout = 3600
-        
-        # 構建程式參數並轉換為 JSON
-        program_params = {
-            'workspace_id': program.workspace_id,
-            'report_name': program.report_name,
-            'dataset_id': program.dataset_id,
-            'method': program.method,
-            'output_name': program.output_name,
-            'output_type': program.output_type,
-            'sharepoint_site': program.sharepoint_site,
-            'sharepoint_path': program.sharepoint_path,
-            'filelocation': program.filelocation
-        }
-        
-        # 構建命令
-        script_path = os.path.join('scripts', 'power_bi_engine.py')
-        command = [
-            'python',
-            script_path,
-            '--program', json.dumps(program_params, ensure_ascii=False)
-        ]
-        
-        # 執行命令並設置超時
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-            encoding='utf-8',
-            errors='replace'
-        )
-        
-        try:
-            stdout, stderr = process.communicate(timeout=timeout)
-            return stdout, stderr if process.returncode != 0 else None
-        except subprocess.TimeoutExpired:
-            process.kill()
-            stdout, stderr = process.communicate()
-            return None, "執行超時 超過1小時 "
-            
+        config = get_engine_config()
+        program_params = build_program_params(program, execution_id)
+        program_params.update(extra_params or {})
+
+        if config['warm_workers']:
+            return get_engine_pool().run(program_params, sink, timeout=config['timeout'], on_event=on_event)
+        return execute_powerbi_engine_cold(program_params, sink, config, on_event=on_event)
+
     except Exception as e:
         logger.error(f"執行 Power BI Engine 時發生錯誤: {str(e)}")
-        return None, str(e)
+        return str(e)
+
+def execute_powerbi_engine_cold(program_params, sink, config, on_event=None):
+    """每次執行都啟動新的 Python 直譯器 (舊的執行方式)"""
+    # 構建命令
+    command = [
+        config['python'] or sys.executable,
+        str(ENGINE_SCRIPT),
+        '--program', json.dumps(program_params, ensure_ascii=False),
+        '--no-log-file'
+    ]
+
+    # 執行命令並設置超時；獨立的 process group 讓中止時可以整組終止
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=str(BASE_DIR),
+        universal_newlines=True,
+        encoding='utf-8',
+        errors='replace',
+        start_new_session=(os.name == 'posix')
+    )
+    with process_registry.track(program_params.get('execution_id'), process):
+        return _communicate_streaming(process, sink, config, on_event)
+
+def _communicate_streaming(process, sink, config, on_event):
+    """逐行讀取一次性引擎行程的輸出"""
+    # stderr 在另一個執行緒讀取，避免任一管道寫滿造成死結；只保留最後幾行作為錯誤訊息
+    stderr_tail = deque(maxlen=50)
+
+    def drain_stderr():
+        for line in process.stderr:
+            line = line.rstrip('\n')
+            stderr_tail.append(line)
+            sink(line)
+
+    stderr_thread = threading.Thread(target=drain_stderr, daemon=True)
+    stderr_thread.start()
+
+    timed_out = threading.Event()
+
+    def on_timeout():
+        timed_out.set()
+        process_registry.kill_process_group(process)
+
+    timer = threading.Timer(config['timeout'], on_timeout)
+    timer.start()
+    try:
+        for line in process.stdout:
+            line = line.rstrip('\n')
+            if line.startswith(EVENT_PREFIX):
+                if on_event is not None:
+                    try:
+                        on_event(json.loads(line[len(EVENT_PREFIX):]))
+                    except ValueError:
+                        sink(line)
+                continue
+            sink(line)
+        process.wait()
+        stderr_thread.join()
+    finally:
+        timer.cancel()
+
+    if timed_out.is_set():
+        return timeout_message(config['timeout'])
+    if process.returncode != 0:
+        return '\n'.join(stderr_tail) or f"Power BI Engine exited with code {process.returncode}"
+    return None
+
+def start_execution(job, queued_at, deadline):
+    """創建執行記錄，並在同一個交易中更新任務狀態摘要 (在寫入執行緒執行)"""
+    with transaction.atomic():
+        start_time = timezone.now()
+        execution = JobExecution.objects.create(
+            job=job,
+            status='running',
+            start_time=start_time,
+            queue_wait=start_time - queued_at if queued_at else None,
+            deadline=deadline,
+        )
+        JobStatus.record_execution(execution)
+    return execution
+
+def _record_result(execution, status, error):
+    """只在狀態仍為 running 時寫入結果 (在寫入執行緒執行)，回傳是否有更新"""
+    end_time = timezone.now()
+    with transaction.atomic():
+        updated = JobExecution.objects.filter(execution_id=execution.execution_id, status='running').update(
+            status=status,
+            end_time=end_time,
+            error=error,
+            duration=end_time - execution.start_time,
+            deadline_missed=bool(execution.deadline and end_time > execution.deadline),
+        )
+        if updated:
+            execution.status, execution.end_time, execution.error = status, end_time, error
+            execution.deadline_missed = bool(execution.deadline and end_time > execution.deadline)
+            JobStatus.record_execution(execution)
+    return updated
+
+def finish_execution(execution, status, error):
+    """
+    寫入執行結果
+    只在狀態仍為 running 時更新；已被中止 (aborted) 的執行保留中止時記錄的狀態
+    """
+    updated = get_db_writer().call(_record_result, execution, status, error)
+    if updated and execution.deadline_missed:
+        logger.warning(f"執行 {execution.execution_id} 未在期限 {execution.deadline} 前完成")
+    if not updated:
+        execution.refresh_from_db(fields=['status', 'end_time', 'error', 'duration'])
+        logger.info(f"執行 {execution.execution_id} 已是 {execution.status} 狀態，不覆寫結果")
+    return execution
 
 def execute_job(job_id):
-    """執行排程任務"""
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
-        try:
-            # 從資料庫獲取任務資訊
-            job = JobScheduler.objects.get(job_id=job_id)
-            program = job.program
-            
-            # 創建執行記錄
-            execution = JobExecution.objects.create(
-                job=job,
-                status='running',
-                start_time=timezone.now()
+    """
+    排程觸發：將任務放入引擎執行槽佇列，不在排程執行緒上等待引擎結束
+    回傳是否已放入佇列 (同一個任務仍在等待或執行中時為 False)
+    """
+    if not is_scheduler_leader():
+        # 租約已過期 (可能已由其他行程接手)，排程器尚未停止前的觸發不派發
+        logger.warning(f"本行程已不是排程器 leader，略過任務 {job_id} 的觸發")
+        return False
+    try:
+        job = JobScheduler.objects.select_related('program').get(job_id=job_id)
+    except JobScheduler.DoesNotExist:
+        logger.error(f"找不到任務 {job_id}，略過本次觸發")
+        return False
+
+    program = job.program
+    queued_at = timezone.now()
+    deadline = resolve_deadline(job.deadline_time, queued_at)
+    expected = expected_durations([job.job_id]).get(job.job_id) or DEFAULT_DURATION
+    return get_engine_executor().submit(
+        job.job_id, program.workspace_id, program.dataset_id, run_job, job.job_id, queued_at, deadline,
+        priority=job.priority,
+        deadline=deadline.timestamp() if deadline else None,
+        expected_duration=expected.total_seconds(),
+    )
+
+def resolve_deadline(deadline_time, fired_at):
+    """
+    將任務的完成期限 (當地時間) 換算成本次執行的期限
+    超過 12 小時前的時間視為隔天，例如 23:00 觸發、07:00 截止的任務期限為隔天 07:00
+    """
+    if deadline_time is None:
+        return None
+    local_fired_at = timezone.localtime(fired_at)
+    deadline = local_fired_at.replace(
+        hour=deadline_time.hour, minute=deadline_time.minute, second=deadline_time.second, microsecond=0
+    )
+    if deadline < local_fired_at - timedelta(hours=12):
+        deadline += timedelta(days=1)
+    return deadline
+
+def run_job(job_id, queued_at=None, deadline=None):
+    """在引擎執行槽中執行排程任務"""
+    try:
+        job = JobScheduler.objects.select_related('program').get(job_id=job_id)
+        program = job.program
+        # 創建執行記錄與更新任務狀態摘要交給寫入執行緒，與其他執行的寫入合併提交
+        # (資料庫鎖定由寫入執行緒重試，這裡不再重試，避免在執行槽中等待)
+        execution = get_db_writer().call(start_execution, job, queued_at, deadline)
+    except Exception as e:
+        logger.error(f"執行任務 {job_id} 時發生錯誤: {str(e)}")
+        return None
+
+    return run_execution(execution, job, program, ProgressRecorder(execution.execution_id))
+
+def _drop_execution(execution, progress):
+    """執行槽關閉時仍在等待重新整理的執行"""
+    finish_execution(execution, 'aborted', '排程器停止，未執行')
+    progress.finish(execution.status)
+
+def run_execution(execution, job, program, progress, refresh_wait=None):
+    """
+    執行已建立執行記錄的任務
+    需要等待同一 dataset 的重新整理時回傳 Requeue，不在執行槽中等待
+    """
+    refresh_events = None
+    try:
+        # 同一 dataset 進行中或剛完成的重新整理可以共用
+        refresh_params = coordinate_refresh(execution, program, refresh_wait)
+        if isinstance(refresh_params, RefreshWait):
+            return Requeue(
+                REFRESH_POLL_INTERVAL, run_execution, execution, job, program, progress, refresh_params,
+                on_drop=lambda: _drop_execution(execution, progress),
+            )
+        if refresh_params is None:
+            finish_execution(execution, 'aborted', None)
+            progress.finish(execution.status)
+            return None
+        refresh_events = RefreshEventHandler(refresh_params, next_handler=progress.record)
+
+        # 執行 PowerBI 引擎，輸出在執行期間分批寫入 execution.output
+        with ExecutionOutputWriter(execution.execution_id) as writer:
+            error = execute_powerbi_engine(
+                program, execution.execution_id, writer.write,
+                on_event=refresh_events, extra_params=refresh_params
             )
-            
-            try:
-                # 執行 PowerBI 引擎
-                output, error = execute_powerbi_engine(program)
-                
-                # 更新執行記錄
-                execution.status = 'completed' if not error else 'failed'
-                execution.end_time = timezone.now()
-                execution.output = output
-                execution.error = error
-                execution.save()
-                
-                logger.info(f"任務 {job.job_name} 執行成功")
-                break  # 成功執行，跳出重試循環
-                
-            except Exception as e:
-                # 更新執行記錄為失敗
-                execution.status = 'failed'
-                execution.end_time = timezone.now()
-                execution.error = str(e)
-                execution.save()
-                
-                logger.error(f"任務 {job.job_name} 執行失敗: {str(e)}")
-                break  # 執行失敗，跳出重試循環
-                
-        except OperationalError as e:
-            if "database is locked" in str(e).lower():
-                if attempt < max_retries - 1:
-                    wait_time = retry_delay * (2 ** attempt)
-                    logger.warning(f"資料庫鎖定，{wait_time} 秒後重試... (嘗試 {attempt + 1}/{max_retries})")
-                    time.sleep(wait_time)
-                else:
-                    logger.error(f"資料庫鎖定，已重試 {max_retries} 次")
-                    raise
-            else:
-                raise
-        except Exception as e:
-            logger.error(f"執行任務 {job_id} 時發生錯誤: {str(e)}")
-            break  # 其他錯誤，跳出重試循環
-
-@retry_on_db_lock
+        refresh_events.finish(error)
+
+        # 更新執行記錄 (不覆寫已串流寫入的 output)
+        finish_execution(execution, 'completed' if not error else 'failed', error)
+        progress.finish(execution.status)
+
+        logger.info(f"任務 {job.job_name} 執行成功")
+
+    except Exception as e:
+        # 更新執行記錄為失敗
+        if refresh_events is not None:
+            refresh_events.finish(str(e))
+        finish_execution(execution, 'failed', str(e))
+        progress.finish(execution.status)
+
+        logger.error(f"任務 {job.job_name} 執行失敗: {str(e)}")
+
 def init_scheduler():
     """初始化排程器"""
-    scheduler = BackgroundScheduler()
-    scheduler.add_jobstore(DjangoJobStore(), "default")
-    
-    # 載入所有啟用的任務
-    jobs = JobScheduler.objects.filter(enabled=True)
-    for job in jobs:
-        try:
-            scheduler.add_job(
-                execute_job,
-                CronTrigger.from_crontab(job.cron_expression),
-                id=str(job.job_id),
-                name=job.job_name,
-                args=[job.job_id],
-                replace_existing=True,
-                max_instances=1  # 限制同時執行的實例數
-            )
-            logger.info(f"已添加排程任務: {job.job_name}")
-        except Exception as e:
-            logger.error(f"添加排程任務 {job.job_name} 失敗: {str(e)}")
+    # APScheduler 會修改傳入的設定字典，因此使用副本
+    scheduler = BackgroundScheduler(copy.deepcopy(settings.SCHEDULER_CONFIG))
+    get_engine_executor()
+    if get_engine_config()['warm_workers']:
+        get_engine_pool()
     
     # 設置 APScheduler 的錯誤處理
     scheduler.add_listener(
@@ -163,6 +316,57 @@ def init_scheduler():
         EVENT_JOB_ERROR
     )
     
-    scheduler.start()
-    return scheduler 
+    # 定期清除過期的執行記錄檔
+    scheduler.add_job(
+        purge_execution_logs,
+        'interval',
+        hours=6,
+        id='purge_execution_logs',
+        name='Purge execution logs',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    # 定期維護 SQLite (ANALYZE、incremental vacuum、WAL checkpoint)
+    scheduler.add_job(
+        run_sqlite_maintenance,
+        'interval',
+        hours=1,
+        id='sqlite_maintenance',
+        name='SQLite maintenance',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    # 定期重新規劃 flex window 任務的延遲 (啟動時先規劃一次)
+    scheduler.add_job(
+        plan_flex_offsets,
+        'interval',
+        hours=1,
+        next_run_time=timezone.now(),
+        id='plan_flex_offsets',
+        name='Plan flex window offsets',
+        replace_existing=True,
+        max_instances=1
+    )
+
+    # 以暫停狀態啟動，讓 job store 先載入既有的任務，再比對資料庫只套用差異
+    scheduler.start(paused=True)
+    reconciler = ScheduleReconciler(scheduler, execute_job)
+    reconciler.reconcile_all()
+    scheduler.resume()
+
+    # 之後的任務變更由同步器增量套用
+    reconciler.start()
+    scheduler.reconciler = reconciler
+    return scheduler
+
+
 
+def shutdown_scheduler(scheduler):
+    """停止觸發與同步任務 (失去 leader 身分或行程結束時)；引擎執行槽中的任務繼續執行完畢"""
+    reconciler = getattr(scheduler, 'reconciler', None)
+    if reconciler is not None:
+        reconciler.stop()
+    if scheduler.running:
+        scheduler.shutdown(wait=False)
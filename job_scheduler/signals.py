@@ -0,0 +1,28 @@
+"""任務設定變更時寫入 JobChange，並通知本行程的排程同步器"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import JobChange, JobScheduler
+
+
+def _notify_reconciler():
+    # 同步器 (APScheduler trigger) 只在排程行程需要，web 行程不在啟動時載入
+    from .reconciler import notify_reconciler
+    notify_reconciler()
+
+
+def _record_change(job_id, action):
+    # 與任務的異動在同一個交易中寫入，交易提交後才通知同步器
+    JobChange.objects.create(job_id=job_id, action=action)
+    transaction.on_commit(_notify_reconciler)
+
+
+@receiver(post_save, sender=JobScheduler)
+def job_saved(sender, instance, **kwargs):
+    _record_change(instance.job_id, 'save')
+
+
+@receiver(post_delete, sender=JobScheduler)
+def job_deleted(sender, instance, **kwargs):
+    _record_change(instance.job_id, 'delete')
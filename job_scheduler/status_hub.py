@@ -0,0 +1,173 @@
+"""
+任務狀態的長輪詢 (long-poll)
+
+狀態與執行記錄 API 帶上 ?version=<上次回應的 version>&wait=<秒> 時，
+在 JobStatus.version 改變前不回應 (最多 wait 秒)。
+StatusHub 在 ASGI 行程中讓同一個事件迴圈內所有等待中的請求共用一個輪詢工作：
+每次輪詢只查詢一次被等待任務的 version；版本改變時同時讀取這些任務的狀態摘要，
+交給所有等待者直接回應，等待的連線再多也不會增加資料庫查詢。
+
+查詢在這個模組專用的執行緒 (READ_THREADS 個，各自一個資料庫連線) 中執行，
+不經過 asgiref 的 sync_to_async：不會佔用請求的執行緒，也不會與其他 async view 的查詢
+擠在同一個共用執行緒上。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from django.db import DatabaseError, connection
+import asyncio
+import contextvars
+import logging
+import threading
+import weakref
+
+from .models import JobScheduler, JobStatus
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+MAX_WAIT = 60.0
+READ_THREADS = 4
+# 每個查詢的任務數 (SQLite 的參數數量有上限)
+QUERY_CHUNK = 500
+
+_read_executor = None
+_read_executor_lock = threading.Lock()
+
+
+def _get_read_executor():
+    global _read_executor
+    with _read_executor_lock:
+        if _read_executor is None:
+            _read_executor = ThreadPoolExecutor(max_workers=READ_THREADS, thread_name_prefix='status-hub')
+        return _read_executor
+
+
+def _run_read(func, args):
+    try:
+        return func(*args)
+    except DatabaseError:
+        # 連線可能已失效，下一次讀取重新連線
+        connection.close()
+        raise
+
+
+async def read(func, *args):
+    """在讀取執行緒中執行 func (使用同步 ORM 的函式) 並回傳結果"""
+    return await asyncio.get_running_loop().run_in_executor(_get_read_executor(), _run_read, func, args)
+
+
+def _read_versions(job_ids):
+    # 尚未建立摘要的任務視為版本 0
+    versions = dict.fromkeys(job_ids, 0)
+    for start in range(0, len(job_ids), QUERY_CHUNK):
+        versions.update(
+            JobStatus.objects.filter(job_id__in=job_ids[start:start + QUERY_CHUNK]).values_list('job_id', 'version')
+        )
+    return versions
+
+
+def _read_jobs(job_ids):
+    """版本改變的任務 (含狀態摘要)；已刪除的任務不在結果中"""
+    jobs = {}
+    for start in range(0, len(job_ids), QUERY_CHUNK):
+        jobs.update(
+            (job.job_id, job) for job in
+            JobScheduler.objects.select_related('status_summary').filter(job_id__in=job_ids[start:start + QUERY_CHUNK])
+        )
+    return jobs
+
+
+class _JobWatch:
+    """單一任務的最新版本、對應的任務資料與等待者"""
+
+    def __init__(self):
+        self.version = None  # 尚未輪詢到時為 None
+        self.job = None
+        self.waiters = 0
+        self.changed = asyncio.Condition()
+
+
+class StatusHub:
+    """同一個事件迴圈內共用的 JobStatus.version 輪詢器"""
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._watches = {}
+        self._task = None
+
+    @property
+    def watched_jobs(self):
+        return len(self._watches)
+
+    async def _poll_once(self):
+        versions = await read(_read_versions, list(self._watches))
+        changed = [
+            job_id for job_id, version in versions.items()
+            if job_id in self._watches and self._watches[job_id].version != version
+        ]
+        if not changed:
+            return
+        jobs = await read(_read_jobs, changed)
+        for job_id in changed:
+            watch = self._watches.get(job_id)
+            if watch is None:
+                continue
+            async with watch.changed:
+                watch.version = versions[job_id]
+                watch.job = jobs.get(job_id)
+                watch.changed.notify_all()
+
+    async def _poll(self):
+        while self._watches:
+            try:
+                await self._poll_once()
+            except Exception as e:
+                # 等待中的請求會逾時並回應目前的狀態
+                logger.error(f"讀取任務狀態版本失敗: {str(e)}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _ensure_polling(self):
+        if self._task is None or self._task.done():
+            # 在空的 context 中建立，不繼承第一個等待的請求的 context (請求結束後輪詢仍繼續)
+            loop = asyncio.get_running_loop()
+            self._task = contextvars.Context().run(loop.create_task, self._poll())
+
+    async def wait_for_change(self, job_id, version, timeout):
+        """
+        等待任務的版本不再是 version
+        回傳版本改變後的任務 (已載入 status_summary)；timeout 秒內沒有改變時回傳 None，
+        任務已刪除時拋出 JobScheduler.DoesNotExist
+        """
+        watch = self._watches.get(job_id)
+        if watch is None:
+            watch = self._watches[job_id] = _JobWatch()
+        watch.waiters += 1
+        self._ensure_polling()
+
+        try:
+            async with watch.changed:
+                await asyncio.wait_for(
+                    watch.changed.wait_for(lambda: watch.version is not None and watch.version != version),
+                    timeout,
+                )
+                job = watch.job
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            watch.waiters -= 1
+            if watch.waiters <= 0 and self._watches.get(job_id) is watch:
+                del self._watches[job_id]
+        if job is None:
+            raise JobScheduler.DoesNotExist(f"Job {job_id} was deleted")
+        return job
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_status_hub():
+    """取得目前事件迴圈的 StatusHub"""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = StatusHub()
+    return hub
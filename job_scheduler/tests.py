@@ -1,3 +1,964 @@
-from django.test import TestCase
+from django.db import connection
+from django.db.models import F
+from django.db.utils import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.utils import timezone
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock, skipUnless
+import gzip
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+from program.models import Program
+from . import process_registry
+from .engine_pool import BASE_DIR, timeout_message
+from .executor import EngineExecutor, Requeue
+from .leader import LeaderElection
+from .log_store import INDEX_FILE, LogStore
+from .db_writer import DirectWriter
+from .models import DatasetRefresh, JobChange, JobExecution, JobScheduler, JobStatus, SchedulerLease
+from .planner import plan_flex_offsets, plan_offsets
+from .refresh import RefreshWait, _record_refresh_result, coordinate_refresh
+from .scheduler import run_execution, run_job
+from .status_hub import POLL_INTERVAL
+
+# 引擎的模組 (scripts/) 以模組名稱互相匯入
+sys.path.insert(0, str(BASE_DIR / 'scripts'))
+from artifact_cache import ArtifactCache, artifact_key  # noqa: E402
+from powerbi_client import DOWNLOAD_CHUNK_SIZE, ApiClient, ApiError, PowerBIService  # noqa: E402
+from rate_limiter import RateLimiter, RateLimitTimeout  # noqa: E402
+from sharepoint_upload import CHUNK_ALIGNMENT, SharePointUploader, UploadSessionState  # noqa: E402
+from simulator import start_simulator  # noqa: E402
+
+
+def create_job(name='job', cron_expression='0 * * * *', **fields):
+    program = Program.objects.create(
+        program_name=f'{name}-program', workspace_id='ws', report_name='report', dataset_id=f'{name}-dataset',
+        method='export', output_name='output', output_type='pdf', sharepoint_site='', sharepoint_path='',
+        filelocation='',
+    )
+    return JobScheduler.objects.create(job_name=name, program=program, cron_expression=cron_expression, **fields)
+
+
+def later(delay, func):
+    """delay 秒後在其他執行緒 (與資料庫連線) 執行 func"""
+    def run():
+        time.sleep(delay)
+        try:
+            func()
+        finally:
+            connection.close()
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+class StatusLongPollTests(TransactionTestCase):
+    """長輪詢：StatusHub 以其他連線讀取版本，資料需要實際提交"""
+
+    def setUp(self):
+        self.job = create_job('long-poll')
+        self.version = JobStatus.objects.get(job_id=self.job.job_id).version
+        self.status_url = f'/job_scheduler/api/job/{self.job.job_id}/status/'
+        self.history_url = f'/job_scheduler/api/job/{self.job.job_id}/history/'
+
+    def bump_version(self):
+        JobStatus.objects.filter(job_id=self.job.job_id).update(version=F('version') + 1)
+
+    async def test_status_returns_soon_after_version_bump(self):
+        bump = later(0.3, self.bump_version)
+        started = time.monotonic()
+        response = await self.async_client.get(self.status_url, {'version': self.version, 'wait': 10})
+        elapsed = time.monotonic() - started
+        bump.join()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], self.version + 1)
+        self.assertGreaterEqual(elapsed, 0.3)
+        # 最多一個輪詢間隔加上回應的時間
+        self.assertLess(elapsed, 0.3 + POLL_INTERVAL + 0.5)
+
+    async def test_history_returns_soon_after_version_bump(self):
+        bump = later(0.3, self.bump_version)
+        started = time.monotonic()
+        response = await self.async_client.get(self.history_url, {'version': self.version, 'wait': 10})
+        elapsed = time.monotonic() - started
+        bump.join()
+
+        self.assertEqual(response.json(), {'history': [], 'version': self.version + 1})
+        self.assertLess(elapsed, 0.3 + POLL_INTERVAL + 0.5)
+
+    async def test_times_out_with_current_state(self):
+        started = time.monotonic()
+        response = await self.async_client.get(self.status_url, {'version': self.version, 'wait': 0.5})
+        self.assertGreaterEqual(time.monotonic() - started, 0.5)
+        self.assertEqual(response.json()['version'], self.version)
+
+    async def test_stale_version_returns_immediately(self):
+        started = time.monotonic()
+        response = await self.async_client.get(self.status_url, {'version': self.version - 1, 'wait': 10})
+        self.assertLess(time.monotonic() - started, POLL_INTERVAL)
+        self.assertEqual(response.json()['version'], self.version)
+
+    async def test_deleted_job_while_waiting(self):
+        deleted = later(0.3, lambda: JobScheduler.objects.filter(job_id=self.job.job_id).delete())
+        response = await self.async_client.get(self.status_url, {'version': self.version, 'wait': 10})
+        deleted.join()
+        self.assertEqual(response.status_code, 404)
+
+    async def test_invalid_parameters_and_method(self):
+        response = await self.async_client.get(self.status_url, {'version': 'x'})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(self.history_url)
+        self.assertEqual(response.status_code, 405)
+
+
+class TimeoutMessageTests(SimpleTestCase):
+    def test_uses_configured_timeout(self):
+        self.assertEqual(timeout_message(3600), "執行超時 超過1小時 ")
+        self.assertEqual(timeout_message(7200), "執行超時 超過2小時 ")
+        self.assertEqual(timeout_message(1800), "執行超時 超過30分鐘 ")
+        self.assertEqual(timeout_message(90), "執行超時 超過90秒 ")
+
+
+class EngineExecutorTests(SimpleTestCase):
+    """執行槽：排序、workspace / dataset 上限與重複觸發"""
+
+    def setUp(self):
+        self.started = []
+        self.started_changed = threading.Condition()
+        self.release = {}
+
+    def make_executor(self, **limits):
+        executor = EngineExecutor(**limits)
+        self.addCleanup(executor.shutdown)
+        # 先放行所有工作，shutdown 才不會等待被擋住的執行槽
+        self.addCleanup(lambda: [event.set() for event in self.release.values()])
+        return executor
+
+    def task(self, job_id):
+        """記錄開始的順序並等待 release[job_id]"""
+        self.release[job_id] = threading.Event()
+
+        def run():
+            with self.started_changed:
+                self.started.append(job_id)
+                self.started_changed.notify_all()
+            self.release[job_id].wait(5)
+        return run
+
+    def wait_started(self, count):
+        with self.started_changed:
+            self.assertTrue(self.started_changed.wait_for(lambda: len(self.started) >= count, 5))
+        # 讓其他可執行的工作也有機會開始
+        time.sleep(0.05)
+        return list(self.started)
+
+    def submit(self, executor, job_id, workspace='ws', dataset=None, **kwargs):
+        return executor.submit(job_id, workspace, dataset or f'ds-{job_id}', self.task(job_id), **kwargs)
+
+    def test_orders_by_latest_start_then_priority(self):
+        executor = self.make_executor(max_slots=1)
+        self.submit(executor, 'blocker')
+        self.wait_started(1)
+
+        now = time.time()
+        self.submit(executor, 'no-deadline')
+        self.submit(executor, 'high-priority', priority=10)
+        self.submit(executor, 'late', deadline=now + 600, expected_duration=60)
+        # 截止時間較晚，但預估執行時間較長，最晚開始時間較早
+        self.submit(executor, 'long', deadline=now + 900, expected_duration=600)
+
+        for count, job_id in enumerate(['blocker', 'long', 'late', 'high-priority'], start=2):
+            self.release[job_id].set()
+            self.wait_started(count)
+        self.assertEqual(self.started, ['blocker', 'long', 'late', 'high-priority', 'no-deadline'])
+
+    def test_requeue_releases_slot(self):
+        executor = self.make_executor(max_slots=1)
+        continued = threading.Event()
+        executor.submit('waiting', 'ws', 'ds', lambda: Requeue(0.2, continued.set))
+        self.submit(executor, 'other')
+
+        # 等待期間執行槽交給其他工作，同一個 job 仍視為執行中
+        self.assertEqual(self.wait_started(1), ['other'])
+        with self.assertLogs('job_scheduler.executor', 'WARNING'):
+            self.assertFalse(executor.submit('waiting', 'ws', 'ds', lambda: None))
+        self.assertEqual(executor.stats()['delayed'], 1)
+        self.release['other'].set()
+        self.assertTrue(continued.wait(5))
+
+    def test_shutdown_drops_requeued_work(self):
+        executor = self.make_executor(max_slots=1)
+        dropped = threading.Event()
+        executor.submit('waiting', 'ws', 'ds', lambda: Requeue(60, lambda: None, on_drop=dropped.set))
+        deadline = time.monotonic() + 5
+        while executor.stats()['delayed'] != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        with self.assertLogs('job_scheduler.executor', 'WARNING'):
+            executor.shutdown()
+        self.assertTrue(dropped.is_set())
+        self.assertEqual(executor.stats()['delayed'], 0)
+
+    def test_dataset_cap_does_not_block_other_work(self):
+        executor = self.make_executor(max_slots=2, max_per_dataset=1)
+        self.submit(executor, 'a1', dataset='a')
+        self.submit(executor, 'a2', dataset='a')
+        self.submit(executor, 'b1', dataset='b')
+
+        self.assertEqual(self.wait_started(2), ['a1', 'b1'])
+        self.assertEqual(executor.stats()['pending'], 1)
+        self.assertEqual(executor.stats()['running_by_dataset'], {'a': 1, 'b': 1})
+
+        self.release['a1'].set()
+        self.assertEqual(self.wait_started(3), ['a1', 'b1', 'a2'])
+
+    def test_workspace_and_slot_caps(self):
+        executor = self.make_executor(max_slots=3, max_per_workspace=2)
+        for job_id in ['x1', 'x2', 'x3']:
+            self.submit(executor, job_id, workspace='x')
+        self.submit(executor, 'y1', workspace='y')
+        self.submit(executor, 'y2', workspace='y')
+
+        self.assertEqual(self.wait_started(3), ['x1', 'x2', 'y1'])
+        stats = executor.stats()
+        self.assertEqual((stats['running'], stats['pending']), (3, 2))
+        self.assertEqual(stats['running_by_workspace'], {'x': 2, 'y': 1})
+
+        # 空出的執行槽給 y2：x3 仍受 workspace 上限限制
+        self.release['y1'].set()
+        self.assertEqual(self.wait_started(4), ['x1', 'x2', 'y1', 'y2'])
+        self.release['x1'].set()
+        self.assertEqual(self.wait_started(5)[-1], 'x3')
+
+    def test_skips_job_already_pending_or_running(self):
+        executor = self.make_executor(max_slots=1)
+        self.assertTrue(self.submit(executor, 'job'))
+        self.wait_started(1)
+        with self.assertLogs('job_scheduler.executor', 'WARNING'):
+            self.assertFalse(executor.submit('job', 'ws', 'ds-job', lambda: None))
+
+        self.release['job'].set()
+        executor.shutdown(wait=True)
+        with self.assertRaises(RuntimeError):
+            executor.submit('job', 'ws', 'ds-job', lambda: None)
+
+
+class LogStoreTests(SimpleTestCase):
+    """分段記錄檔：區間讀取、tail、封存與保留期限"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.store = LogStore(tmp.name, segment_bytes=16, sealed_cache_segments=2)
+
+    def write(self, execution_id, lines, close=True):
+        writer = self.store.writer(execution_id)
+        for line in lines:
+            writer.append(line + '\n')
+        if close:
+            writer.close()
+        return writer
+
+    def test_range_across_segments(self):
+        text = ''.join(f'line {i:02d} 中文\n' for i in range(10))
+        self.write('e1', text.splitlines())
+        data = text.encode('utf-8')
+
+        self.assertEqual(self.store.size('e1'), len(data))
+        self.assertEqual(self.store.read_range('e1'), (text, len(data)))
+        self.assertEqual(self.store.read_range('e1', 10, 50)[0], data[10:50].decode('utf-8', errors='replace'))
+        self.assertEqual(self.store.read_range('e1', len(data)), ('', len(data)))
+
+        # whole_lines 截到最後一個換行，回傳的位移可以接著讀
+        chunk, position = self.store.read_range('e1', 0, 40, whole_lines=True)
+        self.assertTrue(chunk.endswith('\n'))
+        self.assertEqual(position, len(chunk.encode('utf-8')))
+        rest, end = self.store.read_range('e1', position)
+        self.assertEqual(chunk + rest, text)
+        self.assertEqual(end, len(data))
+
+    def test_tail(self):
+        lines = [f'line {i}' for i in range(20)]
+        writer = self.write('e1', lines, close=False)
+        self.assertEqual(self.store.tail('e1', lines=3), 'line 17\nline 18\nline 19\n')
+        self.assertEqual(self.store.tail('e1', max_bytes=8), 'line 19\n')
+        writer.append('partial')
+        self.assertEqual(self.store.tail('e1', lines=2), 'line 19\npartial')
+        writer.close()
+        self.assertEqual(self.store.tail('e1', lines=1), 'partial')
+
+    def test_seal_compresses_segments(self):
+        self.write('e1', [f'line {i}' for i in range(10)])
+        path = self.store.path_for('e1')
+        index = self.store.read_index('e1')
+
+        self.assertTrue(index['closed'])
+        self.assertTrue(all(segment['sealed'] for segment in index['segments']))
+        self.assertEqual(sorted(f.name for f in path.iterdir()), sorted(
+            [INDEX_FILE] + [segment['name'] for segment in index['segments']]
+        ))
+        self.assertTrue(all(segment['name'].endswith('.log.gz') for segment in index['segments']))
+        self.assertEqual(sum(segment['lines'] for segment in index['segments']), 10)
+
+    def test_stale_index_reads_sealed_segment(self):
+        writer = self.write('e1', ['abc'], close=False)
+        segments = self.store._segments('e1')
+        self.assertFalse(segments[-1][0]['sealed'])
+
+        # 讀取端載入索引後，寫入端封存並刪除原檔
+        writer.close()
+        self.assertFalse((self.store.path_for('e1') / segments[-1][0]['name']).exists())
+        self.assertEqual(self.store._read_segment('e1', segments[-1][0], 0, 4), b'abc\n')
+
+    def test_sealed_segments_are_cached(self):
+        self.write('e1', [f'line {i}' for i in range(3)])
+        with mock.patch('job_scheduler.log_store.gzip.open', wraps=gzip.open) as gzip_open:
+            for _ in range(5):
+                self.store.tail('e1', lines=1)
+        self.assertEqual(gzip_open.call_count, 1)
+
+        self.store.delete('e1')
+        self.assertFalse(self.store.path_for('e1').exists())
+        self.assertEqual(self.store.tail('e1'), '')
+
+    def test_retention(self):
+        for execution_id in ['old', 'older', 'new']:
+            self.write(execution_id, ['x' * 40])
+        self.write('running', ['x' * 40], close=False)
+        now = time.time()
+        for execution_id, age_days in [('old', 10), ('older', 20), ('running', 20)]:
+            index = self.store.path_for(execution_id) / INDEX_FILE
+            os.utime(index, (now - age_days * 86400,) * 2)
+
+        # 執行中 (未關閉) 的記錄不會被刪除
+        self.assertEqual(self.store.apply_retention(max_age_days=15), ['older'])
+        new_bytes = sum(f.stat().st_size for f in self.store.path_for('new').iterdir())
+        self.assertEqual(self.store.apply_retention(max_total_bytes=new_bytes), ['old'])
+        self.assertEqual(
+            sorted(path.name for path in Path(self.store.root).iterdir()), ['new', 'running']
+        )
+
+
+class FakeClock:
+    """RateLimiter 的 clock 與 sleep：sleep 只推進時間"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        self.slept += seconds
+
+
+class RateLimiterTests(SimpleTestCase):
+    """共用的 token bucket：突發、補充、排隊與伺服器限流"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'rate_limits.sqlite3')
+        self.clock = FakeClock()
+        self.limiter = self.make_limiter()
+
+    def make_limiter(self):
+        limiter = RateLimiter(
+            self.path, limits={'test': {'rate': 2.0, 'burst': 3, 'scope': 'workspace'}},
+            sleep=self.clock.sleep, clock=self.clock,
+        )
+        self.addCleanup(limiter.close)
+        return limiter
+
+    def test_burst_then_rate(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.acquire('test', 'ws'), 0.0)
+        # 桶已空：依到達順序各等待一個 token 的補充時間
+        self.assertEqual(self.limiter.expected_wait('test', 'ws'), 0.5)
+        self.assertEqual(self.limiter.acquire('test', 'ws'), 0.5)
+        self.assertEqual(self.limiter.acquire('test', 'ws'), 0.5)
+        self.assertEqual(self.clock.slept, 1.0)
+
+    def test_refill_is_capped_at_burst(self):
+        for _ in range(3):
+            self.limiter.acquire('test', 'ws')
+        self.clock.now += 1.0
+        # 1 秒補充 2 個 token
+        self.assertEqual(self.limiter.acquire('test', 'ws', tokens=2), 0.0)
+        self.assertEqual(self.limiter.expected_wait('test', 'ws'), 0.5)
+
+        self.clock.now += 60
+        for _ in range(3):
+            self.assertEqual(self.limiter.acquire('test', 'ws'), 0.0)
+        self.assertEqual(self.limiter.expected_wait('test', 'ws'), 0.5)
+
+    def test_buckets_are_scoped_and_shared_across_processes(self):
+        other = self.make_limiter()
+        for _ in range(3):
+            self.limiter.acquire('test', 'ws')
+        # 同一個資料庫檔的其他 limiter (其他引擎行程) 共用同一個桶
+        self.assertEqual(other.expected_wait('test', 'ws'), 0.5)
+        self.assertEqual(other.expected_wait('test', 'other-ws'), 0.0)
+
+    def test_timeout_does_not_consume_tokens(self):
+        for _ in range(3):
+            self.limiter.acquire('test', 'ws')
+        with self.assertRaises(RateLimitTimeout):
+            self.limiter.acquire('test', 'ws', tokens=2, timeout=0.5)
+        self.assertEqual(self.limiter.expected_wait('test', 'ws'), 0.5)
+
+    def test_penalize_blocks_bucket(self):
+        self.limiter.penalize('test', 'ws', retry_after=5)
+        self.assertEqual(self.limiter.expected_wait('test', 'ws'), 5.0)
+        self.assertEqual(self.limiter.acquire('test', 'ws'), 5.0)
+        self.assertEqual(self.clock.slept, 5.0)
+
+
+class ArtifactCacheTests(SimpleTestCase):
+    """匯出檔快取：命中時複製、雜湊不符視為未命中、LRU 與大小淘汰"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.clock = FakeClock()
+
+    def make_cache(self, **limits):
+        cache = ArtifactCache(self.tmp / 'cache', clock=self.clock, **limits)
+        self.addCleanup(cache.close)
+        return cache
+
+    def put(self, cache, key, content):
+        source = self.tmp / f'{key}.src'
+        source.write_bytes(content)
+        self.clock.now += 1
+        return cache.put(key, source)
+
+    def objects(self, cache):
+        return sorted(path.name for path in Path(cache.objects_dir).rglob('*') if path.is_file())
+
+    def test_hit_copies_stored_file(self):
+        cache = self.make_cache()
+        entry = self.put(cache, 'a', b'report')
+        # 來源檔之後被覆寫也不影響快取內容
+        (self.tmp / 'a.src').write_bytes(b'changed')
+
+        destination = self.tmp / 'out' / 'report.pdf'
+        self.assertEqual(cache.get('a', destination), entry)
+        self.assertEqual(destination.read_bytes(), b'report')
+        self.assertIsNone(cache.get('missing', self.tmp / 'other.pdf'))
+        self.assertFalse((self.tmp / 'other.pdf').exists())
+
+    def test_corrupted_object_is_dropped(self):
+        cache = self.make_cache()
+        entry = self.put(cache, 'a', b'report')
+        object_path = Path(cache.objects_dir) / entry['sha256'][:2] / entry['sha256']
+        object_path.write_bytes(b'truncated')
+
+        destination = self.tmp / 'report.pdf'
+        destination.write_bytes(b'previous')
+        self.assertIsNone(cache.get('a', destination))
+        # 目的檔不被覆蓋，也不留下暫存檔
+        self.assertEqual(destination.read_bytes(), b'previous')
+        self.assertEqual(sorted(path.name for path in self.tmp.iterdir()), ['a.src', 'cache', 'report.pdf'])
+        self.assertEqual(cache.stats(), {'entries': 0, 'bytes': 0})
+
+    def test_max_entries_evicts_least_recently_used(self):
+        cache = self.make_cache(max_entries=2)
+        self.put(cache, 'a', b'aaa')
+        self.put(cache, 'b', b'bbb')
+        self.clock.now += 1
+        cache.get('a', self.tmp / 'out.pdf')
+        c = self.put(cache, 'c', b'ccc')
+
+        self.assertIsNone(cache.get('b', self.tmp / 'out.pdf'))
+        self.assertIsNotNone(cache.get('a', self.tmp / 'out.pdf'))
+        self.assertEqual(cache.stats(), {'entries': 2, 'bytes': 6})
+        self.assertEqual(len(self.objects(cache)), 2)
+        self.assertIn(c['sha256'], self.objects(cache))
+
+    def test_max_bytes_evicts_until_within_limit(self):
+        cache = self.make_cache(max_bytes=10)
+        self.put(cache, 'a', b'a' * 4)
+        # 相同內容共用一個物件，只有兩個 key 都被淘汰後才刪除
+        shared = self.put(cache, 'b', b'b' * 4)
+        self.put(cache, 'c', b'b' * 4)
+        self.assertEqual(cache.stats(), {'entries': 2, 'bytes': 8})
+        self.assertEqual(self.objects(cache), [shared['sha256']])
+
+        self.put(cache, 'd', b'd' * 9)
+        self.assertEqual(cache.stats(), {'entries': 1, 'bytes': 9})
+        self.assertEqual(len(self.objects(cache)), 1)
+        self.assertNotIn(shared['sha256'], self.objects(cache))
+
+    def test_key_requires_refresh_marker(self):
+        params = {'workspace_id': 'ws', 'report_name': 'report', 'dataset_id': 'ds',
+                  'method': 'export', 'output_type': 'pdf'}
+        self.assertIsNone(artifact_key(params, None))
+        self.assertIsNone(artifact_key(params, ''))
+        key = artifact_key(params, '2024-01-01T00:00:00Z')
+        self.assertEqual(key, artifact_key(dict(params), '2024-01-01T00:00:00Z'))
+        self.assertNotEqual(key, artifact_key(params, '2024-01-02T00:00:00Z'))
+        self.assertNotEqual(key, artifact_key({**params, 'output_type': 'pptx'}, '2024-01-01T00:00:00Z'))
+
+
+class PlannerTests(TestCase):
+    """flex window 任務的錯開規劃"""
+
+    def test_staggers_flexible_jobs(self):
+        create_job('fixed')
+        jobs = [create_job(name, flex_window=10) for name in ['a', 'b', 'c']]
+
+        offsets, peak_before, peak_after = plan_offsets()
+        # 固定的任務佔用整點那一分鐘，其餘依 job_id 順序往後錯開
+        self.assertEqual(offsets, {jobs[0].job_id: 60, jobs[1].job_id: 120, jobs[2].job_id: 180})
+        self.assertEqual((peak_before, peak_after), (4, 1))
+        self.assertEqual(plan_offsets()[0], offsets)
+
+    def test_longer_jobs_are_placed_first(self):
+        short = create_job('short', flex_window=10)
+        long = create_job('long', flex_window=10)
+        JobExecution.objects.create(job=long, status='completed', duration=timedelta(minutes=5))
+
+        offsets, _, peak_after = plan_offsets()
+        self.assertEqual(offsets, {long.job_id: 0, short.job_id: 300})
+        self.assertEqual(peak_after, 1)
+
+    def test_offsets_stay_inside_window(self):
+        create_job('fixed')
+        jobs = [create_job(name, flex_window=1) for name in ['a', 'b', 'c']]
+
+        offsets, _, peak_after = plan_offsets()
+        self.assertEqual(set(offsets), {job.job_id for job in jobs})
+        self.assertTrue(all(offset in (0, 60) for offset in offsets.values()))
+        self.assertEqual(peak_after, 2)
+
+    @mock.patch('job_scheduler.planner.notify_reconciler')
+    @mock.patch('job_scheduler.planner.get_db_writer', return_value=DirectWriter())
+    def test_plan_flex_offsets_writes_only_changes(self, get_db_writer, notify_reconciler):
+        create_job('fixed')
+        job = create_job('flex', flex_window=10)
+        last_seq = JobChange.objects.order_by('-seq').values_list('seq', flat=True).first() or 0
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(plan_flex_offsets(), {job.job_id: 60})
+        job.refresh_from_db()
+        self.assertEqual(job.flex_offset, 60)
+        self.assertEqual(list(JobChange.objects.filter(seq__gt=last_seq).values_list('job_id', 'action')),
+                         [(job.job_id, 'save')])
+        notify_reconciler.assert_called_once()
+
+        self.assertEqual(plan_flex_offsets(), {})
+
+
+class LeaderElectionTests(TestCase):
+    """資料庫租約：續約、過期後由其他行程接手與釋放"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        patcher = mock.patch('job_scheduler.leader.timezone.now', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_election(self):
+        election = LeaderElection(mock.Mock(), mock.Mock(), name='test', ttl=30, renew_interval=10)
+        self.addCleanup(election._transitions.shutdown)
+        return election
+
+    def tick(self, election):
+        """執行一次續約，並等待 on_elected / on_demoted 執行完"""
+        election._tick()
+        election._transitions.submit(lambda: None).result()
+
+    def lease(self):
+        return SchedulerLease.objects.get(name='test')
+
+    def test_only_one_leader_until_lease_expires(self):
+        first, second = self.make_election(), self.make_election()
+        self.tick(first)
+        self.tick(second)
+        self.assertTrue(first.is_leader())
+        self.assertFalse(second.is_leader())
+        self.assertEqual((self.lease().holder, self.lease().term), (first.identity, 1))
+        first.on_elected.assert_called_once()
+
+        # 續約後租約延長，其他行程仍無法取得
+        self.now += timedelta(seconds=20)
+        self.tick(first)
+        self.now += timedelta(seconds=20)
+        self.tick(second)
+        self.assertEqual(self.lease().holder, first.identity)
+        second.on_elected.assert_not_called()
+
+    def test_takeover_after_expiry(self):
+        first, second = self.make_election(), self.make_election()
+        self.tick(first)
+
+        # first 停止續約；期限過後 second 接手，term 遞增
+        self.now += timedelta(seconds=31)
+        with self.assertLogs('job_scheduler.leader', 'INFO'):
+            self.tick(second)
+        self.assertTrue(second.is_leader())
+        self.assertEqual((self.lease().holder, self.lease().term), (second.identity, 2))
+        second.on_elected.assert_called_once()
+
+        # first 下一次續約時發現租約已被取得，停止派發
+        with self.assertLogs('job_scheduler.leader', 'WARNING'):
+            self.tick(first)
+        self.assertFalse(first.is_leader())
+        first.on_demoted.assert_called_once()
+        self.assertEqual(self.lease().holder, second.identity)
+
+    def test_stop_releases_lease(self):
+        first, second = self.make_election(), self.make_election()
+        self.tick(first)
+        first.stop()
+        first.on_demoted.assert_called_once()
+
+        # 不必等待過期
+        self.tick(second)
+        self.assertTrue(second.is_leader())
+        self.assertEqual(self.lease().term, 2)
+
+    def test_demotes_when_renewal_keeps_failing(self):
+        election = self.make_election()
+        self.tick(election)
+        failing = mock.patch.object(election, '_try_acquire', side_effect=Exception('database is locked'))
+        with failing, self.assertLogs('job_scheduler.leader', 'WARNING'):
+            # 期限內暫時無法續約時維持 leader
+            self.tick(election)
+            self.assertTrue(election.is_leader())
+            # 本機計算的期限已過
+            election._valid_until = time.monotonic() - 1
+            self.tick(election)
+        self.assertFalse(election.is_leader())
+        election.on_demoted.assert_called_once()
+
+
+class ProcessRegistryTests(SimpleTestCase):
+    """中止的 SIGKILL 只送給仍在執行同一筆的引擎行程"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(process_registry, 'cancel_request_dir', return_value=Path(tmp.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        signal_group = mock.patch.object(process_registry, '_signal_group', return_value=True)
+        self.signal_group = signal_group.start()
+        self.addCleanup(signal_group.stop)
+        self.process = mock.Mock(pid=4321)
+
+    def register(self, execution_id):
+        with process_registry._lock:
+            process_registry._running[execution_id] = self.process
+        self.addCleanup(process_registry._running.pop, execution_id, None)
+
+    def escalate(self, process=None):
+        process_registry._escalate('current', self.process.pid, 0, process)
+
+    def escalate_and_kill(self, process=None):
+        with self.assertLogs('job_scheduler.process_registry', 'WARNING'):
+            self.escalate(process)
+        self.signal_group.assert_called_once()
+
+    def test_local_worker_that_moved_on_is_not_killed(self):
+        self.register('next')
+        self.escalate(self.process)
+        self.signal_group.assert_not_called()
+
+        self.register('current')
+        self.escalate_and_kill(self.process)
+
+    def test_remote_kill_requires_cancel_request_for_execution(self):
+        self.escalate()
+        process_registry._write_cancel_request(self.process.pid, 'next')
+        self.escalate()
+        self.signal_group.assert_not_called()
+
+        process_registry._write_cancel_request(self.process.pid, 'current')
+        self.escalate_and_kill()
+
+
+@skipUnless(os.name == 'posix', 'process groups are POSIX only')
+class KillProcessGroupTests(SimpleTestCase):
+    """逾時強制終止時，引擎啟動的子行程也一起結束"""
+
+    def test_kills_children(self):
+        process = subprocess.Popen(['sh', '-c', 'sleep 60 & echo $!; wait'], stdout=subprocess.PIPE,
+                                   text=True, start_new_session=True)
+        self.addCleanup(process.stdout.close)
+        child = int(process.stdout.readline())
+
+        process_registry.kill_process_group(process)
+        process.wait(timeout=5)
+        deadline = time.monotonic() + 5
+        # 子行程由 init 回收後就不存在
+        while time.monotonic() < deadline:
+            try:
+                os.kill(child, 0)
+            except ProcessLookupError:
+                break
+            time.sleep(0.05)
+        else:
+            self.fail(f'child process {child} outlived the kill')
+
+
+class JobListTests(TestCase):
+    def test_events_url_only_for_running_execution(self):
+        running, finished = create_job('running'), create_job('finished')
+        for job, status in [(running, 'running'), (finished, 'completed')]:
+            execution = JobExecution.objects.create(job=job, status=status)
+            JobStatus.record_execution(execution)
+        execution_id = JobExecution.objects.get(job=running).execution_id
+
+        response = self.client.get('/job_scheduler/api/jobs/', {'fields': 'job_name,last_status,events_url'})
+        rows = {row['job_name']: row for row in response.json()['jobs']}
+        self.assertEqual(rows['running']['events_url'], f'/job_scheduler/api/execution/{execution_id}/events/')
+        self.assertEqual(rows['finished'], {'job_name': 'finished', 'last_status': 'completed', 'events_url': None})
+
+
+class RunJobTests(TestCase):
+    @mock.patch('job_scheduler.scheduler.execute_powerbi_engine')
+    @mock.patch('job_scheduler.scheduler.get_db_writer')
+    def test_writer_failure_fails_run_once(self, get_db_writer, execute_powerbi_engine):
+        # 寫入執行緒已自行重試鎖定；失敗時不在執行槽中再重試
+        get_db_writer.return_value.call.side_effect = OperationalError('database is locked')
+        job = create_job('locked')
+        with mock.patch('time.sleep') as sleep, self.assertLogs('job_scheduler.scheduler', 'ERROR'):
+            run_job(job.job_id)
+        get_db_writer.return_value.call.assert_called_once()
+        sleep.assert_not_called()
+        execute_powerbi_engine.assert_not_called()
+        self.assertFalse(JobExecution.objects.filter(job=job).exists())
+
+
+class SharePointUploadTests(SimpleTestCase):
+    """分段上傳：以本機的 SharePoint 模擬器 (scripts/simulator.py) 測試"""
+
+    def setUp(self):
+        self.server = start_simulator(require_auth=False)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.sharepoint = self.server.state.sharepoint
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.local_path = os.path.join(tmp.name, 'report.pdf')
+        # 三個完整分段加上半個分段
+        self.content = os.urandom(CHUNK_ALIGNMENT * 3 + CHUNK_ALIGNMENT // 2)
+        with open(self.local_path, 'wb') as f:
+            f.write(self.content)
+
+    def make_uploader(self, **options):
+        client = ApiClient(self.server.base_url, max_retries=0, sleep=lambda seconds: None)
+        return SharePointUploader(client, 'site', chunk_size=CHUNK_ALIGNMENT, parallel=4, **options)
+
+    def uploaded(self):
+        return self.sharepoint.files[('site', 'reports/report.pdf')]['content']
+
+    def fail_chunk_once(self, uploader, failing_start):
+        """讓從 failing_start 開始的分段第一次上傳失敗"""
+        send_chunk = uploader._send_chunk
+        failed = []
+
+        def flaky(f, upload_url, start, end, size):
+            if start == failing_start and not failed:
+                failed.append(start)
+                raise ApiError('Simulated chunk failure', status=500)
+            return send_chunk(f, upload_url, start, end, size)
+        uploader._send_chunk = flaky
+
+    def test_parallel_chunked_upload(self):
+        result = self.make_uploader().upload(self.local_path, 'reports/report.pdf')
+        self.assertEqual(result, {'status': 'uploaded', 'bytes': len(self.content), 'resumed_from': None})
+        self.assertEqual(self.uploaded(), self.content)
+        self.assertEqual(self.sharepoint.counters, {'chunks': 4, 'chunk_bytes': len(self.content), 'sessions': 1})
+        self.assertIsNone(UploadSessionState(self.local_path).load())
+
+    def test_resends_only_missing_ranges_after_failed_chunk(self):
+        uploader = self.make_uploader()
+        self.fail_chunk_once(uploader, CHUNK_ALIGNMENT)
+        with self.assertLogs('power_bi_engine', 'WARNING'):
+            result = uploader.upload(self.local_path, 'reports/report.pdf')
+
+        self.assertEqual(result['status'], 'uploaded')
+        self.assertEqual(self.uploaded(), self.content)
+        # 已收到的分段不會重送
+        self.assertEqual(self.sharepoint.counters['chunks'], 4)
+        self.assertEqual(self.sharepoint.counters['chunk_bytes'], len(self.content))
+
+    def test_next_run_resumes_interrupted_session(self):
+        uploader = self.make_uploader(max_rounds=1)
+        self.fail_chunk_once(uploader, CHUNK_ALIGNMENT * 2)
+        with self.assertLogs('power_bi_engine', 'WARNING'), self.assertRaises(ApiError):
+            uploader.upload(self.local_path, 'reports/report.pdf')
+        self.assertIsNotNone(UploadSessionState(self.local_path).load())
+
+        result = self.make_uploader().upload(self.local_path, 'reports/report.pdf')
+        self.assertEqual(result, {'status': 'uploaded', 'bytes': CHUNK_ALIGNMENT, 'resumed_from': CHUNK_ALIGNMENT * 2})
+        self.assertEqual(self.uploaded(), self.content)
+        self.assertEqual(self.sharepoint.counters['sessions'], 1)
+        self.assertIsNone(UploadSessionState(self.local_path).load())
+
+    def test_skips_when_quickxorhash_matches(self):
+        uploader = self.make_uploader()
+        uploader.upload(self.local_path, 'reports/report.pdf')
+        counters = dict(self.sharepoint.counters)
+
+        result = uploader.upload(self.local_path, 'reports/report.pdf')
+        self.assertEqual(result, {'status': 'skipped', 'bytes': 0, 'resumed_from': None})
+        self.assertEqual(self.sharepoint.counters, counters)
+
+        # 內容不同 (大小相同) 時重新上傳
+        with open(self.local_path, 'r+b') as f:
+            f.write(b'changed')
+        self.assertEqual(uploader.upload(self.local_path, 'reports/report.pdf')['status'], 'uploaded')
+        self.assertEqual(self.sharepoint.counters['sessions'], 2)
+
+
+class PowerBIServiceTests(SimpleTestCase):
+    """Power BI 的重新整理與匯出：以本機模擬器測試"""
+
+    def setUp(self):
+        self.server = start_simulator(require_auth=False, export_seconds=0,
+                                      export_size=DOWNLOAD_CHUNK_SIZE * 2 + 100)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.powerbi = self.server.state.powerbi
+        client = ApiClient(f'{self.server.base_url}/v1.0/myorg', max_retries=0, sleep=lambda seconds: None)
+        self.service = PowerBIService(client, sleep=lambda seconds: None, poll_interval=0)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+
+    def test_export_streams_file_to_destination(self):
+        report_id = self.service.find_report('ws', 'report')
+        destination = self.tmp / 'out' / 'report.pdf'
+        size = self.service.export_report('ws', report_id, 'pdf', destination)
+
+        self.assertEqual(size, DOWNLOAD_CHUNK_SIZE * 2 + 100)
+        self.assertEqual(destination.stat().st_size, size)
+        self.assertEqual(os.listdir(destination.parent), ['report.pdf'])
+
+    def test_conflict_follows_newest_running_refresh(self):
+        # 兩個仍在執行的重新整理 (最新的在前)：較舊的不會結束
+        history = self.powerbi.refreshes.setdefault(('ws', 'ds'), [])
+        for request_id, done_at in (('newer', time.monotonic() + 0.2), ('older', float('inf'))):
+            history.append({'requestId': request_id, 'status': 'Unknown', '_done_at': done_at, '_fails': False})
+
+        with self.assertLogs('power_bi_engine', 'INFO'):
+            refresh = self.service.refresh_dataset('ws', 'ds', timeout=5)
+        self.assertEqual((refresh['requestId'], refresh['status']), ('newer', 'Completed'))
+
+    def test_unknown_request_id_fails_fast(self):
+        # 沒有 RequestId header，歷程中也沒有執行中的重新整理
+        with mock.patch.object(self.service.client, '_api_call', return_value=({'value': []}, {})):
+            with self.assertRaisesMessage(ApiError, 'request id is unknown'):
+                self.service.refresh_dataset('ws', 'ds', timeout=5)
+
+
+@mock.patch('job_scheduler.refresh.get_db_writer', return_value=DirectWriter())
+@mock.patch('job_scheduler.refresh.get_engine_config', return_value={'refresh_window': 600, 'refresh_wait_timeout': 1800})
+class RefreshCoordinationTests(TestCase):
+    """同一 dataset 的重新整理：leader / follower、新鮮度期間與中斷的紀錄"""
+
+    def setUp(self):
+        self.job = create_job('refresh')
+        self.program = self.job.program
+
+    def execution(self):
+        return JobExecution.objects.create(job=self.job, status='running')
+
+    def finish_refresh(self, refresh_id, status):
+        _record_refresh_result(refresh_id, status, timezone.now())
+
+    def test_leader_and_follower(self, *mocks):
+        leader, follower = self.execution(), self.execution()
+        leader_params = coordinate_refresh(leader, self.program)
+        self.assertTrue(leader_params['refresh_dataset'])
+
+        waiting = coordinate_refresh(follower, self.program)
+        self.assertIsInstance(waiting, RefreshWait)
+        self.assertEqual(waiting.refresh.pk, leader_params['refresh_id'])
+        # 重新整理仍在進行：繼續等待
+        self.assertIs(coordinate_refresh(follower, self.program, waiting), waiting)
+
+        self.finish_refresh(leader_params['refresh_id'], 'completed')
+        params = coordinate_refresh(follower, self.program, waiting)
+        self.assertEqual(params, {
+            'refresh_dataset': False, 'refresh_id': leader_params['refresh_id'],
+            'refresh_marker': leader_params['refresh_marker'], 'coalesced_with': str(leader.execution_id),
+        })
+        follower.refresh_from_db()
+        self.assertTrue(follower.refresh_coalesced)
+
+    def test_fresh_refresh_is_reused(self, *mocks):
+        refresh_id = coordinate_refresh(self.execution(), self.program)['refresh_id']
+        self.finish_refresh(refresh_id, 'completed')
+
+        params = coordinate_refresh(self.execution(), self.program)
+        self.assertEqual((params['refresh_dataset'], params['refresh_id']), (False, refresh_id))
+
+        # 超過新鮮度期間後重新整理
+        DatasetRefresh.objects.filter(pk=refresh_id).update(finished_at=timezone.now() - timedelta(seconds=700))
+        params = coordinate_refresh(self.execution(), self.program)
+        self.assertTrue(params['refresh_dataset'])
+        self.assertNotEqual(params['refresh_id'], refresh_id)
+
+    def test_stale_running_refresh_is_ignored(self, *mocks):
+        refresh_id = coordinate_refresh(self.execution(), self.program)['refresh_id']
+        # leader 所在的行程中斷，紀錄停在 running 超過等待上限
+        DatasetRefresh.objects.filter(pk=refresh_id).update(started_at=timezone.now() - timedelta(seconds=1801))
+
+        params = coordinate_refresh(self.execution(), self.program)
+        self.assertTrue(params['refresh_dataset'])
+        self.assertNotEqual(params['refresh_id'], refresh_id)
+
+    def test_follower_reclaims_after_leader_fails(self, *mocks):
+        refresh_id = coordinate_refresh(self.execution(), self.program)['refresh_id']
+        follower = self.execution()
+        waiting = coordinate_refresh(follower, self.program)
+        self.finish_refresh(refresh_id, 'failed')
+
+        with self.assertLogs('job_scheduler.refresh', 'WARNING'):
+            params = coordinate_refresh(follower, self.program, waiting)
+        self.assertTrue(params['refresh_dataset'])
+        self.assertNotEqual(params['refresh_id'], refresh_id)
+        self.assertEqual(DatasetRefresh.objects.get(pk=params['refresh_id']).leader_id, follower.execution_id)
+
+    def test_aborted_follower_stops_waiting(self, *mocks):
+        coordinate_refresh(self.execution(), self.program)
+        follower = self.execution()
+        waiting = coordinate_refresh(follower, self.program)
+        JobExecution.objects.filter(pk=follower.pk).update(status='aborted')
+        self.assertIsNone(coordinate_refresh(follower, self.program, waiting))
+
+    @mock.patch('job_scheduler.progress.get_db_writer', return_value=DirectWriter())
+    @mock.patch('job_scheduler.scheduler.get_db_writer', return_value=DirectWriter())
+    @mock.patch('job_scheduler.scheduler.execute_powerbi_engine')
+    def test_waiting_follower_releases_engine_slot(self, execute_powerbi_engine, *mocks):
+        coordinate_refresh(self.execution(), self.program)
+        follower = self.execution()
+        progress = mock.Mock()
+
+        requeue = run_execution(follower, self.job, self.program, progress)
+        self.assertIsInstance(requeue, Requeue)
+        self.assertIs(requeue.fn, run_execution)
+        execute_powerbi_engine.assert_not_called()
+
+        # 執行池關閉時結束執行記錄
+        requeue.on_drop()
+        follower.refresh_from_db()
+        self.assertEqual(follower.status, 'aborted')
+        progress.finish.assert_called_once_with('aborted')
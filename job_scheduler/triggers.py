@@ -0,0 +1,137 @@
+"""
+Cron 觸發器快取與執行時間預測
+
+CronTrigger.from_crontab 需要解析運算式並建立各欄位物件，
+同一個運算式在儲存任務、計算下次執行時間與排程器載入時會重複建立。
+這裡以 (運算式, 時區) 為鍵快取編譯後的觸發器；CronTrigger 計算下次執行時間
+時不會修改自身狀態，可安全共用。
+
+設定 flex window 的任務由 planner.py 指定延遲秒數，以 OffsetTrigger 包裝 cron 觸發器。
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.utils import timezone
+from apscheduler.triggers.base import BaseTrigger
+from apscheduler.triggers.cron import CronTrigger
+import logging
+
+logger = logging.getLogger(__name__)
+
+TRIGGER_CACHE_SIZE = 1024
+MAX_FIRES_PER_EXPRESSION = 7 * 24 * 60  # 每分鐘執行的任務預測 7 天
+
+
+@lru_cache(maxsize=TRIGGER_CACHE_SIZE)
+def _compile(cron_expression, tz_name):
+    try:
+        return CronTrigger.from_crontab(cron_expression, timezone=tz_name)
+    except Exception as e:
+        # 無效的運算式也會被快取，只記錄一次錯誤
+        logger.error(f"無效的 cron 運算式 '{cron_expression}': {str(e)}")
+        return None
+
+
+def get_cron_trigger(cron_expression, tz=None):
+    """取得編譯後的 CronTrigger；運算式無效時回傳 None"""
+    return _compile(cron_expression.strip(), str(tz or settings.TIME_ZONE))
+
+
+class OffsetTrigger(BaseTrigger):
+    """在 cron 觸發時間後延遲固定秒數執行"""
+
+    __slots__ = 'trigger', 'offset'
+
+    def __init__(self, trigger, offset):
+        self.trigger = trigger
+        self.offset = timedelta(seconds=offset)
+
+    def get_next_fire_time(self, previous_fire_time, now):
+        previous = previous_fire_time - self.offset if previous_fire_time else None
+        nominal = self.trigger.get_next_fire_time(previous, now - self.offset)
+        return nominal + self.offset if nominal else None
+
+    def __getstate__(self):
+        return {'version': 1, 'trigger': self.trigger, 'offset': self.offset.total_seconds()}
+
+    def __setstate__(self, state):
+        self.trigger = state['trigger']
+        self.offset = timedelta(seconds=state['offset'])
+
+    def __str__(self):
+        return f"{self.trigger} +{int(self.offset.total_seconds())}s"
+
+    def __repr__(self):
+        return f"<OffsetTrigger ({self.trigger!r}, offset={int(self.offset.total_seconds())}s)>"
+
+
+def build_trigger(cron_expression, offset=0, tz=None):
+    """取得任務使用的觸發器；offset (秒) 不為 0 時包裝為 OffsetTrigger"""
+    trigger = get_cron_trigger(cron_expression, tz)
+    if trigger is None or not offset:
+        return trigger
+    return OffsetTrigger(trigger, offset)
+
+
+def next_fire_time(cron_expression, now=None, tz=None, offset=0):
+    """計算下次執行時間"""
+    trigger = build_trigger(cron_expression, offset, tz)
+    if trigger is None:
+        return None
+    return trigger.get_next_fire_time(None, now or timezone.now())
+
+
+def fire_times(cron_expression, start, end, tz=None, limit=MAX_FIRES_PER_EXPRESSION, offset=0):
+    """列出 [start, end) 之間的所有執行時間"""
+    trigger = build_trigger(cron_expression, offset, tz)
+    if trigger is None:
+        return []
+    times = []
+    previous = None
+    now = start
+    while len(times) < limit:
+        fire_time = trigger.get_next_fire_time(previous, now)
+        if fire_time is None or fire_time >= end:
+            break
+        times.append(fire_time)
+        previous = fire_time
+        now = fire_time + timedelta(microseconds=1)
+    return times
+
+
+def forecast_fire_times(jobs, start, end, tz=None):
+    """
+    預測多個任務在 [start, end) 之間的執行時間
+    jobs 為 (job_id, cron_expression, offset 秒) 序列；相同運算式只計算一次
+    回傳 {job_id: [執行時間, ...]}
+    """
+    by_expression = defaultdict(list)
+    for job_id, cron_expression, offset in jobs:
+        by_expression[cron_expression.strip()].append((job_id, offset or 0))
+
+    forecast = {}
+    for cron_expression, members in by_expression.items():
+        # 往前多算最大延遲的時間，延遲後落在區間內的執行也要列入
+        max_offset = timedelta(seconds=max(offset for _, offset in members))
+        times = fire_times(cron_expression, start - max_offset, end, tz)
+        for job_id, offset in members:
+            delay = timedelta(seconds=offset)
+            forecast[job_id] = [t + delay for t in times if start <= t + delay < end]
+    return forecast
+
+
+def minute_load(forecast):
+    """將預測結果彙總為每分鐘的執行數與任務清單"""
+    counts = Counter()
+    job_ids = defaultdict(list)
+    for job_id, times in forecast.items():
+        for fire_time in times:
+            minute = fire_time.replace(second=0, microsecond=0)
+            counts[minute] += 1
+            job_ids[minute].append(job_id)
+    return [(minute, counts[minute], job_ids[minute]) for minute in sorted(counts)]
+
+
+def cache_info():
+    return _compile.cache_info()
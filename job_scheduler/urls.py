@@ -4,6 +4,12 @@ from . import views
 urlpatterns = [
     path('', views.job_scheduler_view, name='job_scheduler'),
     path('create/', views.create_job, name='create_job'),
+    path('api/jobs/', views.list_jobs, name='list_jobs'),
+    path('api/forecast/', views.get_schedule_forecast, name='get_schedule_forecast'),
     path('api/job/<int:job_id>/status/', views.get_job_status, name='get_job_status'),
     path('api/job/<int:job_id>/history/', views.get_execution_history, name='get_execution_history'),
+    path('api/job/<int:job_id>/run/', views.run_job_now, name='run_job_now'),
+    path('api/execution/<uuid:execution_id>/abort/', views.abort_job_execution, name='abort_job_execution'),
+    path('api/execution/<uuid:execution_id>/events/', views.execution_events, name='execution_events'),
+    path('api/execution/<uuid:execution_id>/log/', views.get_execution_log, name='get_execution_log'),
 ] 
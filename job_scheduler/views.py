@@ -1,40 +1,154 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.views.decorators.http import require_http_methods
-from .models import JobScheduler, JobExecution
+from .models import JobScheduler, JobExecution, JobStatus, ExecutionProgress
+from .progress import EVENT_FIELDS, KEEPALIVE_INTERVAL, POLL_INTERVAL, get_progress_hub, serialize_event
+from .status_hub import MAX_WAIT, get_status_hub
+from . import status_hub
+from .log_store import get_log_store
 from django.utils import timezone
+from django.db.models import Q
+from datetime import datetime, timedelta
+import base64
+import binascii
 import json
-from django.db import transaction
-from static.utils.db_utils import retry_on_db_lock
+import time
+from static.utils.db_utils import contended_atomic
 import logging
 
 logger = logging.getLogger(__name__)
 
-@retry_on_db_lock
+MAX_LOG_READ_BYTES = 256 * 1024
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+MAX_FORECAST_HOURS = 7 * 24
+# 任務列表 API 可投影的欄位
+JOB_COLUMNS = {'job_id', 'job_name', 'program_id', 'cron_expression', 'enabled', 'flex_window', 'flex_offset',
+               'priority'}
+FREQUENCY_FIELDS = {'trigger_frequence', 'trigger_hour', 'trigger_minute', 'trigger_day', 'trigger_date'}
+# events_url 只在最後一次執行仍在進行時提供 (任務列表以 SSE 顯示進度)
+STATUS_FIELDS = {'last_status', 'last_run_time', 'next_run_time', 'consecutive_failures', 'events_url'}
+STATUS_SUMMARY_COLUMNS = ('last_status', 'last_start_time', 'next_fire_time', 'consecutive_failures', 'version',
+                          'last_execution_id')
+LIST_FIELDS = JOB_COLUMNS | FREQUENCY_FIELDS | STATUS_FIELDS | {'program_name', 'created_at'}
+DEFAULT_LIST_FIELDS = ('job_id', 'job_name', 'program_id', 'program_name', 'enabled',
+                       'trigger_frequence', 'trigger_hour', 'trigger_minute', 'last_status')
+# 與 frequency_convert(direction='reverse') 相同的判斷：日欄位與星期欄位是否為 *
+FREQUENCY_PATTERNS = {
+    'daily': r'^\S+\s+\S+\s+\*\s+\S+\s+\*$',
+    'weekly': r'^\S+\s+\S+\s+\*\s+\S+\s+[^*\s]\S*$',
+    'monthly': r'^\S+\s+\S+\s+[^*\s]\S*\s',
+}
+
 @require_http_methods(["GET"])
 def job_scheduler_view(request):
-    """獲取所有排程任務列表"""
+    """排程任務列表頁面；資料由 list_jobs API 分頁載入"""
+    return render(request, 'job_scheduler/job_scheduler.html', {
+        'jobs_api_url': reverse('list_jobs'),
+        'page_size': DEFAULT_PAGE_SIZE,
+    })
+
+
+def _encode_cursor(job):
+    raw = json.dumps([job.created_at.isoformat(), job.job_id])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    created_at, job_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    return datetime.fromisoformat(created_at), int(job_id)
+
+
+def _job_row(job, fields):
+    """依 fields 輸出單一任務的欄位"""
+    row = {}
+    if FREQUENCY_FIELDS.intersection(fields):
+        frequency = frequency_convert({'cron_expression': job.cron_expression}, direction='reverse')
+        row.update({field: frequency.get(field) for field in FREQUENCY_FIELDS.intersection(fields)})
+    if STATUS_FIELDS.intersection(fields):
+        summary = _get_status_summary(job)
+        status_values = {
+            'last_status': summary.last_status,
+            'last_run_time': summary.last_start_time.isoformat() if summary.last_start_time else None,
+            'next_run_time': summary.next_fire_time.isoformat() if summary.next_fire_time else None,
+            'consecutive_failures': summary.consecutive_failures,
+            'events_url': (
+                reverse('execution_events', args=[summary.last_execution_id])
+                if summary.last_status == 'running' and summary.last_execution_id else None
+            ),
+        }
+        row.update({field: status_values[field] for field in STATUS_FIELDS.intersection(fields)})
+    for field in fields:
+        if field == 'program_name':
+            row[field] = job.program.program_name
+        elif field == 'created_at':
+            row[field] = job.created_at.isoformat()
+        elif field in JOB_COLUMNS:
+            row[field] = getattr(job, field)
+    return {field: row[field] for field in fields}
+
+
+@require_http_methods(["GET"])
+def list_jobs(request):
+    """
+    任務列表 API (keyset 分頁)
+    ?limit=<筆數>&cursor=<上一頁的 next_cursor>
+    ?enabled=true|false&program=<program_id>&frequency=Daily|weekly|monthly&q=<任務名稱>
+    ?fields=job_id,job_name,...  只回傳指定欄位
+    """
     try:
-        jobs = JobScheduler.objects.all().order_by('-created_at')
-        job_list = []
-        for job in jobs:
-            job_data = {
-                'job_id': job.job_id,
-                'job_name': job.job_name,
-                'program_id': job.program_id,
-                'cron_expression': job.cron_expression,
-                'enabled': job.enabled,
-            }
-            job_detail = frequency_convert(job_data, direction='reverse')
-            job_list.append(job_detail)
-        return render(request, 'job_scheduler/job_scheduler.html', {'jobs': job_list})
+        limit = min(max(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        fields = [f for f in request.GET.get('fields', '').split(',') if f] or list(DEFAULT_LIST_FIELDS)
+        unknown = [f for f in fields if f not in LIST_FIELDS]
+        if unknown:
+            return JsonResponse({'error': f"不支援的欄位: {', '.join(unknown)}"}, status=400)
+
+        jobs = JobScheduler.objects.order_by('-created_at', '-job_id')
+        if 'enabled' in request.GET:
+            jobs = jobs.filter(enabled=request.GET['enabled'].lower() in ('1', 'true', 'yes'))
+        if request.GET.get('program'):
+            jobs = jobs.filter(program_id=int(request.GET['program']))
+        if request.GET.get('frequency'):
+            pattern = FREQUENCY_PATTERNS.get(request.GET['frequency'].lower())
+            if pattern is None:
+                return JsonResponse({'error': 'frequency 必須是 Daily, weekly 或 monthly'}, status=400)
+            jobs = jobs.filter(cron_expression__regex=pattern)
+        if request.GET.get('q'):
+            jobs = jobs.filter(job_name__icontains=request.GET['q'])
+        if request.GET.get('cursor'):
+            created_at, job_id = _decode_cursor(request.GET['cursor'])
+            jobs = jobs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, job_id__lt=job_id))
+
+        # 只讀取需要的欄位與關聯
+        columns = {'job_id', 'created_at'}
+        columns.update(f for f in fields if f in JOB_COLUMNS)
+        if FREQUENCY_FIELDS.intersection(fields):
+            columns.add('cron_expression')
+        if 'program_name' in fields:
+            jobs = jobs.select_related('program')
+            columns.add('program__program_name')
+        if STATUS_FIELDS.intersection(fields):
+            jobs = jobs.select_related('status_summary')
+            columns.update(f'status_summary__{f}' for f in STATUS_SUMMARY_COLUMNS)
+            columns.update(('enabled', 'next_run_time'))
+
+        page = list(jobs.only(*columns)[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        return JsonResponse({
+            'jobs': [_job_row(job, fields) for job in page],
+            'next_cursor': _encode_cursor(page[-1]) if has_more else None,
+        })
+    except (ValueError, TypeError, binascii.Error):
+        return JsonResponse({'error': 'limit, program 或 cursor 格式錯誤'}, status=400)
     except Exception as e:
-        logger.error(f"Error getting job list: {str(e)}")
+        logger.error(f"Error listing jobs: {str(e)}")
         return JsonResponse({'status': 'error', 'message': str(e)}, status=500)
 
 
-
-@retry_on_db_lock
 @require_http_methods(["GET", "POST"])
 def create_job(request):
     """創建排程任務
@@ -51,14 +165,18 @@ def create_job(request):
             if 'trigger_frequence' in data:
                 data = frequency_convert(data, direction='forward')
 
-            with transaction.atomic():
-                job = JobScheduler.objects.create(
-                    job_name=data['job_name'],
-                    program_id=data['program_id'],
-                    cron_expression=data['cron_expression'],
-                    enabled=data.get('enabled', True),
-                    description=data.get('description', '')
-                )
+            for attempt in contended_atomic():
+                with attempt:
+                    job = JobScheduler.objects.create(
+                        job_name=data['job_name'],
+                        program_id=data['program_id'],
+                        cron_expression=data['cron_expression'],
+                        enabled=data.get('enabled', True),
+                        flex_window=data.get('flex_window', 0),
+                        priority=data.get('priority', 0),
+                        deadline_time=data.get('deadline_time') or None,
+                        description=data.get('description', '')
+                    )
             # 返回成功狀態和重定向URL
             return JsonResponse({
                 'status': 'success', 
@@ -71,7 +189,6 @@ def create_job(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
-@retry_on_db_lock
 @require_http_methods(["GET", "POST"])
 def update_job(request, job_id):
     """更新排程任務
@@ -99,11 +216,13 @@ def update_job(request, job_id):
             if 'trigger_frequence' in data:
                 data = frequency_convert(data, direction='forward')
 
-            with transaction.atomic():
-                for field in ['job_name', 'program_id', 'cron_expression', 'enabled', 'description']:
-                    if field in data:
-                        setattr(job, field, data[field])
-                job.save()
+            for attempt in contended_atomic():
+                with attempt:
+                    for field in ['job_name', 'program_id', 'cron_expression', 'enabled', 'flex_window', 'priority',
+                                  'deadline_time', 'description']:
+                        if field in data:
+                            setattr(job, field, data[field])
+                    job.save()
             return JsonResponse({
                 'status': 'success', 
                 'job_id': job.job_id,
@@ -113,13 +232,13 @@ def update_job(request, job_id):
         logger.error(f"Error updating job: {str(e)}")
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
-@retry_on_db_lock
 def delete_job(request, job_id):
     """刪除排程任務"""
     try:
-        with transaction.atomic():
-            job = JobScheduler.objects.get(job_id=job_id)
-            job.delete()
+        for attempt in contended_atomic():
+            with attempt:
+                job = JobScheduler.objects.get(job_id=job_id)
+                job.delete()
         return JsonResponse({'status': 'success'})
     except Exception as e:
         logger.error(f"Error deleting job: {str(e)}")
@@ -163,44 +282,156 @@ def frequency_convert(data, direction='forward'):
 
 
 
-@require_http_methods(["GET"])
-def get_job_status(request, job_id):
+def _get_status_summary(job):
+    """取得任務的狀態摘要；尚未建立摘要的任務視為從未執行"""
     try:
-        job = JobScheduler.objects.get(job_id=job_id)
-        latest_execution = job.executions.order_by('-start_time').first()
-        
-        if latest_execution:
+        return job.status_summary
+    except JobStatus.DoesNotExist:
+        return JobStatus(job=job, next_fire_time=job.next_run_time if job.enabled else None)
+
+
+def _long_poll_params(request):
+    """?version=<上次回應的 version>&wait=<秒>；沒有 version 時不等待"""
+    if 'version' not in request.GET:
+        return None, 0.0
+    wait = max(0.0, min(MAX_WAIT, float(request.GET.get('wait', MAX_WAIT))))
+    return int(request.GET['version']), wait
+
+
+async def _wait_for_job(job_id, job, version, wait):
+    """
+    目前的版本仍是呼叫端已知的版本時，等待版本改變
+    回傳版本改變後的任務 (由 StatusHub 讀取)；不需等待或逾時時回傳原本的 job
+    """
+    if version is None or not wait or _get_status_summary(job).version != version:
+        return job
+    return await get_status_hub().wait_for_change(job_id, version, wait) or job
+
+
+def _get_job(job_id):
+    return JobScheduler.objects.select_related('status_summary').get(job_id=job_id)
+
+
+def _get_recent_executions(job_id, limit=10):
+    return list(
+        JobExecution.objects.filter(job_id=job_id).select_related('dataset_refresh').order_by('-start_time')[:limit]
+    )
+
+
+async def get_job_status(request, job_id):
+    """
+    任務的最新狀態
+    ?version=<上次回應的 version>&wait=<秒>  長輪詢：版本改變時立即回應，逾時則回應目前的狀態
+    """
+    # require_http_methods 在 Django 5.0 之前不支援 async view
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        version, wait = _long_poll_params(request)
+        job = await _wait_for_job(job_id, await status_hub.read(_get_job, job_id), version, wait)
+        summary = _get_status_summary(job)
+        next_fire_time = summary.next_fire_time.isoformat() if summary.next_fire_time else None
+
+        if summary.last_execution_id:
             response_data = {
                 'job_id': job.job_id,
                 'job_name': job.job_name,
-                'status': latest_execution.status,
-                'execution_id': str(latest_execution.execution_id),
-                'start_time': latest_execution.start_time.isoformat(),
-                'end_time': latest_execution.end_time.isoformat() if latest_execution.end_time else None,
-                'duration': (latest_execution.end_time - latest_execution.start_time).total_seconds() if latest_execution.end_time else None,
-                'output': latest_execution.output,
-                'error': latest_execution.error
+                'status': summary.last_status,
+                'execution_id': str(summary.last_execution_id),
+                'start_time': summary.last_start_time.isoformat(),
+                'end_time': summary.last_end_time.isoformat() if summary.last_end_time else None,
+                'duration': summary.last_duration.total_seconds() if summary.last_duration else None,
+                'error': summary.last_error,
+                'consecutive_failures': summary.consecutive_failures,
+                'queue_wait': summary.last_queue_wait.total_seconds() if summary.last_queue_wait else None,
+                'deadline_misses': summary.deadline_misses,
+                'next_fire_time': next_fire_time,
+                'version': summary.version,
+                'log_url': reverse('get_execution_log', args=[summary.last_execution_id]),
+                'events_url': reverse('execution_events', args=[summary.last_execution_id])
             }
         else:
             response_data = {
                 'job_id': job.job_id,
                 'job_name': job.job_name,
                 'status': 'never_run',
+                'next_fire_time': next_fire_time,
+                'version': summary.version,
                 'message': '任務尚未執行'
             }
             
         return JsonResponse(response_data)
     except JobScheduler.DoesNotExist:
         return JsonResponse({'error': '找不到指定的任務'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'version 必須是整數，wait 必須是數字'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 @require_http_methods(["GET"])
-def get_execution_history(request, job_id):
+def get_schedule_forecast(request):
+    """
+    預測所有啟用任務在接下來 N 小時內每分鐘的執行數
+    ?hours=<小時數>&min_count=<只列出執行數不少於此值的分鐘>
+    用來提前發現集中在同一分鐘 (例如午夜) 的任務
+    """
     try:
-        job = JobScheduler.objects.get(job_id=job_id)
-        executions = job.executions.order_by('-start_time')[:10]  # 只返回最近10次執行
-        
+        hours = min(max(int(request.GET.get('hours', 24)), 1), MAX_FORECAST_HOURS)
+        min_count = max(int(request.GET.get('min_count', 1)), 1)
+        start = timezone.now()
+        end = start + timedelta(hours=hours)
+
+        from .triggers import forecast_fire_times, minute_load
+        jobs = JobScheduler.objects.filter(enabled=True).only(
+            'job_id', 'cron_expression', 'flex_window', 'flex_offset'
+        )
+        load = minute_load(forecast_fire_times(
+            [(job.job_id, job.cron_expression, job.effective_offset) for job in jobs], start, end
+        ))
+        peak = max(load, key=lambda item: item[1], default=None)
+
+        return JsonResponse({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'total_runs': sum(count for _, count, _ in load),
+            'peak': {'minute': peak[0].isoformat(), 'count': peak[1]} if peak else None,
+            'load': [
+                {'minute': minute.isoformat(), 'count': count, 'job_ids': job_ids}
+                for minute, count, job_ids in load if count >= min_count
+            ],
+        })
+    except ValueError:
+        return JsonResponse({'error': 'hours 與 min_count 必須是整數'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+def _refresh_link(execution):
+    """執行所屬的 dataset 重新整理；coalesced 為 True 表示共用了其他執行的重新整理"""
+    refresh = execution.dataset_refresh
+    if refresh is None:
+        return None
+    return {
+        'refresh_id': refresh.pk,
+        'dataset_id': refresh.dataset_id,
+        'status': refresh.status,
+        'coalesced': execution.refresh_coalesced,
+        'leader_execution_id': str(refresh.leader_id) if refresh.leader_id else None,
+    }
+
+async def get_execution_history(request, job_id):
+    """
+    任務最近 10 次的執行記錄
+    ?version=<上次回應的 version>&wait=<秒>  長輪詢，與 get_job_status 相同
+    """
+    # require_http_methods 在 Django 5.0 之前不支援 async view
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    try:
+        version, wait = _long_poll_params(request)
+        job = await _wait_for_job(job_id, await status_hub.read(_get_job, job_id), version, wait)
+        summary = _get_status_summary(job)
+        executions = await status_hub.read(_get_recent_executions, job_id)  # 只返回最近10次執行
+
         history = []
         for execution in executions:
             history.append({
@@ -209,25 +440,168 @@ def get_execution_history(request, job_id):
                 'end_time': execution.end_time.isoformat() if execution.end_time else None,
                 'status': execution.status,
                 'duration': (execution.end_time - execution.start_time).total_seconds() if execution.end_time else None,
+                'queue_wait': execution.queue_wait.total_seconds() if execution.queue_wait else None,
+                'deadline': execution.deadline.isoformat() if execution.deadline else None,
+                'deadline_missed': execution.deadline_missed,
+                'dataset_refresh': _refresh_link(execution),
                 'output': execution.output,
-                'error': execution.error
+                'error': execution.error,
+                'log_size': execution.log_size,
+                'log_url': reverse('get_execution_log', args=[execution.execution_id])
             })
             
-        return JsonResponse({'history': history})
+        return JsonResponse({'history': history, 'version': summary.version})
     except JobScheduler.DoesNotExist:
         return JsonResponse({'error': '找不到指定的任務'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'version 必須是整數，wait 必須是數字'}, status=400)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
     
-@retry_on_db_lock
+@require_http_methods(["GET"])
+def get_execution_log(request, execution_id):
+    """
+    讀取執行記錄檔
+    ?offset=<位移>&limit=<位元組>  區間讀取 (執行中可用 next_offset 持續追蹤)
+    ?tail=<位元組>&lines=<行數>     讀取最後一段
+    """
+    try:
+        execution = JobExecution.objects.only('execution_id', 'log_path', 'output').get(execution_id=execution_id)
+        store = get_log_store()
+
+        if not execution.log_path:
+            # 舊的執行記錄沒有記錄檔，輸出仍存放在 output 欄位
+            content = execution.output or ''
+            return JsonResponse({
+                'execution_id': str(execution_id), 'size': len(content.encode('utf-8')),
+                'offset': 0, 'next_offset': len(content.encode('utf-8')), 'content': content
+            })
+
+        size = store.size(execution.log_path)
+        if 'offset' in request.GET:
+            offset = max(0, int(request.GET['offset']))
+            limit = min(int(request.GET.get('limit', MAX_LOG_READ_BYTES)), MAX_LOG_READ_BYTES)
+            content, next_offset = store.read_range(execution.log_path, offset, offset + limit, whole_lines=True)
+        else:
+            tail_bytes = min(int(request.GET.get('tail', MAX_LOG_READ_BYTES)), MAX_LOG_READ_BYTES)
+            lines = int(request.GET['lines']) if 'lines' in request.GET else None
+            content = store.tail(execution.log_path, max_bytes=tail_bytes, lines=lines)
+            offset, next_offset = max(0, size - len(content.encode('utf-8'))), size
+
+        return JsonResponse({
+            'execution_id': str(execution_id),
+            'size': size,
+            'offset': offset,
+            'next_offset': next_offset,
+            'content': content
+        })
+    except JobExecution.DoesNotExist:
+        return JsonResponse({'error': '找不到指定的執行記錄'}, status=404)
+    except ValueError:
+        return JsonResponse({'error': 'offset, limit, tail 與 lines 必須是整數'}, status=400)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
 def toggle_job(request, job_id):
     """啟用/停用排程任務"""
     try:
-        with transaction.atomic():
-            job = JobScheduler.objects.get(job_id=job_id)
-            job.enabled = not job.enabled
-            job.save()
+        for attempt in contended_atomic():
+            with attempt:
+                job = JobScheduler.objects.get(job_id=job_id)
+                job.enabled = not job.enabled
+                job.save()
         return JsonResponse({'status': 'success', 'enabled': job.enabled})
     except Exception as e:
         logger.error(f"Error toggling job: {str(e)}")
-        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
\ No newline at end of file
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
+@require_http_methods(["POST"])
+def run_job_now(request, job_id):
+    """立即執行任務 (交給排程 daemon 派發)"""
+    from .ipc import SchedulerCommandError, SchedulerUnavailable, send_command
+    if not JobScheduler.objects.filter(job_id=job_id).exists():
+        return JsonResponse({'error': '找不到指定的任務'}, status=404)
+    try:
+        queued = send_command('run_now', job_id=job_id)
+    except SchedulerUnavailable as e:
+        return JsonResponse({'error': str(e)}, status=503)
+    except SchedulerCommandError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    if not queued:
+        return JsonResponse({'status': 'skipped', 'message': '任務仍在等待或執行中'}, status=409)
+    return JsonResponse({'status': 'queued'})
+
+@require_http_methods(["POST"])
+def abort_job_execution(request, execution_id):
+    """中止執行中的任務"""
+    from .ipc import SchedulerCommandError, abort_execution
+    try:
+        execution = JobExecution.objects.get(execution_id=execution_id)
+    except JobExecution.DoesNotExist:
+        return JsonResponse({'error': '找不到指定的執行記錄'}, status=404)
+    try:
+        aborted = abort_execution(execution)
+    except SchedulerCommandError as e:
+        return JsonResponse({'error': str(e)}, status=500)
+    if not aborted:
+        return JsonResponse({'status': 'error', 'message': f'執行狀態為 {execution.status}，無法中止'}, status=409)
+    return JsonResponse({'status': 'aborted', 'discarded_percent': execution.discarded_percent})
+
+
+def _format_sse(event):
+    """將進度事件轉成 SSE 格式；None 代表心跳"""
+    if event is None:
+        return ': keepalive\n\n'
+    return f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+async def _stream_events_async(execution_id, after_seq):
+    """ASGI: 透過 ProgressHub 共用同一個執行的資料庫輪詢"""
+    async for event in get_progress_hub().subscribe(execution_id, after_seq):
+        yield _format_sse(event)
+
+
+def _stream_events_sync(execution_id, after_seq):
+    """WSGI (例如 runserver): 每個連線各自輪詢，僅供開發環境使用"""
+    idle = 0.0
+    while True:
+        rows = list(
+            ExecutionProgress.objects.filter(execution_id=execution_id, seq__gt=after_seq)
+            .order_by('seq').values(*EVENT_FIELDS)
+        )
+        for row in rows:
+            event = serialize_event(row)
+            after_seq = event['seq']
+            yield _format_sse(event)
+            if event['event'] == 'status':
+                return
+        idle = 0.0 if rows else idle + POLL_INTERVAL
+        if idle >= KEEPALIVE_INTERVAL:
+            idle = 0.0
+            yield _format_sse(None)
+        time.sleep(POLL_INTERVAL)
+
+
+async def execution_events(request, execution_id):
+    """以 Server-Sent Events 推送執行進度，收到結束事件後關閉連線"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not await JobExecution.objects.filter(execution_id=execution_id).aexists():
+        return JsonResponse({'error': '找不到指定的執行記錄'}, status=404)
+
+    # 瀏覽器重新連線時會帶上最後收到的事件編號
+    try:
+        after_seq = int(request.headers.get('Last-Event-ID') or request.GET.get('after', 0))
+    except ValueError:
+        after_seq = 0
+
+    if isinstance(request, ASGIRequest):
+        stream = _stream_events_async(execution_id, after_seq)
+    else:
+        stream = _stream_events_sync(execution_id, after_seq)
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
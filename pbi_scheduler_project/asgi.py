@@ -5,12 +5,23 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+Serve the app with an ASGI server (e.g. ``uvicorn pbi_scheduler_project.asgi:application``)
+so that the execution progress stream (job_scheduler.views.execution_events) shares one
+database poller per execution across all connected browsers, and the long-poll mode of the
+job status and history APIs (``?version=<n>&wait=<seconds>``) waits on one shared
+JobStatus.version poller instead of holding a worker thread per browser tab.
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
+from static.utils.sqlite_profile import apply_journal_mode
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pbi_scheduler_project.settings")
 
 application = get_asgi_application()
+
+# 切換 journal_mode (寫入資料庫檔)
+apply_journal_mode(close=True)
@@ -47,6 +47,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # 每個請求等待資料庫鎖的總時間上限 (DB_CONTENTION)
+    "static.utils.db_utils.ContentionBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -90,6 +92,26 @@ DATABASES = {
     }
 }
 
+# 每個 SQLite 連線套用的 PRAGMA (static/utils/sqlite_profile.py)；None 表示維持 SQLite 預設值
+# journal_mode 存在資料庫檔中，只在 daemon / web 啟動與 sqlite_maintenance 時切換
+SQLITE_PROFILE = {
+    "journal_mode": "wal",  # 寫入不阻擋讀取
+    "synchronous": "normal",  # WAL 下只在 checkpoint 時 fsync
+    "busy_timeout": 30000,  # 毫秒；與 OPTIONS.timeout 相同
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,  # 約 64MB
+    "temp_store": "memory",
+    "wal_autocheckpoint": 1000,
+    "journal_size_limit": 64 * 1024 * 1024,
+}
+
+# 排程 daemon 每小時執行的 SQLite 維護 (ANALYZE、incremental vacuum、WAL checkpoint)
+SQLITE_MAINTENANCE = {
+    "checkpoint_mode": "truncate",
+    "vacuum_min_free_pages": 1000,
+    "vacuum_max_pages": 5000,
+}
+
 # 快取設定
 CACHES = {
     "default": {
@@ -99,6 +121,15 @@ CACHES = {
     }
 }
 
+# 資料庫鎖定的重試 (static/utils/db_utils.py 的 contended_atomic)；各呼叫位置的統計見 /api/db-contention/
+DB_CONTENTION = {
+    "request_budget": 5.0,  # 秒；同一個請求等待資料庫鎖的總時間上限
+    "call_budget": 30.0,  # 秒；請求之外 (排程 daemon、管理指令) 每個交易區塊的上限
+    "busy_timeout": 0.2,  # 秒；交易區塊中 SQLite 自行等待鎖的時間，之後由 contended_atomic 退避重試
+    "base_delay": 0.02,
+    "max_delay": 1.0,
+}
+
 # 會話設定
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
 SESSION_CACHE_ALIAS = "default"
@@ -150,12 +181,73 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "accounts.User"
 
 # APScheduler 配置
+# apscheduler.* 交給 BackgroundScheduler；engine.* 為引擎執行槽設定 (job_scheduler/executor.py)
+# reconcile.* 為排程同步器設定 (job_scheduler/reconciler.py)；writer.* 為寫入執行緒設定 (job_scheduler/db_writer.py)
+# lease.* 為排程器 leader 租約設定 (job_scheduler/leader.py)；ipc.* 為 web 與排程 daemon 之間的 IPC 設定 (job_scheduler/ipc.py)
 SCHEDULER_CONFIG = {
+    # 與 DjangoJobStore 相同的資料表，寫入交給寫入執行緒
     "apscheduler.jobstores.default": {
-        "class": "django_apscheduler.jobstores:DjangoJobStore"
+        "class": "job_scheduler.jobstores:WriteBehindJobStore"
     },
-    'apscheduler.executors.processpool': {
-        "type": "threadpool"
+    # 排程執行緒只負責派發，不會等待引擎結束，因此少量執行緒即可
+    "apscheduler.executors.default": {
+        "class": "apscheduler.executors.pool:ThreadPoolExecutor",
+        "max_workers": 4,
     },
+    "apscheduler.job_defaults.coalesce": True,
+    "apscheduler.job_defaults.max_instances": 1,
+    "apscheduler.job_defaults.misfire_grace_time": 300,
+    "apscheduler.timezone": TIME_ZONE,
+    "engine.max_slots": None,  # None: CPU 核心數 x engine.slots_per_cpu
+    "engine.slots_per_cpu": 2,
+    "engine.max_per_workspace": 4,
+    "engine.max_per_dataset": 2,
+    "engine.timeout": 3600,
+    "engine.python": None,  # None: 使用目前的 Python 直譯器
+    "engine.warm_workers": True,  # 常駐工作行程，執行 worker_max_runs 次或超過記憶體門檻後回收
+    "engine.prefork": 2,
+    "engine.worker_max_runs": 50,
+    "engine.worker_max_rss_mb": 512,
+    "engine.tenant_id": "default",
+    "engine.rate_limit_db": None,  # None: logs/rate_limits.sqlite3
+    "engine.rate_limits": {
+        # 每秒補充的權杖數 (rate)、桶大小 (burst)、分桶範圍 (scope)
+        "powerbi.api": {"rate": 2.0, "burst": 10, "scope": "tenant"},
+        "powerbi.export": {"rate": 0.5, "burst": 5, "scope": "workspace"},
+        "sharepoint.upload": {"rate": 5.0, "burst": 10, "scope": "site"},
+    },
+    "engine.refresh_window": 600,  # 秒；共用 dataset 的執行在此期間內不重複重新整理，0 表示停用
+    "engine.refresh_wait_timeout": 1800,
+    "engine.artifact_cache": True,  # dataset 未重新整理時重用上次的匯出檔
+    "engine.artifact_cache_max_mb": 2048,  # 每個 filelocation 的快取上限，超過時刪除最久未使用的檔案
+    "engine.artifact_cache_max_entries": 500,
+    # 以下三個 URL 可指向 scripts/simulator.py 啟動時列出的本機位址
+    "engine.powerbi_api_url": None,  # None: 模擬 Power BI 步驟；例如 https://api.powerbi.com/v1.0/myorg
+    "engine.token_url": None,  # 例如 https://login.microsoftonline.com/<tenant>/oauth2/v2.0/token
+    "engine.poll_interval": 5,
+    "engine.refresh_timeout": 3600,
+    "engine.sharepoint_api_url": None,  # None: 不上傳；例如 https://graph.microsoft.com/v1.0
+    "engine.upload_chunk_mb": 10,
+    "engine.upload_parallel": 4,
+    "reconcile.interval": 5,  # 秒；其他行程的任務變更最多延遲這麼久套用
+    "writer.enabled": True,  # 排程行程的寫入由單一執行緒批次提交，False 時各執行緒直接寫入
+    "writer.max_batch": 200,
+    "writer.retry_timeout": 60,  # 秒；其他行程持有寫入鎖時的重試上限
+    # 多個行程中只有持有租約的行程派發任務；leader 結束後最遲約 ttl + renew_interval 秒由其他行程接手
+    "lease.ttl": 30,
+    "lease.renew_interval": 10,
+    "ipc.address": None,  # None: logs/scheduler.sock (Windows 為 127.0.0.1:47391)
+    "ipc.timeout": 5,
+}
+# 排程器由 python manage.py run_scheduler 獨立執行；True 時改由 web 行程在 migrate 後啟動 (舊的行為)
+SCHEDULER_AUTOSTART = False
+
+# 執行記錄檔 (job_scheduler/log_store.py)
+EXECUTION_LOG_STORE = {
+    "root": BASE_DIR / "logs" / "executions",
+    "segment_bytes": 1024 * 1024,  # 每個分段 1MB，寫滿後壓縮封存
+    "retention_days": 30,
+    "max_total_mb": 1024,
+    "summary_lines": 20,  # JobExecution.output 只保留最後幾行
+    "sealed_cache_segments": 8,  # 讀取時快取解壓縮後的封存分段數
 }
-SCHEDULER_AUTOSTART = True
@@ -10,7 +10,16 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+
+from static.utils.sqlite_profile import apply_journal_mode
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pbi_scheduler_project.settings")
 
 application = get_wsgi_application()
+
+# 先載入 URLconf 與各 app 的 views：gunicorn --preload 時在 fork 前載入一次，worker 不必在第一個請求時各自匯入
+get_resolver().url_patterns
+
+# 切換 journal_mode (寫入資料庫檔)；關閉連線，不讓 fork 出的 worker 共用
+apply_journal_mode(close=True)
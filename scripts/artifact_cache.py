@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of exported report files.
+
+An export only changes when the dataset behind it is refreshed, so the output
+of a successful export is stored under the program's filelocation and reused
+by later runs of the same report/method/output_type as long as the dataset
+has not been refreshed since:
+
+    <filelocation>/.pbi_cache/index.sqlite3        key -> sha256, size, last_used
+    <filelocation>/.pbi_cache/objects/ab/ab12...   file contents, named by sha256
+
+The key is a hash of (workspace_id, report_name, dataset_id, method,
+output_type, refresh marker). Identical exports share one object. Entries are
+evicted least-recently-used first once the cache exceeds its size or entry
+limit; objects no longer referenced by any entry are deleted.
+
+Every engine process writing to the same filelocation shares the index
+(SQLite WAL, BEGIN IMMEDIATE for read-modify-write, as in rate_limiter.py).
+Objects are written to a temporary file and renamed into place, and their
+hash is verified on every hit, so a partially written or evicted object is
+treated as a miss rather than delivered.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import uuid
+
+CACHE_DIRNAME = '.pbi_cache'
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    key TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    output_name TEXT,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+INDEX = 'CREATE INDEX IF NOT EXISTS artifacts_last_used ON artifacts (last_used)'
+
+
+def artifact_key(program_params, refresh_marker):
+    """Cache key of an export; None when the dataset's refresh state is unknown"""
+    if not refresh_marker:
+        return None
+    parts = [program_params.get(name) or '' for name in
+             ('workspace_id', 'report_name', 'dataset_id', 'method', 'output_type')]
+    parts.append(str(refresh_marker))
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def _temp_path(directory):
+    """Hidden temporary file next to the target so os.replace stays on one filesystem"""
+    return os.path.join(directory, f".pbi-{os.getpid()}-{uuid.uuid4().hex}.tmp")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtifactCache:
+    """Export cache shared by every process that opens the same directory"""
+
+    def __init__(self, root, max_bytes=None, max_entries=None, clock=time.time):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.clock = clock
+        self.objects_dir = os.path.join(self.root, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.root, 'index.sqlite3'), timeout=30, isolation_level=None,
+            check_same_thread=False
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(SCHEMA)
+        self._conn.execute(INDEX)
+
+    def close(self):
+        self._conn.close()
+
+    def _object_path(self, sha256):
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    def get(self, key, destination):
+        """
+        Copy the cached file for key to destination.
+        Returns the entry ({'sha256', 'size'}) or None on a miss.
+        """
+        row = self._conn.execute('SELECT sha256, size FROM artifacts WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        sha256, size = row
+        if not self._copy_verified(self._object_path(sha256), destination, sha256):
+            # Evicted by another process or corrupted: forget it and export again
+            self._conn.execute('DELETE FROM artifacts WHERE key = ? AND sha256 = ?', (key, sha256))
+            return None
+        self._conn.execute('UPDATE artifacts SET last_used = ? WHERE key = ?', (self.clock(), key))
+        return {'sha256': sha256, 'size': size}
+
+    def _copy_verified(self, source, destination, sha256):
+        """Copy source to destination, hashing on the way; the destination is only replaced on a match"""
+        directory = os.path.dirname(os.path.abspath(destination))
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        temp_path = _temp_path(directory)
+        try:
+            with open(source, 'rb') as src, open(temp_path, 'wb') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            if digest.hexdigest() != sha256:
+                return False
+            os.replace(temp_path, destination)
+            return True
+        except FileNotFoundError:
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def put(self, key, path, output_name=None):
+        """Store the file at path under key and apply the eviction limits; returns the entry"""
+        sha256 = file_sha256(path)
+        size = os.path.getsize(path)
+        object_path = self._object_path(sha256)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_path = _temp_path(os.path.dirname(object_path))
+            try:
+                shutil.copyfile(path, temp_path)
+                os.replace(temp_path, object_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+        now = self.clock()
+        self._conn.execute(
+            'INSERT INTO artifacts (key, sha256, size, output_name, created, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET sha256 = excluded.sha256, '
+            'size = excluded.size, output_name = excluded.output_name, last_used = excluded.last_used',
+            (key, sha256, size, output_name, now, now)
+        )
+        self.evict()
+        return {'sha256': sha256, 'size': size}
+
+    def evict(self):
+        """Drop least-recently-used entries until within limits; returns the number of entries removed"""
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = 0
+            count, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts').fetchone()
+            rows = conn.execute('SELECT key, size FROM artifacts ORDER BY last_used').fetchall()
+            for key, size in rows:
+                over_bytes = self.max_bytes is not None and total > self.max_bytes
+                over_entries = self.max_entries is not None and count > self.max_entries
+                if not (over_bytes or over_entries):
+                    break
+                conn.execute('DELETE FROM artifacts WHERE key = ?', (key,))
+                count -= 1
+                total -= size
+                removed += 1
+            referenced = {row[0] for row in conn.execute('SELECT DISTINCT sha256 FROM artifacts')}
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        if removed:
+            for name in os.listdir(self.objects_dir):
+                shard = os.path.join(self.objects_dir, name)
+                for sha256 in os.listdir(shard):
+                    if not sha256.startswith('.') and sha256 not in referenced:
+                        try:
+                            os.remove(os.path.join(shard, sha256))
+                        except FileNotFoundError:
+                            pass
+        return removed
+
+    def stats(self):
+        count, total = self._conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts'
+        ).fetchone()
+        return {'entries': count, 'bytes': total}
+
+
+def create_artifact_cache(program_params):
+    """Build the cache for the program's filelocation, or None if caching is off or there is no location"""
+    location = program_params.get('filelocation')
+    if not location or not program_params.get('artifact_cache', True):
+        return None
+    max_mb = program_params.get('artifact_cache_max_mb')
+    return ArtifactCache(
+        os.path.join(location, CACHE_DIRNAME),
+        max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+        max_entries=program_params.get('artifact_cache_max_entries') or None,
+    )
@@ -4,69 +4,488 @@
 import argparse
 import json
 import logging
+import signal
 import sys
 import os
+import tempfile
 from datetime import datetime
 import time
 
+from artifact_cache import artifact_key, create_artifact_cache
+from powerbi_client import GRAPH_SCOPE, POWERBI_SCOPE, ApiClient, PowerBIService, create_token_provider
+from rate_limiter import create_rate_limiter
+from sharepoint_upload import SharePointUploader, remote_path_for
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Machine-readable events written to stdout in --program mode.
+# Must match EVENT_PREFIX in job_scheduler/engine_pool.py.
+EVENT_PREFIX = '@@pbi-event '
+
+
+def _print_event(event):
+    sys.stdout.write(EVENT_PREFIX + json.dumps(event, ensure_ascii=False) + '\n')
+    sys.stdout.flush()
+
+
+# Replaced by the worker loop so events travel over the worker protocol
+emit_event = _print_event
+
+
+def report_progress(step, total, message):
+    """Report structured progress to the scheduler"""
+    global _last_progress
+    _last_progress = round(step / total * 100, 1) if total else 100.0
+    emit_event({
+        'type': 'progress',
+        'step': step,
+        'total': total,
+        'percent': _last_progress,
+        'message': message,
+    })
+
+
+class EngineCancelled(Exception):
+    """Raised at a cancel checkpoint after the scheduler asked us to stop"""
+
+
+_cancel_requested = False
+_last_progress = 0.0
+# The execution being run and where the scheduler records cancel requests
+# (job_scheduler/process_registry.py writes <cancel_dir>/<pid> = execution_id before SIGTERM)
+_current_execution_id = None
+_cancel_dir = None
+
+
+def _request_cancel(signum, frame):
+    global _cancel_requested
+    _cancel_requested = True
+
+
+def install_cancel_handler():
+    """SIGTERM only sets a flag; the engine stops at the next checkpoint"""
+    signal.signal(signal.SIGTERM, _request_cancel)
+
+
+def _cancel_request_path():
+    return os.path.join(_cancel_dir, str(os.getpid())) if _cancel_dir else None
+
+
+def reset_cancel_state(execution_id=None, cancel_dir=None):
+    """Start a new program; a cancel recorded for it before it started is kept"""
+    global _cancel_requested, _last_progress, _current_execution_id, _cancel_dir
+    _current_execution_id = execution_id
+    _cancel_dir = cancel_dir
+    _last_progress = 0.0
+    path = _cancel_request_path()
+    _cancel_requested = bool(path and os.path.exists(path))
+
+
+def _cancel_targets_current_execution():
+    """
+    A warm worker may already be running another execution when a SIGTERM
+    meant for its previous one arrives (the scheduler clears the recorded pid
+    asynchronously). Only honour the cancel if the recorded request names the
+    current execution; a SIGTERM without a request (e.g. sent by hand) is honoured.
+    A request for the current execution is left in place: the scheduler removes it
+    when the execution ends and checks it before escalating to SIGKILL.
+    """
+    path = _cancel_request_path()
+    if path is None:
+        return True
+    try:
+        with open(path, encoding='utf-8') as f:
+            target = f.read().strip()
+    except OSError:
+        return True
+    if target != str(_current_execution_id):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        sys.stderr.write(f"Ignoring cancel request for execution {target} "
+                         f"(running {_current_execution_id})\n")
+        return False
+    return True
+
+
+def check_cancelled():
+    """Cancel checkpoint: call between units of work"""
+    global _cancel_requested
+    if _cancel_requested:
+        if not _cancel_targets_current_execution():
+            _cancel_requested = False
+            return
+        raise EngineCancelled(f"Execution aborted at {_last_progress:.1f}%")
+
+
+def cancellable_sleep(seconds, interval=0.2):
+    """Sleep in short slices so a cancel request is honoured quickly"""
+    deadline = time.monotonic() + seconds
+    while True:
+        check_cancelled()
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(interval, remaining))
+
 # Set up logging
-def setup_logging(execution_id):
-    log_dir = 'logs'
-    os.makedirs(log_dir, exist_ok=True)
-    
-    log_file = os.path.join(log_dir, f'power_bi_engine_{execution_id}.log')
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.FileHandler(log_file, encoding='utf-8')
-        ]
-    )
-    return logging.getLogger(__name__)
+def setup_logging(execution_id, stream=None, log_file=True):
+    """
+    When run by the scheduler the parent captures our output into its
+    execution log store, so the local log file is only written for manual runs.
+    """
+    # Worker processes run many programs, so handlers are replaced on every run
+    # instead of relying on logging.basicConfig (which only works once).
+    logger = logging.getLogger('power_bi_engine')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+    handlers = [stream or logging.StreamHandler(sys.stdout)]
+    if log_file:
+        log_dir = 'logs'
+        os.makedirs(log_dir, exist_ok=True)
+        handlers.append(logging.FileHandler(
+            os.path.join(log_dir, f'power_bi_engine_{execution_id}.log'), encoding='utf-8'
+        ))
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    return logger
 
 def parse_args():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(description='Power BI Engine')
-    parser.add_argument('--program', type=str, required=True, help='Program parameters in JSON format')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--program', type=str, help='Program parameters in JSON format')
+    mode.add_argument('--worker', action='store_true',
+                      help='Run as a long-lived worker reading programs from stdin')
+    parser.add_argument('--no-log-file', action='store_true',
+                        help='Do not write logs/power_bi_engine_<execution_id>.log')
     return parser.parse_args()
 
+def create_powerbi_service(program_params, limiter, tokens, logger):
+    """
+    Client for the Power BI REST API when powerbi_api_url is configured;
+    None means the engine simulates the Power BI steps.
+    """
+    api_url = program_params.get('powerbi_api_url')
+    if not api_url:
+        return None
+    token = tokens.for_scope(POWERBI_SCOPE) if tokens else os.environ.get('POWERBI_TOKEN')
+    client = ApiClient(api_url, token=token, limiter=limiter, sleep=cancellable_sleep, logger=logger)
+    return PowerBIService(client, sleep=cancellable_sleep,
+                          poll_interval=float(program_params.get('poll_interval') or 5))
+
+
+def refresh_dataset(program_params, limiter, logger, service=None):
+    """
+    Refresh the program's dataset, unless the scheduler coalesced this run
+    with a refresh another execution already performed.
+    """
+    dataset_id = program_params.get('dataset_id')
+    if not program_params.get('refresh_dataset', True):
+        logger.info(f"Dataset {dataset_id} was refreshed by execution "
+                    f"{program_params.get('coalesced_with') or 'unknown'}; skipping refresh")
+        return
+
+    logger.info(f"Refreshing dataset {dataset_id}")
+    try:
+        if service is not None:
+            refresh = service.refresh_dataset(program_params.get('workspace_id'), dataset_id,
+                                              timeout=program_params.get('refresh_timeout'))
+            logger.info(f"Refresh {refresh.get('requestId')} finished at {refresh.get('endTime')}")
+        else:
+            if limiter is not None:
+                limiter.acquire('powerbi.refresh', dataset_id)
+            # Simulated refresh
+            cancellable_sleep(float(program_params.get('refresh_seconds', 5)))
+    except Exception:
+        emit_event({'type': 'refresh', 'status': 'failed', 'dataset_id': dataset_id})
+        raise
+    emit_event({'type': 'refresh', 'status': 'completed', 'dataset_id': dataset_id})
+    logger.info(f"Dataset {dataset_id} refreshed")
+
+
+def refresh_marker(program_params, service=None):
+    """
+    Identifies the dataset refresh this run exports from; exports with the same
+    marker see the same data. None when unknown (the export is not cached).
+    With the REST API the dataset's last completed refresh is authoritative.
+    """
+    if service is not None:
+        refresh = service.last_completed_refresh(program_params.get('workspace_id'), program_params.get('dataset_id'))
+        if refresh is None:
+            return None
+        return f"{refresh.get('requestId')}:{refresh.get('endTime')}"
+    return program_params.get('refresh_marker') or None
+
+
+def output_path(program_params, work_dir):
+    """Where the export is written: the program's filelocation, or the run's work directory"""
+    location = program_params.get('filelocation') or work_dir
+    name = program_params.get('output_name') or program_params.get('report_name') or 'output'
+    extension = (program_params.get('output_type') or 'bin').lower().lstrip('.')
+    return os.path.join(location, f"{name}.{extension}")
+
+
+def export_report(program_params, limiter, logger, destination, service=None):
+    """Export the report to destination"""
+    if service is not None:
+        workspace_id = program_params.get('workspace_id')
+        report_id = service.find_report(workspace_id, program_params.get('report_name'))
+        last_percent = [None]
+
+        def on_progress(percent):
+            check_cancelled()
+            if percent != last_percent[0]:
+                last_percent[0] = percent
+                message = f"Exporting... {percent:.1f}% complete"
+                logger.info(message)
+                report_progress(percent, 100, message)
+
+        size = service.export_report(workspace_id, report_id, program_params.get('output_type'),
+                                     destination, on_progress=on_progress)
+        logger.info(f"Exported {program_params.get('report_name')} to {destination} ({size} bytes)")
+        return
+
+    # Simulated export
+    total_steps = int(program_params.get('steps', 12))  # 1 minute total with 5-second intervals
+    step_interval = float(program_params.get('step_interval', 5))
+    for step in range(total_steps):
+        check_cancelled()
+        if limiter is not None:
+            # Each simulated step stands in for one Power BI API call
+            limiter.acquire('powerbi.api')
+        progress = (step + 1) / total_steps * 100
+        status_message = f"Processing... {progress:.1f}% complete"
+        logger.info(status_message)
+        report_progress(step + 1, total_steps, status_message)
+        cancellable_sleep(step_interval)
+
+    os.makedirs(os.path.dirname(os.path.abspath(destination)), exist_ok=True)
+    with open(destination, 'w', encoding='utf-8') as f:
+        json.dump({
+            'report_name': program_params.get('report_name'),
+            'dataset_id': program_params.get('dataset_id'),
+            'method': program_params.get('method'),
+            'output_type': program_params.get('output_type'),
+            'exported_at': datetime.now().isoformat(),
+        }, f, ensure_ascii=False)
+
+
+def export_with_cache(program_params, limiter, logger, work_dir, service=None):
+    """
+    Export the report, or re-deliver the stored file when the same export was
+    already produced from the current dataset refresh. Returns the file's path.
+    """
+    destination = output_path(program_params, work_dir)
+    cache = create_artifact_cache(program_params)
+    key = artifact_key(program_params, refresh_marker(program_params, service)) if cache else None
+    try:
+        if key:
+            entry = cache.get(key, destination)
+            if entry is not None:
+                message = f"Dataset unchanged since last export; delivered cached {destination}"
+                logger.info(f"{message} (sha256 {entry['sha256'][:12]}, {entry['size']} bytes)")
+                report_progress(1, 1, message)
+                return destination
+
+        export_report(program_params, limiter, logger, destination, service)
+
+        if key:
+            entry = cache.put(key, destination, output_name=os.path.basename(destination))
+            logger.info(f"Stored export in cache (sha256 {entry['sha256'][:12]}, {entry['size']} bytes)")
+        return destination
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+def upload_to_sharepoint(program_params, limiter, logger, local_path, tokens=None):
+    """
+    Upload the export to the program's SharePoint folder. Skipped when no
+    SharePoint API is configured or the destination already has the same content.
+    """
+    api_url = program_params.get('sharepoint_api_url')
+    site = program_params.get('sharepoint_site')
+    if not (api_url and site and local_path):
+        logger.info("SharePoint upload not configured; skipping upload")
+        return None
+
+    token = os.environ.get('SHAREPOINT_TOKEN') or (tokens.for_scope(GRAPH_SCOPE) if tokens else None)
+    client = ApiClient(api_url, token=token, limiter=limiter, sleep=cancellable_sleep, logger=logger)
+    uploader = SharePointUploader(
+        client, site,
+        chunk_size=int(float(program_params.get('upload_chunk_mb') or 10) * 1024 * 1024),
+        parallel=program_params.get('upload_parallel') or 4,
+        check_cancelled=check_cancelled,
+        logger=logger,
+    )
+    remote_path = remote_path_for(program_params, local_path)
+    result = uploader.upload(local_path, remote_path)
+    emit_event({'type': 'upload', 'path': remote_path, **result})
+    return result
+
+
+def run_program(program_params, logger):
+    """Run one program. Raises on failure."""
+    execution_id = program_params.get('execution_id', 'unknown')
+
+    logger.info(f"Start Power BI Engine, execution ID: {execution_id}")
+    logger.info(f"Job parameters: {json.dumps(program_params, ensure_ascii=False)}")
+
+    # 1. Refresh the dataset (unless coalesced with another execution)
+    # 2. Export the report, or reuse the cached export if the dataset is unchanged
+    # 3. Upload the file to SharePoint
+    # The Power BI steps are simulated unless powerbi_api_url is configured.
+
+    # Shared with every other engine process on this host
+    limiter = create_rate_limiter(program_params, sleep=cancellable_sleep)
+
+    tokens = create_token_provider(program_params, limiter=limiter, sleep=cancellable_sleep, logger=logger)
+    service = create_powerbi_service(program_params, limiter, tokens, logger)
+    try:
+        with tempfile.TemporaryDirectory(prefix='pbi-engine-') as work_dir:
+            refresh_dataset(program_params, limiter, logger, service)
+            local_path = export_with_cache(program_params, limiter, logger, work_dir, service)
+            upload_to_sharepoint(program_params, limiter, logger, local_path, tokens)
+    finally:
+        if limiter is not None:
+            limiter.close()
+
+    # Log completion
+    success_message = f"Power BI Engine completed successfully, ID: {execution_id}"
+    logger.info(success_message)
+
 def main():
+    logger = logging.getLogger('power_bi_engine')
     try:
         # Parse arguments
         args = parse_args()
+        if args.worker:
+            worker_main()
+            return
+
         program_params = json.loads(args.program)
-        
+
         # Set up logging
         execution_id = program_params.get('execution_id', 'unknown')
-        logger = setup_logging(execution_id)
-        
-        logger.info(f"Start Power BI Engine, execution ID: {execution_id}")
-        logger.info(f"Job parameters: {json.dumps(program_params, ensure_ascii=False)}")
-        
-        # TODO: Implement Power BI Engine logic here
-        # For example:
-        # 1. Connect to Power BI service
-        # 2. Execute data refresh
-        # 3. Process output files
-
-        # Simulate work with status updates every 5 seconds
-        total_steps = 12  # 1 minute total with 5-second intervals
-        for step in range(total_steps):
-            progress = (step + 1) / total_steps * 100
-            status_message = f"Processing... {progress:.1f}% complete"
-            logger.info(status_message)
-            time.sleep(5)  # 5 seconds interval
-        
-        # Log completion
-        success_message = f"Power BI Engine completed successfully, ID: {execution_id}"
-        logger.info(success_message)
-        
+        logger = setup_logging(execution_id, log_file=not args.no_log_file)
+        install_cancel_handler()
+        reset_cancel_state(execution_id, program_params.get('cancel_dir'))
+        run_program(program_params, logger)
+
+    except EngineCancelled as e:
+        logger.warning(str(e))
+        sys.exit(2)
     except Exception as e:
         error_message = f"Error occurred during execution: {str(e)}"
         logger.error(error_message)
         sys.exit(1)
 
+
+# ---------------------------------------------------------------------------
+# Worker mode
+#
+# The parent (job_scheduler/engine_pool.py) keeps a few of these processes
+# warm. Messages are JSON objects, one per line:
+#   parent -> worker (stdin):  {"type": "run", "program": {...}} | {"type": "shutdown"}
+#   worker -> parent (stdout): {"type": "ready", "pid": ...}
+#                              {"type": "log", "message": "..."}
+#                              {"type": "progress", "step": ..., "total": ..., "percent": ..., "message": "..."}
+#                              {"type": "result", "returncode": 0|1|2, "error": ..., "rss_kb": ...}
+#
+# SIGTERM cancels the current program at its next checkpoint (returncode 2);
+# the worker then waits for the next program.
+# ---------------------------------------------------------------------------
+
+class PipeHandler(logging.Handler):
+    """Send formatted log records to the parent as protocol messages"""
+
+    def __init__(self, channel):
+        super().__init__()
+        self.channel = channel
+
+    def emit(self, record):
+        try:
+            self.channel.send({'type': 'log', 'message': self.format(record)})
+        except Exception:
+            self.handleError(record)
+
+
+class Channel:
+    """Line-delimited JSON messages over the worker's original stdout"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def send(self, message):
+        self.stream.write(json.dumps(message, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+
+def current_rss_kb():
+    """Resident memory of this process in KB, or None if unknown"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        return None
+
+
+def worker_main():
+    global emit_event
+
+    # Keep the real stdout for the protocol; stray prints go to stderr.
+    channel = Channel(os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8'))
+    sys.stdout = sys.stderr
+    emit_event = channel.send
+
+    install_cancel_handler()
+    channel.send({'type': 'ready', 'pid': os.getpid()})
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        message = json.loads(line)
+        if message.get('type') == 'shutdown':
+            break
+        if message.get('type') != 'run':
+            continue
+
+        program_params = message.get('program', {})
+        execution_id = program_params.get('execution_id', 'unknown')
+        logger = setup_logging(execution_id, stream=PipeHandler(channel), log_file=False)
+        returncode, error = 0, None
+        reset_cancel_state(execution_id, program_params.get('cancel_dir'))
+        try:
+            run_program(program_params, logger)
+        except EngineCancelled as e:
+            error = str(e)
+            logger.warning(error)
+            returncode = 2
+        except Exception as e:
+            error = f"Error occurred during execution: {str(e)}"
+            logger.error(error)
+            returncode = 1
+        finally:
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+        channel.send({'type': 'result', 'returncode': returncode, 'error': error,
+                      'rss_kb': current_rss_kb()})
+
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Minimal HTTP client for the Power BI REST API and SharePoint.
+
+Every request goes through _api_call, which takes a token from the shared
+rate limiter before the request and, on 429/503, blocks the bucket for the
+server's Retry-After before trying again. 500/502/504 are retried with
+exponential backoff.
+
+PowerBIService wraps the calls the engine makes: resolving a report by name,
+refreshing a dataset and exporting a report to a file (start, poll, download).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from rate_limiter import parse_retry_after
+
+THROTTLE_STATUSES = (429, 503)
+# Transient server errors, retried with backoff without blocking the bucket
+RETRY_STATUSES = (500, 502, 504)
+
+POWERBI_SCOPE = 'https://analysis.windows.net/powerbi/api/.default'
+GRAPH_SCOPE = 'https://graph.microsoft.com/.default'
+# Renew tokens this long before they expire
+TOKEN_EXPIRY_MARGIN = 300
+DEFAULT_POLL_INTERVAL = 5
+# How many recent refreshes to look through when following one refresh
+REFRESH_HISTORY = 10
+# Export files are written to disk in pieces of this size instead of being read into memory
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+EXPORT_FORMATS = {
+    'pdf': 'PDF', 'pptx': 'PPTX', 'png': 'PNG', 'xlsx': 'XLSX', 'csv': 'CSV',
+    'docx': 'DOCX', 'xml': 'XML', 'mhtml': 'MHTML', 'accessiblepdf': 'ACCESSIBLEPDF',
+}
+
+
+class ApiError(Exception):
+    """A request failed with a non-retryable status or ran out of retries"""
+
+    def __init__(self, message, status=None, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+
+def _copy_response(response, path):
+    """Write the response body to path without holding it in memory; returns the number of bytes"""
+    written = 0
+    with open(path, 'wb') as f:
+        for chunk in iter(lambda: response.read(DOWNLOAD_CHUNK_SIZE), b''):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+class ApiClient:
+    """Rate-limited JSON/bytes HTTP client"""
+
+    def __init__(self, base_url, token=None, limiter=None, max_retries=5, timeout=60,
+                 sleep=time.sleep, logger=None):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.sleep = sleep
+        self.logger = logger or logging.getLogger('power_bi_engine')
+        self.throttled = 0
+
+    def _url(self, path, params=None):
+        url = path if path.startswith('http') else f"{self.base_url}/{path.lstrip('/')}"
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        return url
+
+    def _api_call(self, endpoint, method, path, scope_id=None, params=None, body=None,
+                  headers=None, raw=False, auth=True, form=None, stream_to=None):
+        """
+        Perform one API call under the rate limit of `endpoint` (e.g. 'powerbi.export').
+        Returns parsed JSON (or bytes when raw=True) and the response headers.
+        stream_to writes the response body to that path in chunks and returns the byte count instead.
+        auth=False leaves out the bearer token (pre-authenticated URLs such as upload sessions).
+        token may be a string or a callable returning the current token.
+        """
+        data = None
+        request_headers = {'Accept': 'application/json'}
+        token = self.token() if callable(self.token) else self.token
+        if token and auth:
+            request_headers['Authorization'] = f"Bearer {token}"
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode('ascii')
+            request_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif isinstance(body, (bytes, bytearray)):
+            data = bytes(body)
+            request_headers['Content-Type'] = 'application/octet-stream'
+        elif body is not None:
+            data = json.dumps(body).encode('utf-8')
+            request_headers['Content-Type'] = 'application/json'
+        request_headers.update(headers or {})
+
+        for attempt in range(self.max_retries + 1):
+            if self.limiter is not None:
+                waited = self.limiter.acquire(endpoint, scope_id)
+                if waited >= 1:
+                    self.logger.info(f"Rate limit {endpoint}: waited {waited:.1f}s")
+
+            request = urllib.request.Request(
+                self._url(path, params), data=data, headers=request_headers, method=method
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    response_headers = dict(response.headers)
+                    if stream_to is not None:
+                        return _copy_response(response, stream_to), response_headers
+                    payload = response.read()
+            except urllib.error.HTTPError as e:
+                error_body = e.read().decode('utf-8', errors='replace')
+                retryable = e.code in THROTTLE_STATUSES or e.code in RETRY_STATUSES
+                if not retryable or attempt == self.max_retries:
+                    raise ApiError(f"{method} {path} failed with HTTP {e.code}: {error_body[:200]}",
+                                   status=e.code, body=error_body)
+                if e.code in RETRY_STATUSES:
+                    delay = min(2 ** attempt, 30)
+                    self.logger.warning(f"{method} {path} failed with HTTP {e.code}, retrying in {delay}s")
+                    self.sleep(delay)
+                    continue
+                self.throttled += 1
+                retry_after = parse_retry_after(e.headers.get('Retry-After'))
+                if retry_after is None:
+                    retry_after = min(2 ** attempt, 60)
+                self.logger.warning(
+                    f"{method} {path} throttled (HTTP {e.code}), retrying in {retry_after:.1f}s"
+                )
+                if self.limiter is not None:
+                    # Blocks the bucket for every process; the next acquire waits it out
+                    self.limiter.penalize(endpoint, scope_id, retry_after)
+                else:
+                    self.sleep(retry_after)
+                continue
+            except urllib.error.URLError as e:
+                raise ApiError(f"{method} {path} failed: {e.reason}")
+
+            if raw:
+                return payload, response_headers
+            return (json.loads(payload) if payload else None), response_headers
+
+        raise ApiError(f"{method} {path} still throttled after {self.max_retries} retries", status=429)
+
+    def get(self, endpoint, path, scope_id=None, **kwargs):
+        return self._api_call(endpoint, 'GET', path, scope_id=scope_id, **kwargs)[0]
+
+    def post(self, endpoint, path, scope_id=None, **kwargs):
+        return self._api_call(endpoint, 'POST', path, scope_id=scope_id, **kwargs)[0]
+
+    def put(self, endpoint, path, scope_id=None, **kwargs):
+        return self._api_call(endpoint, 'PUT', path, scope_id=scope_id, **kwargs)[0]
+
+
+class TokenProvider:
+    """
+    Client-credentials tokens from the Azure AD token endpoint, cached per
+    scope until shortly before they expire. Warm workers keep the cache
+    between programs, so most runs do not request a token at all.
+    """
+
+    _cache = {}
+    _lock = threading.Lock()
+
+    def __init__(self, token_url, client_id, client_secret, limiter=None, sleep=time.sleep, logger=None):
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.client = ApiClient(token_url, limiter=limiter, sleep=sleep, logger=logger)
+
+    def token(self, scope):
+        key = (self.token_url, self.client_id, scope)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[1] - TOKEN_EXPIRY_MARGIN > time.time():
+                return cached[0]
+            response = self.client.post('powerbi.api', self.token_url, auth=False, form={
+                'grant_type': 'client_credentials',
+                'client_id': self.client_id or '',
+                'client_secret': self.client_secret or '',
+                'scope': scope,
+            })
+            expires_at = time.time() + float(response.get('expires_in', 3600))
+            self._cache[key] = (response['access_token'], expires_at)
+            return response['access_token']
+
+    def for_scope(self, scope):
+        """A callable suitable for ApiClient(token=...)"""
+        return lambda: self.token(scope)
+
+
+def create_token_provider(program_params, limiter=None, sleep=time.sleep, logger=None):
+    """Token provider from token_url and the POWERBI_CLIENT_ID/SECRET environment, or None"""
+    token_url = program_params.get('token_url')
+    if not token_url:
+        return None
+    return TokenProvider(
+        token_url, os.environ.get('POWERBI_CLIENT_ID'), os.environ.get('POWERBI_CLIENT_SECRET'),
+        limiter=limiter, sleep=sleep, logger=logger
+    )
+
+
+class PowerBIService:
+    """The Power BI REST calls the engine needs, on top of a rate-limited ApiClient"""
+
+    def __init__(self, client, sleep=time.sleep, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.client = client
+        self.sleep = sleep
+        self.poll_interval = poll_interval
+
+    def _poll_delay(self, headers):
+        retry_after = parse_retry_after((headers or {}).get('Retry-After'))
+        return retry_after if retry_after is not None else self.poll_interval
+
+    def find_report(self, workspace_id, report_name):
+        """Report id for a report name (or id) in the workspace"""
+        quoted = report_name.replace("'", "''")
+        reports = self.client.get(
+            'powerbi.api', f"groups/{workspace_id}/reports", scope_id=workspace_id,
+            params={'$filter': f"name eq '{quoted}'"}
+        ).get('value', [])
+        for report in reports:
+            if report_name in (report.get('name'), report.get('id')):
+                return report['id']
+        raise ApiError(f"Report {report_name} not found in workspace {workspace_id}", status=404)
+
+    def refresh_history(self, workspace_id, dataset_id, top=REFRESH_HISTORY):
+        """Recent refreshes of the dataset, newest first"""
+        return self.client.get(
+            'powerbi.api', f"groups/{workspace_id}/datasets/{dataset_id}/refreshes",
+            scope_id=workspace_id, params={'$top': top}
+        ).get('value', [])
+
+    def last_completed_refresh(self, workspace_id, dataset_id):
+        """The refresh the dataset's current data comes from, or None"""
+        for refresh in self.refresh_history(workspace_id, dataset_id):
+            if refresh.get('status') == 'Completed':
+                return refresh
+        return None
+
+    def refresh_dataset(self, workspace_id, dataset_id, timeout=None):
+        """
+        Start a refresh and wait for it; returns the finished refresh entry.
+        If another refresh of the dataset is already running, waits for that one instead.
+        """
+        conflict = False
+        request_id = None
+        try:
+            _, headers = self.client._api_call(
+                'powerbi.refresh', 'POST', f"groups/{workspace_id}/datasets/{dataset_id}/refreshes",
+                scope_id=dataset_id, body={'notifyOption': 'NoNotification'}
+            )
+            request_id = headers.get('RequestId') or headers.get('x-ms-request-id')
+        except ApiError as e:
+            if e.status != 409:
+                raise
+            conflict = True
+            self.client.logger.info(f"Dataset {dataset_id} is already refreshing; waiting for that refresh")
+        if not request_id:
+            history = self.refresh_history(workspace_id, dataset_id)
+            running = [item for item in history if item.get('status') == 'Unknown']
+            # History is newest first: follow the latest running refresh, or after a conflict
+            # the latest one if it finished in the meantime
+            followed = running[0] if running else (history[0] if history and conflict else {})
+            request_id = followed.get('requestId')
+        if not request_id:
+            # Nothing to match against the history; polling would only run into the timeout
+            raise ApiError(f"Refresh of dataset {dataset_id} started but its request id is unknown")
+
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            self.sleep(self.poll_interval)
+            history = self.refresh_history(workspace_id, dataset_id)
+            # Later refreshes may already be listed above the one we follow
+            refresh = next((item for item in history if item.get('requestId') == request_id), None)
+            if refresh is not None:
+                status = refresh.get('status')
+                if status == 'Completed':
+                    return refresh
+                if status in ('Failed', 'Disabled', 'Cancelled'):
+                    error = refresh.get('serviceExceptionJson') or status
+                    raise ApiError(f"Refresh of dataset {dataset_id} failed: {error}")
+            if deadline is not None and time.monotonic() > deadline:
+                raise ApiError(f"Refresh of dataset {dataset_id} did not finish within {timeout}s")
+
+    def export_report(self, workspace_id, report_id, output_type, destination, on_progress=None):
+        """Export the report to destination (start, poll until done, download)"""
+        export_format = EXPORT_FORMATS.get((output_type or '').lower(), (output_type or 'PDF').upper())
+        base = f"groups/{workspace_id}/reports/{report_id}"
+        export = self.client.post('powerbi.export', f"{base}/ExportTo", scope_id=workspace_id,
+                                  body={'format': export_format})
+        export_id = export['id']
+        while export.get('status') not in ('Succeeded', 'Failed'):
+            if on_progress:
+                on_progress(export.get('percentComplete') or 0)
+            export, headers = self.client._api_call(
+                'powerbi.api', 'GET', f"{base}/exports/{export_id}", scope_id=workspace_id
+            )
+            if export.get('status') not in ('Succeeded', 'Failed'):
+                self.sleep(self._poll_delay(headers))
+        if export['status'] == 'Failed':
+            error = (export.get('error') or {}).get('message') or 'unknown error'
+            raise ApiError(f"Export of report {report_id} failed: {error}")
+        if on_progress:
+            on_progress(100)
+
+        directory = os.path.dirname(os.path.abspath(destination))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{destination}.part"
+        try:
+            size, _ = self.client._api_call(
+                'powerbi.api', 'GET', f"{base}/exports/{export_id}/file", scope_id=workspace_id,
+                stream_to=temp_path
+            )
+            os.replace(temp_path, destination)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return size
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cross-process token-bucket rate limiter backed by a local SQLite file.
+
+Every engine process on the host (warm workers and one-shot runs) opens the
+same file, so all executions share one budget per bucket. A bucket is keyed by
+endpoint class plus tenant and scope (workspace for Power BI, site for
+SharePoint), e.g. "powerbi.export:<tenant>:<workspace_id>".
+
+Callers reserve tokens up front: a call that finds the bucket empty takes its
+token anyway (the balance goes negative) and sleeps until the token would have
+been refilled. Waiting callers are therefore served in arrival order and the
+combined request rate stays at the configured ceiling without polling.
+
+A 429/503 answer blocks the bucket for the server's Retry-After so every
+process backs off, not only the one that was throttled.
+"""
+
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import os
+import sqlite3
+import threading
+import time
+
+# rate: tokens refilled per second, burst: bucket size,
+# scope: which program parameter identifies the bucket besides the tenant
+DEFAULT_LIMITS = {
+    'powerbi.api': {'rate': 2.0, 'burst': 10, 'scope': 'tenant'},
+    'powerbi.export': {'rate': 0.5, 'burst': 5, 'scope': 'workspace'},
+    'powerbi.refresh': {'rate': 0.1, 'burst': 2, 'scope': 'dataset'},
+    'sharepoint.upload': {'rate': 5.0, 'burst': 10, 'scope': 'site'},
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0
+)
+"""
+
+# Never sleep longer than this in one go so cancellation stays responsive
+MAX_SLEEP = 1.0
+
+
+class RateLimitTimeout(Exception):
+    """The wait for a token would exceed the caller's timeout"""
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After as seconds (delta-seconds or HTTP-date); None if absent/invalid"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return max(0.0, (when - now).total_seconds())
+
+
+class RateLimiter:
+    """Token buckets shared by every process that opens the same database file"""
+
+    def __init__(self, path, limits=None, tenant_id='default', sleep=time.sleep, clock=time.time):
+        self.path = str(path)
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.tenant_id = tenant_id
+        self.sleep = sleep
+        self.clock = clock
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One connection per limiter; threads of the same process (parallel uploads) take turns on it
+        self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def bucket_key(self, endpoint, scope_id=None):
+        limit = self.limits[endpoint]
+        if limit.get('scope', 'tenant') == 'tenant' or not scope_id:
+            return f"{endpoint}:{self.tenant_id}"
+        return f"{endpoint}:{self.tenant_id}:{scope_id}"
+
+    def _reserve(self, key, limit, tokens):
+        """Take tokens from the bucket; return how long the caller must wait"""
+        rate, burst = float(limit['rate']), float(limit['burst'])
+        with self._lock:
+            return self._reserve_locked(key, rate, burst, tokens)
+
+    def _reserve_locked(self, key, rate, burst, tokens):
+        conn = self._conn
+        # BEGIN IMMEDIATE takes the write lock up front so read-modify-write is atomic
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = self.clock()
+            row = conn.execute(
+                'SELECT tokens, updated, blocked_until FROM buckets WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                balance, blocked_until = burst, 0.0
+            else:
+                balance = min(burst, row[0] + (now - row[1]) * rate)
+                blocked_until = row[2]
+
+            balance -= tokens
+            wait = max(0.0, -balance / rate, blocked_until - now)
+            conn.execute(
+                'INSERT INTO buckets (key, tokens, updated, blocked_until) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated',
+                (key, balance, now, blocked_until)
+            )
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return wait
+
+    def acquire(self, endpoint, scope_id=None, tokens=1, timeout=None):
+        """
+        Block until the call may proceed; return the seconds spent waiting.
+        Raises RateLimitTimeout without consuming tokens if the wait would exceed timeout.
+        """
+        limit = self.limits[endpoint]
+        key = self.bucket_key(endpoint, scope_id)
+        if timeout is not None:
+            expected = self.expected_wait(endpoint, scope_id, tokens)
+            if expected > timeout:
+                raise RateLimitTimeout(f"{key}: waiting {expected:.1f}s exceeds {timeout:.1f}s")
+
+        wait = self._reserve(key, limit, tokens)
+        deadline = self.clock() + wait
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return wait
+            self.sleep(min(remaining, MAX_SLEEP))
+
+    def expected_wait(self, endpoint, scope_id=None, tokens=1):
+        """How long acquire() would wait right now (does not consume tokens)"""
+        limit = self.limits[endpoint]
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT tokens, updated, blocked_until FROM buckets WHERE key = ?',
+                (self.bucket_key(endpoint, scope_id),)
+            ).fetchone()
+        if row is None:
+            return 0.0
+        now = self.clock()
+        rate = float(limit['rate'])
+        balance = min(float(limit['burst']), row[0] + (now - row[1]) * rate) - tokens
+        return max(0.0, -balance / rate, row[2] - now)
+
+    def penalize(self, endpoint, scope_id=None, retry_after=None):
+        """
+        The server throttled us: empty the bucket and block it for retry_after
+        seconds (defaults to one token's refill time) for every process.
+        """
+        limit = self.limits[endpoint]
+        retry_after = retry_after if retry_after is not None else 1.0 / float(limit['rate'])
+        now = self.clock()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO buckets (key, tokens, updated, blocked_until) VALUES (?, 0, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = MIN(buckets.tokens, 0), updated = excluded.updated, '
+                'blocked_until = MAX(buckets.blocked_until, excluded.blocked_until)',
+                (self.bucket_key(endpoint, scope_id), now, now + retry_after)
+            )
+
+
+def create_rate_limiter(program_params, sleep=time.sleep):
+    """Build the limiter described by the program parameters, or None if not configured"""
+    path = program_params.get('rate_limit_db')
+    if not path:
+        return None
+    return RateLimiter(
+        path,
+        limits=program_params.get('rate_limits'),
+        tenant_id=program_params.get('tenant_id') or 'default',
+        sleep=sleep,
+    )
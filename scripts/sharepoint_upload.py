@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Chunked, resumable SharePoint upload (Microsoft Graph upload sessions).
+
+    1. GET the destination item; if its size and quickXorHash match the local
+       file the upload is skipped.
+    2. Create an upload session (or resume the one recorded next to the local
+       file by an earlier, interrupted run).
+    3. PUT the byte ranges the server still expects in fixed-size chunks,
+       several at a time.
+    4. After a failed chunk, ask the session which ranges are still missing
+       (nextExpectedRanges) and send only those.
+
+Sending chunks in parallel requires a server that accepts ranges out of
+order; set upload_parallel to 1 for one that does not.
+"""
+
+import base64
+import json
+import os
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from powerbi_client import ApiError
+
+# Graph requires chunks to be a multiple of 320 KiB
+CHUNK_ALIGNMENT = 320 * 1024
+DEFAULT_CHUNK_SIZE = 32 * CHUNK_ALIGNMENT  # 10 MiB
+READ_SIZE = 1024 * 1024
+
+QUICKXOR_WIDTH = 160
+QUICKXOR_SHIFT = 11
+# A multiple of the width, so whole blocks can be folded together
+QUICKXOR_BLOCK = QUICKXOR_WIDTH * 4096
+
+
+class QuickXorHash:
+    """
+    The hash SharePoint/OneDrive report for files (file.hashes.quickXorHash).
+
+    Byte i is XORed into a 160-bit circular register at bit (i * 11) % 160,
+    then the 64-bit length is XORed into the top 8 bytes. Because the bit
+    position repeats every 160 bytes, all bytes at the same position modulo
+    160 are XORed together first, one large block at a time.
+    """
+
+    def __init__(self):
+        self._folded = 0        # XOR of all complete QUICKXOR_BLOCK blocks
+        self._pending = b''
+        self.length = 0
+
+    def update(self, data):
+        self.length += len(data)
+        data = self._pending + bytes(data)
+        whole = len(data) - len(data) % QUICKXOR_BLOCK
+        for start in range(0, whole, QUICKXOR_BLOCK):
+            self._folded ^= int.from_bytes(data[start:start + QUICKXOR_BLOCK], 'little')
+        self._pending = data[whole:]
+
+    def digest(self):
+        folded = self._folded ^ int.from_bytes(self._pending, 'little')
+        block = folded.to_bytes(QUICKXOR_BLOCK, 'little')
+        # Fold the block down to one byte per position modulo 160
+        columns = 0
+        for start in range(0, QUICKXOR_BLOCK, QUICKXOR_WIDTH):
+            columns ^= int.from_bytes(block[start:start + QUICKXOR_WIDTH], 'little')
+        columns = columns.to_bytes(QUICKXOR_WIDTH, 'little')
+
+        mask = (1 << QUICKXOR_WIDTH) - 1
+        register = 0
+        for position, value in enumerate(columns):
+            if value:
+                shifted = value << (position * QUICKXOR_SHIFT % QUICKXOR_WIDTH)
+                register ^= (shifted | (shifted >> QUICKXOR_WIDTH)) & mask
+
+        result = bytearray(register.to_bytes(QUICKXOR_WIDTH // 8, 'little'))
+        for i, byte in enumerate(self.length.to_bytes(8, 'little')):
+            result[QUICKXOR_WIDTH // 8 - 8 + i] ^= byte
+        return bytes(result)
+
+    def b64digest(self):
+        return base64.b64encode(self.digest()).decode('ascii')
+
+
+def quickxorhash_file(path):
+    hasher = QuickXorHash()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.b64digest()
+
+
+def parse_ranges(next_expected_ranges, size):
+    """["0-1023", "4096-"] -> [(0, 1024), (4096, size)] as half-open intervals"""
+    ranges = []
+    for item in next_expected_ranges or []:
+        start, _, end = item.partition('-')
+        ranges.append((int(start), int(end) + 1 if end else size))
+    return ranges
+
+
+def split_ranges(ranges, chunk_size):
+    """Cut the missing ranges into chunks of at most chunk_size bytes"""
+    chunks = []
+    for start, end in ranges:
+        for offset in range(start, end, chunk_size):
+            chunks.append((offset, min(end, offset + chunk_size)))
+    return chunks
+
+
+class UploadSessionState:
+    """An interrupted run's upload session, stored next to the local file"""
+
+    def __init__(self, local_path):
+        directory, name = os.path.split(os.path.abspath(local_path))
+        self.path = os.path.join(directory, f".{name}.upload.json")
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, state):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class SharePointUploader:
+    """Upload files to one SharePoint site through an ApiClient"""
+
+    endpoint = 'sharepoint.upload'
+
+    def __init__(self, client, site, chunk_size=DEFAULT_CHUNK_SIZE, parallel=4, max_rounds=5,
+                 check_cancelled=None, logger=None):
+        self.client = client
+        self.site = site
+        self.chunk_size = max(CHUNK_ALIGNMENT, chunk_size // CHUNK_ALIGNMENT * CHUNK_ALIGNMENT)
+        self.parallel = max(1, int(parallel))
+        self.max_rounds = max_rounds
+        self.check_cancelled = check_cancelled or (lambda: None)
+        self.logger = logger or client.logger
+        self._file_lock = threading.Lock()
+
+    def _item_path(self, remote_path):
+        site = urllib.parse.quote(self.site, safe=':,')
+        path = urllib.parse.quote(remote_path.strip('/'), safe='/')
+        return f"sites/{site}/drive/root:/{path}"
+
+    def remote_item(self, remote_path):
+        """Metadata of the destination file, or None if it does not exist"""
+        try:
+            return self.client.get(self.endpoint, self._item_path(remote_path), scope_id=self.site)
+        except ApiError as e:
+            if e.status == 404:
+                return None
+            raise
+
+    def _create_session(self, remote_path):
+        return self.client.post(
+            self.endpoint, f"{self._item_path(remote_path)}:/createUploadSession", scope_id=self.site,
+            body={'item': {'@microsoft.graph.conflictBehavior': 'replace'}}
+        )
+
+    def _session_status(self, upload_url):
+        """The session's nextExpectedRanges, or None if it expired or was cancelled"""
+        try:
+            return self.client._api_call(self.endpoint, 'GET', upload_url, scope_id=self.site, auth=False)[0]
+        except ApiError as e:
+            if e.status in (404, 410):
+                return None
+            raise
+
+    def _send_chunk(self, f, upload_url, start, end, size):
+        self.check_cancelled()
+        with self._file_lock:
+            f.seek(start)
+            data = f.read(end - start)
+        # Upload URLs are pre-authenticated; Graph rejects an Authorization header on them
+        return self.client._api_call(
+            self.endpoint, 'PUT', upload_url, scope_id=self.site, body=data, auth=False,
+            headers={'Content-Range': f"bytes {start}-{end - 1}/{size}"}
+        )[0]
+
+    def upload(self, local_path, remote_path):
+        """
+        Upload local_path to remote_path.
+        Returns {'status': 'skipped' | 'uploaded', 'bytes': ..., 'resumed_from': ...}.
+        """
+        size = os.path.getsize(local_path)
+        local_hash = quickxorhash_file(local_path)
+
+        item = self.remote_item(remote_path)
+        if item is not None and item.get('size') == size \
+                and (item.get('file') or {}).get('hashes', {}).get('quickXorHash') == local_hash:
+            self.logger.info(f"{remote_path} is already up to date on SharePoint; skipping upload")
+            return {'status': 'skipped', 'bytes': 0, 'resumed_from': None}
+
+        if size == 0:
+            # Upload sessions need at least one byte
+            self.client.put(self.endpoint, f"{self._item_path(remote_path)}:/content", scope_id=self.site, body=b'')
+            return {'status': 'uploaded', 'bytes': 0, 'resumed_from': None}
+
+        state_file = UploadSessionState(local_path)
+        upload_url, missing, resumed_from = self._resume_session(state_file, remote_path, size, local_hash)
+        if upload_url is None:
+            upload_url = self._create_session(remote_path)['uploadUrl']
+            state_file.save({'upload_url': upload_url, 'remote_path': remote_path,
+                             'size': size, 'quick_xor_hash': local_hash})
+            missing = [(0, size)]
+
+        sent = 0
+        with open(local_path, 'rb') as f:
+            for _ in range(self.max_rounds):
+                chunks = split_ranges(missing, self.chunk_size)
+                if not chunks:
+                    break
+                errors = []
+                with ThreadPoolExecutor(max_workers=min(self.parallel, len(chunks))) as pool:
+                    futures = {pool.submit(self._send_chunk, f, upload_url, start, end, size): (start, end)
+                               for start, end in chunks}
+                    for future, (start, end) in futures.items():
+                        try:
+                            future.result()
+                            sent += end - start
+                        except (ApiError, OSError) as e:
+                            errors.append(e)
+                if not errors:
+                    missing = []
+                    break
+
+                self.logger.warning(
+                    f"{len(errors)} of {len(chunks)} chunks of {remote_path} failed ({errors[0]}); "
+                    f"resuming from the server's acknowledged ranges"
+                )
+                status = self._session_status(upload_url)
+                if status is None:
+                    state_file.clear()
+                    raise ApiError(f"Upload session for {remote_path} expired")
+                missing = parse_ranges(status.get('nextExpectedRanges'), size)
+            else:
+                raise ApiError(f"Upload of {remote_path} did not complete after {self.max_rounds} rounds")
+
+        state_file.clear()
+        self.logger.info(f"Uploaded {remote_path} ({size} bytes, {sent} sent)")
+        return {'status': 'uploaded', 'bytes': sent, 'resumed_from': resumed_from}
+
+    def _resume_session(self, state_file, remote_path, size, local_hash):
+        """
+        Continue an earlier run's session for the same file content if it is still open.
+        Returns (upload_url, missing ranges, first missing byte) or (None, None, None).
+        """
+        state = state_file.load()
+        if not state:
+            return None, None, None
+        status = None
+        if state.get('remote_path') == remote_path and state.get('size') == size \
+                and state.get('quick_xor_hash') == local_hash:
+            status = self._session_status(state['upload_url'])
+        if status is None:
+            state_file.clear()
+            return None, None, None
+        missing = parse_ranges(status.get('nextExpectedRanges'), size)
+        resumed_from = min((start for start, _ in missing), default=size)
+        self.logger.info(f"Resuming upload of {remote_path} at byte {resumed_from}")
+        return state['upload_url'], missing, resumed_from
+
+
+def remote_path_for(program_params, local_path):
+    folder = (program_params.get('sharepoint_path') or '').strip('/')
+    name = os.path.basename(local_path)
+    return f"{folder}/{name}" if folder else name
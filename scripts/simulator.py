@@ -0,0 +1,646 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the services the engine talks to, so the scheduler and
+engine can be exercised and benchmarked on one machine without a tenant.
+
+Token issuance (Azure AD client credentials):
+    POST /{tenant}/oauth2/v2.0/token
+
+Power BI REST API (base URL http://host:port/v1.0/myorg):
+    GET  /v1.0/myorg/groups/{ws}/reports[?$filter=name eq '...']
+    POST /v1.0/myorg/groups/{ws}/datasets/{ds}/refreshes        202, RequestId header
+    GET  /v1.0/myorg/groups/{ws}/datasets/{ds}/refreshes[?$top=n]
+    POST /v1.0/myorg/groups/{ws}/reports/{id}/ExportTo          202, export job
+    GET  /v1.0/myorg/groups/{ws}/reports/{id}/exports/{export}  status, Retry-After
+    GET  /v1.0/myorg/groups/{ws}/reports/{id}/exports/{export}/file
+
+SharePoint (Microsoft Graph drive subset, base URL http://host:port):
+    GET  /sites/{site}/drive/root:/{path}                      item metadata (size, quickXorHash)
+    PUT  /sites/{site}/drive/root:/{path}:/content             simple upload
+    POST /sites/{site}/drive/root:/{path}:/createUploadSession
+    PUT  /upload/{session}      Content-Range chunk; 202 + nextExpectedRanges, 201 + item when complete
+    GET  /upload/{session}      nextExpectedRanges
+    DELETE /upload/{session}
+
+GET /_stats returns request, error and throttling counters per endpoint class.
+
+Reports, datasets and files are created on first use and kept in memory.
+Every request belongs to an endpoint class (token, api, refresh, export,
+upload) with its own fault settings:
+    latency      added response time: "0.05" (fixed) or "0.05/0.5" (lognormal median/p95)
+    error rate   fraction of requests answered with HTTP 500 before doing anything
+    throttle     server-side token bucket "rate/burst"; excess requests get 429 + Retry-After
+    429 rate     fraction of requests answered with 429 regardless of the bucket
+Export and refresh jobs take --export-seconds / --refresh-seconds (same latency syntax).
+
+Usage:
+    python scripts/simulator.py --port 8765 --latency api=0.05/0.3 --throttle export=0.5/5 \\
+        --error-rate upload=0.05 --export-seconds 20/60
+Then set engine.powerbi_api_url = http://127.0.0.1:8765/v1.0/myorg,
+engine.token_url = http://127.0.0.1:8765/sim/oauth2/v2.0/token and
+engine.sharepoint_api_url = http://127.0.0.1:8765.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sharepoint_upload import QuickXorHash
+
+SESSION_LIFETIME = timedelta(hours=1)
+TOKEN_LIFETIME = 3600
+ENDPOINT_CLASSES = ('token', 'api', 'refresh', 'export', 'upload')
+# z-score of the 95th percentile, for lognormal latencies given as median/p95
+P95_Z = 1.6449
+
+TOKEN_PATH = re.compile(r'^/(?P<tenant>[^/]+)/oauth2/v2\.0/token$')
+GROUP_PATH = re.compile(r'^/v1\.0/myorg/groups/(?P<ws>[^/]+)/(?P<rest>.+)$')
+ITEM_PATH = re.compile(r'^/sites/(?P<site>[^/]+)/drive/root:/(?P<path>.+?)(?::/(?P<action>[A-Za-z]+))?$')
+UPLOAD_PATH = re.compile(r'^/upload/(?P<session>[0-9a-f]+)$')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+REPORT_FILTER = re.compile(r"^name eq '(?P<name>(?:[^']|'')*)'$")
+
+
+class SimulatedError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def _isoformat(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+class Latency:
+    """A fixed delay, or a lognormal one described by its median and 95th percentile"""
+
+    def __init__(self, median=0.0, p95=None):
+        self.median = float(median)
+        self.p95 = float(p95) if p95 is not None else None
+
+    @classmethod
+    def parse(cls, spec):
+        median, _, p95 = str(spec).partition('/')
+        return cls(median, p95 or None)
+
+    def sample(self, rng):
+        if self.median <= 0:
+            return 0.0
+        if not self.p95 or self.p95 <= self.median:
+            return self.median
+        sigma = math.log(self.p95 / self.median) / P95_Z
+        return rng.lognormvariate(math.log(self.median), sigma)
+
+    def __repr__(self):
+        return f"{self.median}/{self.p95}" if self.p95 else f"{self.median}"
+
+
+class Bucket:
+    """Server-side rate limit; answers how long the caller should wait (0 when admitted)"""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    @classmethod
+    def parse(cls, spec):
+        rate, _, burst = str(spec).partition('/')
+        return cls(rate, burst or rate)
+
+    def take(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class FaultProfile:
+    """Latency, errors and throttling per endpoint class"""
+
+    def __init__(self, latency=None, error_rate=None, throttle=None, throttle_rate=None, seed=None):
+        self.random = random.Random(seed)
+        self.latency = {name: Latency.parse(spec) for name, spec in (latency or {}).items()}
+        self.error_rate = {name: float(rate) for name, rate in (error_rate or {}).items()}
+        self.buckets = {name: Bucket.parse(spec) for name, spec in (throttle or {}).items()}
+        self.throttle_rate = {name: float(rate) for name, rate in (throttle_rate or {}).items()}
+        self.lock = threading.Lock()
+
+    def before(self, endpoint_class):
+        """Apply the class's faults to one request; raises SimulatedError to answer early"""
+        with self.lock:
+            delay = self.latency.get(endpoint_class, Latency()).sample(self.random)
+            fail = self.random.random() < self.error_rate.get(endpoint_class, 0.0)
+            throttled = self.random.random() < self.throttle_rate.get(endpoint_class, 0.0)
+            bucket = self.buckets.get(endpoint_class)
+            retry_after = bucket.take() if bucket is not None and not (fail or throttled) else 0.0
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise SimulatedError(500, 'Simulated server error')
+        if throttled or retry_after:
+            seconds = max(1, math.ceil(retry_after)) if retry_after else 1
+            raise SimulatedError(429, 'Too many requests', {'Retry-After': str(seconds)})
+
+
+class UploadSession:
+    def __init__(self, site, path, size=None):
+        self.id = uuid.uuid4().hex
+        self.site = site
+        self.path = path
+        self.size = size
+        self.received = {}      # start offset -> bytes
+        self.expires = datetime.now(timezone.utc) + SESSION_LIFETIME
+
+    def missing(self):
+        """Half-open byte ranges not received yet"""
+        if self.size is None:
+            return [(0, None)]
+        ranges, offset = [], 0
+        for start in sorted(self.received):
+            if start > offset:
+                ranges.append((offset, start))
+            offset = max(offset, start + len(self.received[start]))
+        if offset < self.size:
+            ranges.append((offset, self.size))
+        return ranges
+
+    def next_expected_ranges(self):
+        return [f"{start}-" if end in (None, self.size) else f"{start}-{end - 1}"
+                for start, end in self.missing()]
+
+    def content(self):
+        return b''.join(self.received[start] for start in sorted(self.received))
+
+
+class SharePointSimulator:
+    """In-memory drive state shared by the request handlers"""
+
+    def __init__(self):
+        self.files = {}         # (site, path) -> {'content', 'modified'}
+        self.sessions = {}
+        self.counters = {'chunks': 0, 'chunk_bytes': 0, 'sessions': 0}
+
+    def item(self, site, path):
+        entry = self.files.get((site, path))
+        if entry is None:
+            raise SimulatedError(404, f"{path} not found")
+        hasher = QuickXorHash()
+        hasher.update(entry['content'])
+        return {
+            'name': path.rsplit('/', 1)[-1],
+            'size': len(entry['content']),
+            'lastModifiedDateTime': _isoformat(entry['modified']),
+            'file': {'hashes': {'quickXorHash': hasher.b64digest()}},
+        }
+
+    def store(self, site, path, content):
+        self.files[(site, path)] = {'content': content, 'modified': datetime.now(timezone.utc)}
+        return self.item(site, path)
+
+    def create_session(self, site, path, base_url):
+        session = UploadSession(site, path)
+        self.sessions[session.id] = session
+        self.counters['sessions'] += 1
+        return {
+            'uploadUrl': f"{base_url}/upload/{session.id}",
+            'expirationDateTime': _isoformat(session.expires),
+            'nextExpectedRanges': session.next_expected_ranges(),
+        }
+
+    def session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None or session.expires < datetime.now(timezone.utc):
+            raise SimulatedError(404, 'Upload session not found')
+        return session
+
+    def put_chunk(self, session_id, content_range, data):
+        """Returns (status, body)"""
+        session = self.session(session_id)
+        match = CONTENT_RANGE.match(content_range or '')
+        if not match:
+            raise SimulatedError(400, 'Invalid Content-Range')
+        start, end, size = (int(value) for value in match.groups())
+        if end - start + 1 != len(data) or (session.size is not None and size != session.size):
+            raise SimulatedError(400, 'Content-Range does not match the request body')
+        for received_start, received in session.received.items():
+            if start < received_start + len(received) and received_start < end + 1 \
+                    and received_start != start:
+                raise SimulatedError(416, 'Fragment overlaps data already received')
+
+        session.size = size
+        session.received[start] = data
+        self.counters['chunks'] += 1
+        self.counters['chunk_bytes'] += len(data)
+        if session.missing():
+            return 202, {'expirationDateTime': _isoformat(session.expires),
+                         'nextExpectedRanges': session.next_expected_ranges()}
+        del self.sessions[session_id]
+        return 201, self.store(session.site, session.path, session.content())
+
+
+class PowerBISimulator:
+    """Reports, dataset refreshes and export jobs; jobs advance with wall-clock time"""
+
+    def __init__(self, export_seconds=None, refresh_seconds=None, export_size=64 * 1024,
+                 export_failure_rate=0.0, refresh_failure_rate=0.0, seed=None):
+        self.random = random.Random(seed)
+        self.export_seconds = Latency.parse(export_seconds if export_seconds is not None else 5)
+        self.refresh_seconds = Latency.parse(refresh_seconds if refresh_seconds is not None else 5)
+        self.export_size = int(export_size)
+        self.export_failure_rate = float(export_failure_rate)
+        self.refresh_failure_rate = float(refresh_failure_rate)
+        self.reports = {}       # (ws, id) -> {'id', 'name', 'datasetId'}
+        self.refreshes = {}     # (ws, ds) -> [refresh, ...] newest first
+        self.exports = {}       # export id -> job
+        self.counters = {'refreshes': 0, 'exports': 0, 'export_bytes': 0}
+
+    def report(self, workspace_id, name):
+        report_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{workspace_id}/{name}"))
+        return self.reports.setdefault((workspace_id, report_id), {
+            'id': report_id, 'name': name, 'datasetId': str(uuid.uuid5(uuid.NAMESPACE_URL, f"{workspace_id}/{name}/dataset")),
+        })
+
+    def list_reports(self, workspace_id, query):
+        match = REPORT_FILTER.match((query.get('$filter') or [''])[0])
+        if match:
+            # Unknown names are created on first use
+            return {'value': [self.report(workspace_id, match.group('name').replace("''", "'"))]}
+        return {'value': [report for (ws, _), report in self.reports.items() if ws == workspace_id]}
+
+    def _finish_refresh(self, refresh):
+        if refresh['status'] == 'Unknown' and time.monotonic() >= refresh['_done_at']:
+            refresh['status'] = 'Failed' if refresh['_fails'] else 'Completed'
+            refresh['endTime'] = _isoformat(datetime.now(timezone.utc))
+            if refresh['_fails']:
+                refresh['serviceExceptionJson'] = json.dumps({'errorCode': 'ModelRefreshFailed'})
+
+    def start_refresh(self, workspace_id, dataset_id):
+        history = self.refreshes.setdefault((workspace_id, dataset_id), [])
+        for refresh in history:
+            self._finish_refresh(refresh)
+        if any(refresh['status'] == 'Unknown' for refresh in history):
+            raise SimulatedError(409, 'Another refresh request is already executing')
+        refresh = {
+            'requestId': str(uuid.uuid4()),
+            'refreshType': 'ViaApi',
+            'startTime': _isoformat(datetime.now(timezone.utc)),
+            'status': 'Unknown',
+            '_done_at': time.monotonic() + self.refresh_seconds.sample(self.random),
+            '_fails': self.random.random() < self.refresh_failure_rate,
+        }
+        history.insert(0, refresh)
+        self.counters['refreshes'] += 1
+        return 202, None, {'RequestId': refresh['requestId'], 'Location': refresh['requestId']}
+
+    def list_refreshes(self, workspace_id, dataset_id, query):
+        history = self.refreshes.get((workspace_id, dataset_id), [])
+        top = int((query.get('$top') or [len(history) or 1])[0])
+        for refresh in history[:top]:
+            self._finish_refresh(refresh)
+        return {'value': [{k: v for k, v in refresh.items() if not k.startswith('_')}
+                          for refresh in history[:top]]}
+
+    def start_export(self, workspace_id, report_id, body):
+        if (workspace_id, report_id) not in self.reports:
+            raise SimulatedError(404, f"Report {report_id} not found")
+        export_id = uuid.uuid4().hex
+        duration = self.export_seconds.sample(self.random)
+        job = {
+            'id': export_id, 'reportId': report_id, 'format': (body or {}).get('format', 'PDF'),
+            '_started': time.monotonic(), '_duration': duration,
+            '_fails': self.random.random() < self.export_failure_rate,
+        }
+        self.exports[export_id] = job
+        self.counters['exports'] += 1
+        return 202, self.export_status(export_id), {}
+
+    def export_status(self, export_id):
+        job = self.exports.get(export_id)
+        if job is None:
+            raise SimulatedError(404, f"Export {export_id} not found")
+        elapsed = time.monotonic() - job['_started']
+        status = {'id': job['id'], 'reportId': job['reportId'], 'format': job['format']}
+        if elapsed < job['_duration']:
+            percent = int(elapsed / job['_duration'] * 100) if job['_duration'] else 0
+            status.update(status='Running' if percent else 'NotStarted', percentComplete=percent)
+        elif job['_fails']:
+            status.update(status='Failed', percentComplete=100, error={'code': 'ExportFailed', 'message': 'Simulated export failure'})
+        else:
+            status.update(status='Succeeded', percentComplete=100, resourceFileExtension=f".{job['format'].lower()}")
+        return status
+
+    def export_poll_delay(self, export_id):
+        job = self.exports[export_id]
+        remaining = job['_duration'] - (time.monotonic() - job['_started'])
+        return max(1, min(5, math.ceil(remaining)))
+
+    def export_file(self, export_id):
+        status = self.export_status(export_id)
+        if status['status'] != 'Succeeded':
+            raise SimulatedError(400, f"Export {export_id} is not ready")
+        # Deterministic content per report and format, so unchanged exports hash the same
+        seed = hashlib.sha256(f"{status['reportId']}/{status['format']}".encode('utf-8')).digest()
+        content = (seed * (self.export_size // len(seed) + 1))[:self.export_size]
+        self.counters['export_bytes'] += len(content)
+        return content
+
+
+class Simulator:
+    """All simulated services plus the fault profile, shared by the request handlers"""
+
+    def __init__(self, faults=None, powerbi=None, sharepoint=None, require_auth=True):
+        self.faults = faults or FaultProfile()
+        self.powerbi = powerbi or PowerBISimulator()
+        self.sharepoint = sharepoint or SharePointSimulator()
+        self.require_auth = require_auth
+        self.tokens = {}        # access token -> expiry (epoch seconds)
+        self.stats = {name: {'requests': 0, 'errors': 0, 'throttled': 0} for name in ENDPOINT_CLASSES}
+        self.lock = threading.Lock()
+
+    def issue_token(self, form):
+        if form.get('grant_type') != 'client_credentials':
+            raise SimulatedError(400, 'unsupported_grant_type')
+        token = uuid.uuid4().hex
+        self.tokens[token] = time.time() + TOKEN_LIFETIME
+        return {'token_type': 'Bearer', 'expires_in': TOKEN_LIFETIME, 'access_token': token}
+
+    def check_token(self, authorization):
+        if not self.require_auth:
+            return
+        token = (authorization or '').partition('Bearer ')[2]
+        if self.tokens.get(token, 0) < time.time():
+            raise SimulatedError(401, 'Missing or expired access token')
+
+    def snapshot(self):
+        return {
+            'endpoints': self.stats,
+            'powerbi': self.powerbi.counters,
+            'sharepoint': self.sharepoint.counters,
+            'faults': {
+                'latency': {name: repr(latency) for name, latency in self.faults.latency.items()},
+                'error_rate': self.faults.error_rate,
+                'throttle_rate': self.faults.throttle_rate,
+                'throttle': {name: f"{bucket.rate}/{bucket.burst}" for name, bucket in self.faults.buckets.items()},
+            },
+        }
+
+
+def endpoint_class(method, path):
+    """Which fault settings apply to a request"""
+    if TOKEN_PATH.match(path):
+        return 'token'
+    if method == 'POST' and path.endswith('/refreshes'):
+        return 'refresh'
+    if method == 'POST' and path.endswith('/ExportTo'):
+        return 'export'
+    if UPLOAD_PATH.match(path) or ITEM_PATH.match(path):
+        return 'upload'
+    return 'api'
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=None, headers=None):
+        if isinstance(body, (bytes, bytearray)):
+            payload, content_type = bytes(body), 'application/octet-stream'
+        else:
+            payload, content_type = (b'' if body is None else json.dumps(body).encode('utf-8')), 'application/json'
+        self.send_response(status)
+        if payload:
+            self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _dispatch(self):
+        body = self._body()
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path)
+        query = urllib.parse.parse_qs(url.query)
+        state = self.state
+        if path == '/_stats':
+            with state.lock:
+                return self._send(200, state.snapshot())
+
+        name = endpoint_class(self.command, path)
+        with state.lock:
+            state.stats[name]['requests'] += 1
+        try:
+            state.faults.before(name)
+            with state.lock:
+                result = self.route(self.command, path, query, body)
+            status, response, headers = result if len(result) == 3 else (*result, {})
+        except SimulatedError as e:
+            with state.lock:
+                if e.status == 429:
+                    state.stats[name]['throttled'] += 1
+                elif e.status >= 500:
+                    state.stats[name]['errors'] += 1
+            status, headers = e.status, e.headers
+            response = {'error': {'code': str(e.status), 'message': str(e)}}
+        self._send(status, response, headers)
+
+    def route(self, method, path, query, body):
+        state = self.state
+        match = TOKEN_PATH.match(path)
+        if match and method == 'POST':
+            form = {key: values[0] for key, values in urllib.parse.parse_qs(body.decode('utf-8')).items()}
+            return 200, state.issue_token(form)
+
+        match = UPLOAD_PATH.match(path)
+        if match:
+            # Upload URLs are pre-authenticated
+            return self._route_upload(method, match.group('session'), body)
+
+        state.check_token(self.headers.get('Authorization'))
+        match = GROUP_PATH.match(path)
+        if match:
+            return self._route_powerbi(method, match.group('ws'), match.group('rest').split('/'), query, body)
+
+        match = ITEM_PATH.match(path)
+        if match:
+            site, item_path, action = match.group('site'), match.group('path'), match.group('action')
+            if method == 'GET' and action is None:
+                return 200, state.sharepoint.item(site, item_path)
+            if method == 'PUT' and action == 'content':
+                return 201, state.sharepoint.store(site, item_path, body)
+            if method == 'POST' and action == 'createUploadSession':
+                return 200, state.sharepoint.create_session(site, item_path, self._base_url())
+
+        raise SimulatedError(404, f"No route for {method} {path}")
+
+    def _route_upload(self, method, session_id, body):
+        sharepoint = self.state.sharepoint
+        if method == 'PUT':
+            return sharepoint.put_chunk(session_id, self.headers.get('Content-Range'), body)
+        if method == 'GET':
+            session = sharepoint.session(session_id)
+            return 200, {'expirationDateTime': _isoformat(session.expires),
+                         'nextExpectedRanges': session.next_expected_ranges()}
+        if method == 'DELETE':
+            sharepoint.sessions.pop(session_id, None)
+            return 204, None
+        raise SimulatedError(405, f"{method} not allowed")
+
+    def _route_powerbi(self, method, workspace_id, parts, query, body):
+        powerbi = self.state.powerbi
+        payload = json.loads(body) if body else None
+        if parts == ['reports'] and method == 'GET':
+            return 200, powerbi.list_reports(workspace_id, query)
+        if len(parts) == 3 and parts[0] == 'datasets' and parts[2] == 'refreshes':
+            if method == 'POST':
+                return powerbi.start_refresh(workspace_id, parts[1])
+            if method == 'GET':
+                return 200, powerbi.list_refreshes(workspace_id, parts[1], query)
+        if len(parts) >= 3 and parts[0] == 'reports':
+            report_id = parts[1]
+            if parts[2:] == ['ExportTo'] and method == 'POST':
+                return powerbi.start_export(workspace_id, report_id, payload)
+            if len(parts) == 4 and parts[2] == 'exports' and method == 'GET':
+                status = powerbi.export_status(parts[3])
+                headers = {}
+                if status['status'] in ('NotStarted', 'Running'):
+                    headers['Retry-After'] = str(powerbi.export_poll_delay(parts[3]))
+                return 200, status, headers
+            if len(parts) == 5 and parts[2] == 'exports' and parts[4] == 'file' and method == 'GET':
+                return 200, powerbi.export_file(parts[3])
+        raise SimulatedError(404, f"No route for {method} groups/{workspace_id}/{'/'.join(parts)}")
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+
+def _parse_assignments(values, option):
+    """["api=0.05", "export=1/5"] -> {'api': '0.05', 'export': '1/5'}"""
+    result = {}
+    for value in values or []:
+        name, sep, spec = value.partition('=')
+        if not sep or name not in ENDPOINT_CLASSES:
+            raise argparse.ArgumentTypeError(
+                f"{option} expects CLASS=VALUE with CLASS one of {', '.join(ENDPOINT_CLASSES)}: {value}"
+            )
+        result[name] = spec
+    return result
+
+
+def build_simulator(latency=None, error_rate=None, throttle=None, throttle_rate=None, seed=None,
+                    require_auth=True, **powerbi_options):
+    return Simulator(
+        faults=FaultProfile(latency, error_rate, throttle, throttle_rate, seed=seed),
+        powerbi=PowerBISimulator(seed=seed, **powerbi_options),
+        require_auth=require_auth,
+    )
+
+
+def start_simulator(host='127.0.0.1', port=0, verbose=False, **options):
+    """
+    Start the simulator on a background thread. Returns the server;
+    server.base_url is its address and server.state the Simulator.
+    """
+    server = ThreadingHTTPServer((host, port), SimulatorHandler)
+    server.daemon_threads = True
+    server.state = build_simulator(**options)
+    server.verbose = verbose
+    server.base_url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name='api-simulator', daemon=True).start()
+    return server
+
+
+def engine_settings(base_url):
+    """The engine.* settings that point the engine at a simulator"""
+    return {
+        'powerbi_api_url': f"{base_url}/v1.0/myorg",
+        'token_url': f"{base_url}/sim/oauth2/v2.0/token",
+        'sharepoint_api_url': base_url,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Power BI / SharePoint API stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', action='append', metavar='CLASS=SECONDS[/P95]',
+                        help='Added response time per endpoint class (repeatable)')
+    parser.add_argument('--error-rate', action='append', metavar='CLASS=FRACTION',
+                        help='Fraction of requests answered with HTTP 500')
+    parser.add_argument('--throttle', action='append', metavar='CLASS=RATE[/BURST]',
+                        help='Server-side rate limit; excess requests get 429 with Retry-After')
+    parser.add_argument('--throttle-rate', action='append', metavar='CLASS=FRACTION',
+                        help='Fraction of requests answered with 429 regardless of the rate limit')
+    parser.add_argument('--export-seconds', default='5', help='Export job duration, SECONDS[/P95]')
+    parser.add_argument('--refresh-seconds', default='5', help='Dataset refresh duration, SECONDS[/P95]')
+    parser.add_argument('--export-size', type=int, default=64 * 1024, help='Exported file size in bytes')
+    parser.add_argument('--export-failure-rate', type=float, default=0.0)
+    parser.add_argument('--refresh-failure-rate', type=float, default=0.0)
+    parser.add_argument('--no-auth', action='store_true', help='Accept requests without a token')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--quiet', action='store_true', help='Do not log every request')
+    args = parser.parse_args()
+
+    try:
+        options = {
+            'latency': _parse_assignments(args.latency, '--latency'),
+            'error_rate': _parse_assignments(args.error_rate, '--error-rate'),
+            'throttle': _parse_assignments(args.throttle, '--throttle'),
+            'throttle_rate': _parse_assignments(args.throttle_rate, '--throttle-rate'),
+        }
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+
+    server = ThreadingHTTPServer((args.host, args.port), SimulatorHandler)
+    server.daemon_threads = True
+    server.state = build_simulator(
+        seed=args.seed, require_auth=not args.no_auth, export_seconds=args.export_seconds,
+        refresh_seconds=args.refresh_seconds, export_size=args.export_size,
+        export_failure_rate=args.export_failure_rate, refresh_failure_rate=args.refresh_failure_rate,
+        **options
+    )
+    server.verbose = not args.quiet
+    base_url = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Simulator listening on {base_url}")
+    for key, value in engine_settings(base_url).items():
+        print(f"  engine.{key} = {value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
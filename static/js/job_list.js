@@ -0,0 +1,195 @@
+// Virtualized job list fed by the keyset-paginated job list API.
+//
+// Only the rows inside the visible window (plus a small overscan) are kept in
+// the DOM; further pages are fetched with next_cursor as the user scrolls.
+// Search and filters are applied server-side.
+//
+// Rows whose last execution is still running subscribe to its progress stream
+// (watchExecutionProgress in job_progress.js, which must be loaded first).
+// Only visible rows are subscribed and at most MAX_STREAMS at a time: browsers
+// allow about six connections per host over HTTP/1.1, and the page still needs
+// some for fetching job pages.
+//
+// Usage:
+//   initJobList({
+//       apiUrl: '/job_scheduler/api/jobs/',
+//       container: document.querySelector('.job-list-viewport'),
+//       pageSize: 100
+//   });
+function initJobList(options) {
+    const ROW_HEIGHT = 49;
+    const OVERSCAN = 10;
+    const MAX_STREAMS = 3;
+    const FIELDS = [
+        'job_id', 'job_name', 'program_id', 'program_name', 'enabled',
+        'trigger_frequence', 'trigger_hour', 'trigger_minute', 'last_status', 'events_url'
+    ];
+
+    const viewport = options.container;
+    const spacer = viewport.querySelector('.job-list-spacer');
+    const tbody = viewport.querySelector('tbody');
+    const table = viewport.querySelector('table');
+    const emptyMessage = viewport.querySelector('.job-list-empty');
+
+    let rows = [];
+    let nextCursor = null;
+    let loading = false;
+    let filters = {};
+    let generation = 0;
+    // events_url -> stop function of the open progress stream
+    const streams = new Map();
+
+    function buildUrl() {
+        const params = new URLSearchParams({ limit: options.pageSize, fields: FIELDS.join(',') });
+        Object.keys(filters).forEach(key => {
+            if (filters[key] !== '') {
+                params.set(key, filters[key]);
+            }
+        });
+        if (nextCursor) {
+            params.set('cursor', nextCursor);
+        }
+        return options.apiUrl + '?' + params.toString();
+    }
+
+    function loadPage() {
+        if (loading || (rows.length && !nextCursor)) {
+            return;
+        }
+        loading = true;
+        const requestGeneration = generation;
+        fetch(buildUrl())
+            .then(response => response.json())
+            .then(data => {
+                // Ignore responses for a search that has since been replaced
+                if (requestGeneration !== generation) {
+                    return;
+                }
+                rows = rows.concat(data.jobs || []);
+                nextCursor = data.next_cursor;
+                render();
+            })
+            .catch(error => console.error('Failed to load jobs:', error))
+            .finally(() => {
+                if (requestGeneration === generation) {
+                    loading = false;
+                }
+            });
+    }
+
+    function formatTime(job) {
+        const hour = String(job.trigger_hour).padStart(2, '0');
+        const minute = String(job.trigger_minute).padStart(2, '0');
+        return hour + ':' + minute;
+    }
+
+    function formatStatus(job) {
+        if (job.last_status === 'running' && job.percent !== undefined && job.percent !== null) {
+            return 'running ' + Math.round(job.percent) + '%';
+        }
+        return job.last_status;
+    }
+
+    function updateStreams(visibleRows) {
+        const wanted = new Set(
+            visibleRows.filter(job => job.events_url).slice(0, MAX_STREAMS).map(job => job.events_url)
+        );
+        streams.forEach((stop, url) => {
+            if (!wanted.has(url)) {
+                stop();
+                streams.delete(url);
+            }
+        });
+        visibleRows.forEach(job => {
+            if (!wanted.has(job.events_url) || streams.has(job.events_url)) {
+                return;
+            }
+            const url = job.events_url;
+            streams.set(url, watchExecutionProgress(url, {
+                onProgress: event => {
+                    job.percent = event.percent;
+                    render();
+                },
+                onDone: event => {
+                    // The final event carries the execution status
+                    streams.delete(url);
+                    job.last_status = event.message;
+                    job.events_url = null;
+                    render();
+                }
+            }));
+        });
+    }
+
+    function renderRow(job) {
+        const tr = document.createElement('tr');
+        tr.style.height = ROW_HEIGHT + 'px';
+        [
+            job.job_name,
+            job.program_id,
+            job.program_name,
+            job.trigger_frequence,
+            formatTime(job),
+            formatStatus(job)
+        ].forEach(value => {
+            const td = document.createElement('td');
+            td.textContent = value === null || value === undefined ? '-' : value;
+            tr.appendChild(td);
+        });
+
+        const actions = document.createElement('td');
+        actions.innerHTML =
+            '<button class="btn btn-sm btn-outline-primary">Edit</button> ' +
+            '<button class="btn btn-sm btn-outline-danger">Delete</button>';
+        tr.appendChild(actions);
+        return tr;
+    }
+
+    function render() {
+        spacer.style.height = (rows.length * ROW_HEIGHT) + 'px';
+        emptyMessage.style.display = rows.length || nextCursor ? 'none' : '';
+
+        const first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+        const visible = Math.ceil(viewport.clientHeight / ROW_HEIGHT) + OVERSCAN * 2;
+        const last = Math.min(rows.length, first + visible);
+
+        const fragment = document.createDocumentFragment();
+        for (let i = first; i < last; i++) {
+            fragment.appendChild(renderRow(rows[i]));
+        }
+        tbody.replaceChildren(fragment);
+        table.style.transform = 'translateY(' + (first * ROW_HEIGHT) + 'px)';
+        updateStreams(rows.slice(first, last));
+
+        // Fetch the next page before the user reaches the end of the loaded rows
+        if (nextCursor && last >= rows.length - OVERSCAN) {
+            loadPage();
+        }
+    }
+
+    function reload(newFilters) {
+        filters = newFilters;
+        generation += 1;
+        rows = [];
+        nextCursor = null;
+        loading = false;
+        streams.forEach(stop => stop());
+        streams.clear();
+        viewport.scrollTop = 0;
+        loadPage();
+    }
+
+    let scheduled = false;
+    viewport.addEventListener('scroll', function() {
+        if (!scheduled) {
+            scheduled = true;
+            requestAnimationFrame(function() {
+                scheduled = false;
+                render();
+            });
+        }
+    });
+
+    reload({});
+    return { reload: reload };
+}
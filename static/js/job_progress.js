@@ -0,0 +1,32 @@
+// Subscribe to execution progress pushed by the server (Server-Sent Events)
+// instead of polling the job status API. Used by job_list.js for running jobs.
+//
+// Usage:
+//   const stop = watchExecutionProgress(statusJson.events_url, {
+//       onProgress: event => { /* event.percent, event.message */ },
+//       onDone: event => { /* event.message is the final status */ }
+//   });
+function watchExecutionProgress(eventsUrl, handlers) {
+    const source = new EventSource(eventsUrl);
+    const onProgress = handlers.onProgress || function() {};
+    const onDone = handlers.onDone || function() {};
+
+    source.addEventListener('progress', function(e) {
+        onProgress(JSON.parse(e.data));
+    });
+
+    source.addEventListener('status', function(e) {
+        // Final event: close so the browser does not reconnect
+        source.close();
+        onDone(JSON.parse(e.data));
+    });
+
+    source.onerror = function() {
+        // The browser reconnects automatically and resumes from Last-Event-ID
+        console.warn('Progress stream interrupted, reconnecting...');
+    };
+
+    return function stop() {
+        source.close();
+    };
+}
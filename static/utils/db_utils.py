@@ -1,30 +1,260 @@
+"""
+資料庫鎖定 (SQLite "database is locked") 的重試
+
+contended_atomic() 取代整個 view 的 retry_on_db_lock：只重試交易區塊本身，不會重跑範本渲染。
+
+    for attempt in contended_atomic():
+        with attempt:
+            ...  # 與 with transaction.atomic(): 區塊相同
+
+- 鎖定時整個交易回滾，以 decorrelated jitter 退避後重跑區塊；初始延遲依該呼叫位置最近的鎖定程度調整
+- 同一個請求中所有區塊的等待共用 DB_CONTENTION['request_budget'] (ContentionBudgetMiddleware)，
+  請求之外 (背景執行緒、管理指令) 每個區塊各有 call_budget；用完時拋出原本的 OperationalError
+- 區塊中 SQLite 自己的等待 (busy_timeout) 縮短為 busy_timeout 秒，等待改由這裡控制並計入統計
+- 已在外層交易中時不重試 (只能由外層整個重跑)
+- 各呼叫位置的區塊數、重試、失敗與等待時間由 get_lock_retry_stats() 取得
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from collections import defaultdict
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
 from django.db.utils import OperationalError
-from django.db import connection
+import random
+import sqlite3
+import sys
+import threading
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-def retry_on_db_lock(func):
-    """資料庫操作重試裝飾器"""
-    def wrapper(*args, **kwargs):
-        max_retries = 3
-        retry_delay = 1  # 初始延遲1秒
-        
-        for attempt in range(max_retries):
-            try:
-                return func(*args, **kwargs)
-            except OperationalError as e:
-                if "database is locked" in str(e).lower():
-                    if attempt < max_retries - 1:
-                        wait_time = retry_delay * (2 ** attempt)  # 指數退避
-                        logger.warning(f"Database locked, retrying in {wait_time} seconds... (Attempt {attempt + 1}/{max_retries})")
-                        time.sleep(wait_time)
-                        # 重置資料庫連接
-                        connection.close()
-                    else:
-                        logger.error(f"Database locked after {max_retries} attempts")
-                        raise
-                else:
-                    raise
-    return wrapper 
\ No newline at end of file
+DB_CONTENTION_DEFAULTS = {
+    'request_budget': 5.0,  # 秒；同一個請求等待資料庫鎖的總時間上限
+    'call_budget': 30.0,    # 秒；請求之外每個區塊等待資料庫鎖的上限
+    'busy_timeout': 0.2,    # 秒；區塊中 SQLite 自行等待鎖的時間
+    'base_delay': 0.02,     # 秒；第一次重試前的延遲 (依最近的鎖定程度放大)
+    'max_delay': 1.0,       # 秒；單次重試前的延遲上限
+}
+
+# 最近的鎖定程度：每個區塊的重試次數的指數移動平均
+PRESSURE_DECAY = 0.8
+
+_request_deadline = ContextVar('db_contention_deadline', default=None)
+
+# 各呼叫位置的資料庫鎖定統計
+_lock_stats = defaultdict(lambda: {
+    'blocks': 0, 'retries': 0, 'failures': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'pressure': 0.0,
+})
+_lock_stats_lock = threading.Lock()
+
+
+def get_contention_config():
+    return dict(DB_CONTENTION_DEFAULTS, **getattr(settings, 'DB_CONTENTION', {}))
+
+
+def is_lock_error(error):
+    """SQLite 的 SQLITE_BUSY / SQLITE_LOCKED"""
+    if not isinstance(error, OperationalError):
+        return False
+    cause = error.__cause__
+    if isinstance(cause, sqlite3.OperationalError) and getattr(cause, 'sqlite_errorcode', None) is not None:
+        return cause.sqlite_errorcode & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'database is locked' in str(error).lower() or 'database table is locked' in str(error).lower()
+
+
+def record_lock_retry(name, event, wait=0.0):
+    """記錄一次資料庫鎖定事件；event 為 retry (稍後重試) 或 failure (放棄)，wait 為這次等待的秒數"""
+    with _lock_stats_lock:
+        stats = _lock_stats[name]
+        if event == 'retry':
+            stats['retries'] += 1
+        else:
+            stats['failures'] += 1
+        stats['wait_seconds'] += wait
+
+
+def _record_block(name, retries, waited, failed):
+    with _lock_stats_lock:
+        stats = _lock_stats[name]
+        stats['blocks'] += 1
+        stats['retries'] += retries
+        stats['failures'] += int(failed)
+        stats['wait_seconds'] += waited
+        stats['max_wait_seconds'] = max(stats['max_wait_seconds'], waited)
+        stats['pressure'] = stats['pressure'] * PRESSURE_DECAY + retries * (1 - PRESSURE_DECAY)
+
+
+def _pressure(name):
+    with _lock_stats_lock:
+        return _lock_stats[name]['pressure'] if name in _lock_stats else 0.0
+
+
+def get_lock_retry_stats():
+    """回傳 {呼叫位置: {'blocks', 'retries', 'failures', 'wait_seconds', 'max_wait_seconds', 'pressure'}}"""
+    with _lock_stats_lock:
+        return {
+            name: {key: round(value, 4) if isinstance(value, float) else value for key, value in stats.items()}
+            for name, stats in _lock_stats.items()
+        }
+
+
+def reset_lock_retry_stats():
+    with _lock_stats_lock:
+        _lock_stats.clear()
+
+
+class ContentionBudgetMiddleware:
+    """
+    為每個請求設定等待資料庫鎖的總時間上限
+    同時支援 async：ASGI 下的 async view (長輪詢) 不會因為這個 middleware 被放到執行緒中執行
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request_deadline.set(time.monotonic() + get_contention_config()['request_budget'])
+        try:
+            return self.get_response(request)
+        finally:
+            _request_deadline.reset(token)
+
+    async def __acall__(self, request):
+        token = _request_deadline.set(time.monotonic() + get_contention_config()['request_budget'])
+        try:
+            return await self.get_response(request)
+        finally:
+            _request_deadline.reset(token)
+
+
+class _Attempt:
+    """一次執行交易區塊；鎖定時回滾並在退避後讓外層迴圈重跑"""
+
+    def __init__(self, attempts):
+        self._attempts = attempts
+        self._atomic = None
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        self._atomic = transaction.atomic(using=self._attempts.using)
+        self._atomic.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self._atomic.__exit__(exc_type, exc, tb)
+        except OperationalError as e:
+            # 提交時仍可能遇到鎖定
+            if exc is not None or not self._attempts.retry(e, self._started):
+                raise
+            return False
+        if exc is None:
+            self._attempts.succeeded()
+            return False
+        return self._attempts.retry(exc, self._started)
+
+
+class _AtomicAttempts:
+
+    def __init__(self, name, using):
+        self.name = name
+        self.using = using or DEFAULT_DB_ALIAS
+        self.done = False
+        self.retries = 0
+        self.waited = 0.0
+        self.config = get_contention_config()
+        connection = connections[self.using]
+        # 外層已有交易時，鎖定只能由外層回滾後重跑
+        self.nested = connection.in_atomic_block
+        request_deadline = _request_deadline.get()
+        self.deadline = (
+            request_deadline if request_deadline is not None else time.monotonic() + self.config['call_budget']
+        )
+        self.delay = self.config['base_delay'] * (1 + _pressure(name))
+        self._busy_timeout = None
+        self._restored = True
+        self._sqlite = connection.vendor == 'sqlite' and not self.nested
+
+    def __iter__(self):
+        if self._sqlite:
+            # 區塊中改用較短的等待，讓退避與預算由這裡控制；結束後恢復連線原本的 busy_timeout
+            # (SQLITE_PROFILE 的 busy_timeout，未套用時為連線設定的 timeout，預設 5 秒)
+            connection = connections[self.using]
+            connection.ensure_connection()
+            self._busy_timeout = getattr(connection, 'sqlite_busy_timeout', None) or int(
+                connection.settings_dict.get('OPTIONS', {}).get('timeout', 5) * 1000
+            )
+        self._set_busy_timeout(self.config['busy_timeout'] * 1000)
+        self._restored = False
+        try:
+            while not self.done:
+                yield _Attempt(self)
+        finally:
+            self._finish()
+
+    def _finish(self):
+        """區塊結束 (成功或放棄) 時恢復連線原本的 busy_timeout"""
+        if not self._restored:
+            self._restored = True
+            self._set_busy_timeout(self._busy_timeout)
+
+    def _set_busy_timeout(self, milliseconds):
+        if self._busy_timeout is None:
+            return
+        try:
+            with connections[self.using].cursor() as cursor:
+                cursor.execute(f'PRAGMA busy_timeout = {int(milliseconds)}')
+        except OperationalError as e:
+            logger.warning(f"無法設定 SQLite busy_timeout: {str(e)}")
+
+    def succeeded(self):
+        self.done = True
+        self._finish()
+        _record_block(self.name, self.retries, self.waited, failed=False)
+
+    def retry(self, error, attempt_started):
+        """回傳 True 表示已退避、應重跑區塊；False 表示放棄並拋出原本的錯誤"""
+        if not is_lock_error(error):
+            self._finish()
+            _record_block(self.name, self.retries, self.waited, failed=False)
+            return False
+        now = time.monotonic()
+        # 區塊本身的執行時間不算等待：只計入 SQLite 在鎖上等待的時間 (最多 busy_timeout)
+        self.waited += min(now - attempt_started, self.config['busy_timeout'])
+        if self.nested or now >= self.deadline:
+            self._finish()
+            _record_block(self.name, self.retries, self.waited, failed=True)
+            logger.error(
+                f"資料庫鎖定，{self.name} 已重試 {self.retries} 次、等待 {self.waited:.2f} 秒"
+                + (" (外層交易中，不重試)" if self.nested else "")
+            )
+            return False
+
+        # decorrelated jitter：在 [base, 上次延遲 x 3] 之間隨機，避免多個請求同時重試
+        self.delay = min(self.config['max_delay'], random.uniform(self.config['base_delay'], self.delay * 3))
+        delay = min(self.delay, max(0.0, self.deadline - now))
+        self.retries += 1
+        logger.warning(f"資料庫鎖定，{self.name} 於 {delay * 1000:.0f} 毫秒後重試 (第 {self.retries} 次)")
+        time.sleep(delay)
+        self.waited += delay
+        return True
+
+
+def contended_atomic(name=None, using=None):
+    """
+    可重試的交易區塊；name 預設為呼叫端的 模組.函式
+    回傳可迭代的物件，每次迭代產生一個以 with 使用的 transaction.atomic()
+    """
+    if name is None:
+        frame = sys._getframe(1)
+        # co_qualname 需要 Python 3.11
+        name = f"{frame.f_globals.get('__name__')}.{getattr(frame.f_code, 'co_qualname', frame.f_code.co_name)}"
+    return _AtomicAttempts(name, using)
@@ -0,0 +1,195 @@
+"""
+SQLite 連線設定 (pragma profile) 與定期維護
+
+apply_sqlite_profile() 接在 connection_created 信號上 (core/apps.py)，每個新連線套用 settings.SQLITE_PROFILE
+中屬於連線的設定：
+- synchronous=NORMAL：WAL 下只在 checkpoint 時 fsync；斷電可能遺失最後幾筆已提交的交易，但資料庫不會損毀
+- mmap_size / cache_size / temp_store：減少讀取的系統呼叫與暫存檔
+- busy_timeout：其他連線持有寫入鎖時 SQLite 等待的時間 (contended_atomic 在交易區塊中會暫時縮短)
+
+journal_mode=WAL (寫入不再阻擋讀取，寫入之間仍互斥) 會寫入資料庫檔，不在每個連線切換：
+由 apply_journal_mode() 在排程 daemon 與 web 行程啟動時 (wsgi.py / asgi.py) 以及 sqlite_maintenance 指令中設定，
+manage.py check、makemigrations 等管理指令不會改動資料庫檔。
+
+SQLITE_PROFILE 設為 None 時不套用 (維持 rollback journal 與 Python sqlite3 的預設值)。
+
+run_sqlite_maintenance() 由排程 daemon 定期執行 (也可用 python manage.py sqlite_maintenance)：
+ANALYZE (PRAGMA optimize)、incremental vacuum 與 WAL checkpoint。
+"""
+from django.conf import settings
+from django.db import connections
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PROFILE_DEFAULTS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 30000,          # 毫秒
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,           # 負數為 KiB (約 64MB)
+    'temp_store': 'memory',
+    'wal_autocheckpoint': 1000,     # 頁；WAL 超過此大小時提交的連線自動 checkpoint
+    'journal_size_limit': 64 * 1024 * 1024,
+}
+
+SQLITE_MAINTENANCE_DEFAULTS = {
+    'checkpoint_mode': 'truncate',  # passive 不等待讀取；truncate 等待讀取結束後清空 WAL 檔
+    'vacuum_min_free_pages': 1000,  # 可回收的頁數超過此值才執行 incremental vacuum
+    'vacuum_max_pages': 5000,       # 每次最多回收的頁數，避免長時間持有寫入鎖
+}
+
+# 這些 pragma 需要以字串值設定；其他為整數
+_KEYWORD_PRAGMAS = {'journal_mode', 'synchronous', 'temp_store'}
+# 存在資料庫檔中的設定，由 apply_journal_mode() 處理
+_PERSISTENT_PRAGMAS = {'journal_mode'}
+
+
+def get_sqlite_profile():
+    profile = getattr(settings, 'SQLITE_PROFILE', SQLITE_PROFILE_DEFAULTS)
+    if profile is None:
+        return None
+    return dict(SQLITE_PROFILE_DEFAULTS, **profile)
+
+
+def get_maintenance_config():
+    return dict(SQLITE_MAINTENANCE_DEFAULTS, **getattr(settings, 'SQLITE_MAINTENANCE', {}))
+
+
+def _is_memory_database(connection):
+    name = str(connection.settings_dict.get('NAME') or '')
+    return name in ('', ':memory:') or 'mode=memory' in name
+
+
+def _pragma_value(name, value):
+    if name in _KEYWORD_PRAGMAS:
+        value = str(value).upper()
+        if not value.isalpha():
+            raise ValueError(f"Invalid value for PRAGMA {name}: {value}")
+        return value
+    return str(int(value))
+
+
+def apply_sqlite_profile(sender, connection, **kwargs):
+    """connection_created 的接收者：對新的 SQLite 連線套用 SQLITE_PROFILE"""
+    if connection.vendor != 'sqlite':
+        return
+    profile = get_sqlite_profile()
+    if profile is None:
+        return
+
+    memory = _is_memory_database(connection)
+    with connection.cursor() as cursor:
+        for name, value in profile.items():
+            if value is None or name in _PERSISTENT_PRAGMAS or (memory and name == 'mmap_size'):
+                continue
+            try:
+                cursor.execute(f'PRAGMA {name} = {_pragma_value(name, value)}')
+            except Exception as e:
+                logger.warning(f"無法設定 SQLite PRAGMA {name} = {value}: {str(e)}")
+    connection.sqlite_busy_timeout = profile.get('busy_timeout')
+
+
+def apply_journal_mode(using='default', close=False):
+    """
+    將資料庫切換為 SQLITE_PROFILE['journal_mode'] (寫入資料庫檔，之後所有連線都會使用)
+    在排程 daemon / web 行程啟動時與 sqlite_maintenance 指令中呼叫；回傳目前的 journal_mode
+    close 為 True 時結束後關閉連線 (例如 gunicorn --preload 在 fork 前呼叫)
+    """
+    connection = connections[using]
+    profile = get_sqlite_profile()
+    if connection.vendor != 'sqlite' or _is_memory_database(connection):
+        return None
+    try:
+        with connection.cursor() as cursor:
+            current = _pragma(cursor, 'PRAGMA journal_mode')
+            target = profile and profile.get('journal_mode')
+            if target and str(current).upper() != str(target).upper():
+                try:
+                    current = _pragma(cursor, f"PRAGMA journal_mode = {_pragma_value('journal_mode', target)}")
+                    logger.info(f"SQLite journal_mode 已切換為 {current}")
+                except Exception as e:
+                    # 例如其他連線正在使用時無法切換；下次啟動或維護時會再嘗試
+                    logger.warning(f"無法設定 SQLite journal_mode = {target}: {str(e)}")
+            return str(current).lower()
+    finally:
+        if close:
+            connection.close()
+
+
+def _pragma(cursor, statement):
+    cursor.execute(statement)
+    row = cursor.fetchone()
+    return row[0] if row and len(row) == 1 else row
+
+
+def database_files_bytes(connection):
+    """資料庫檔與 WAL 檔的大小"""
+    name = str(connection.settings_dict['NAME'])
+    return {
+        suffix or 'db': os.path.getsize(name + suffix) if os.path.exists(name + suffix) else 0
+        for suffix in ('', '-wal')
+    }
+
+
+def run_sqlite_maintenance(using='default', analyze=True, vacuum=True, checkpoint=True):
+    """
+    ANALYZE (PRAGMA optimize：只分析統計過期的資料表)、incremental vacuum 與 WAL checkpoint
+    在自動提交模式下執行，不包在交易中；回傳各步驟的結果與耗時
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or _is_memory_database(connection):
+        return {}
+    config = get_maintenance_config()
+    connection.ensure_connection()
+    result = {'before': database_files_bytes(connection)}
+
+    with connection.cursor() as cursor:
+        if analyze:
+            started = time.monotonic()
+            _pragma(cursor, 'PRAGMA optimize')
+            result['analyze_seconds'] = round(time.monotonic() - started, 3)
+
+        if vacuum:
+            auto_vacuum = _pragma(cursor, 'PRAGMA auto_vacuum')
+            free_pages = _pragma(cursor, 'PRAGMA freelist_count')
+            result['free_pages'] = free_pages
+            if auto_vacuum != 2:
+                # 既有的資料庫要先以 sqlite_maintenance --enable-incremental-vacuum 轉換 (需要完整 VACUUM)
+                result['vacuum'] = 'auto_vacuum is not INCREMENTAL'
+            elif free_pages >= config['vacuum_min_free_pages']:
+                started = time.monotonic()
+                cursor.execute(f"PRAGMA incremental_vacuum({int(config['vacuum_max_pages'])})")
+                cursor.fetchall()
+                result['vacuum'] = {
+                    'reclaimed_pages': free_pages - _pragma(cursor, 'PRAGMA freelist_count'),
+                    'seconds': round(time.monotonic() - started, 3),
+                }
+
+        if checkpoint and str(_pragma(cursor, 'PRAGMA journal_mode')).lower() == 'wal':
+            mode = str(config['checkpoint_mode']).upper()
+            if mode not in ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'):
+                raise ValueError(f"Invalid checkpoint mode: {mode}")
+            started = time.monotonic()
+            busy, log_pages, checkpointed = _pragma(cursor, f'PRAGMA wal_checkpoint({mode})')
+            result['checkpoint'] = {
+                'mode': mode.lower(), 'busy': bool(busy), 'wal_pages': log_pages,
+                'checkpointed_pages': checkpointed, 'seconds': round(time.monotonic() - started, 3),
+            }
+
+    result['after'] = database_files_bytes(connection)
+    logger.info(f"SQLite maintenance: {result}")
+    return result
+
+
+def enable_incremental_vacuum(using='default'):
+    """將 auto_vacuum 改為 INCREMENTAL；既有的資料庫需要完整 VACUUM (期間持有寫入鎖)"""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if _pragma(cursor, 'PRAGMA auto_vacuum') == 2:
+            return False
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+    return True